@@ -1,8 +1,15 @@
 from flask import Flask
-from auth import auth_bp, db
+from werkzeug.middleware.proxy_fix import ProxyFix
+from auth import (auth_bp, db, init_audit_sink, init_login_rate_limiter,
+                  init_password_hasher, init_replicas, init_sessions, init_shards, init_user_agent_cache,
+                  init_user_cache, init_user_filter)
 from config import config
 import os
 from main import main_bp
+from instrumentation import init_query_instrumentation
+from metrics import init_metrics
+from pagecache import init_page_cache
+from pool import configure_engine_options, init_pool
 
 def create_app(config_name=None):
     app = Flask(__name__)
@@ -11,13 +18,58 @@ def create_app(config_name=None):
     config_name = config_name or os.environ.get('FLASK_ENV', 'development')
     app.config.from_object(config[config_name])
     
+    # 部署在反向代理之后时，按可信代理层数从 X-Forwarded-For 取客户端 IP
+    if app.config.get('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
     # 初始化数据库
+    configure_engine_options(app)
     db.init_app(app)
     
+    # 连接池检测策略、慢取连接日志与预热
+    init_pool(app)
+    
+    # 读副本路由（配置了 DB_REPLICA_URIS 时启用）
+    init_replicas(app)
+    
+    # 水平分片路由（配置了 SHARD_URIS 时启用）
+    init_shards(app)
+    
+    # 密码哈希执行器
+    init_password_hasher(app)
+    
+    # 用户查询缓存
+    init_user_cache(app)
+    
+    # 账号存在性过滤器（启动时流式构建）
+    init_user_filter(app)
+    
+    # 审计日志 User-Agent 字典 id 缓存
+    init_user_agent_cache(app)
+    
+    # 异步审计日志写入（按配置启用）
+    init_audit_sink(app)
+    
+    # 服务端会话（SESSION_BACKEND 不为 cookie 时启用）
+    init_sessions(app)
+    
+    # 登录限流（按账号与 IP 的滑动窗口）
+    init_login_rate_limiter(app)
+    
+    
+    # 每请求数据库查询统计（按配置启用）
+    init_query_instrumentation(app)
+    
+    # 监控指标（/metrics）
+    init_metrics(app)
+    
     # 注册蓝图
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     
+    # 匿名访问的首页/登录/注册页响应缓存（包装已注册的视图）
+    init_page_cache(app)
+    
     return app
 
 if __name__ == '__main__':
@@ -3,7 +3,36 @@
 包含用户认证相关的模型、视图和服务
 """
 
-from .models import db, User, UserInfo, AuditLog, UserService
+from .models import (db, User, UserInfo, AuditLog, UserAgent, UserLoginStats, UserService, UserProfile,
+                     UserAlreadyExistsError, AccountLockedError)
+from .cache import UserCache, UserSnapshot, init_user_cache
+from .bloom import BloomFilter, UserExistenceFilter, init_user_filter
+from .hashing import HashingBusyError, init_password_hasher
+from .ratelimit import LoginRateLimiter, init_login_rate_limiter
+from .replicas import ReplicaRouter, init_replicas
+from .sharding import ShardRouter, init_shards
+from .useragents import UserAgentCache, init_user_agent_cache
+from .sessions import (MemorySessionStore, SQLiteSessionStore, SessionStore, cached_user_snapshot, init_sessions,
+                       revoke_user_sessions)
+from .audit import AuditSink, init_audit_sink
+from .search import search_users
+from .async_service import AsyncUserService
 from .viewer import auth_bp
 
-__all__ = ['db', 'User', 'UserInfo', 'AuditLog', 'UserService', 'auth_bp']
\ No newline at end of file
+__all__ = [
+    'db', 'User', 'UserInfo', 'AuditLog', 'UserAgent', 'UserLoginStats', 'UserService', 'UserProfile',
+    'UserAlreadyExistsError', 'AccountLockedError',
+    'UserCache', 'UserSnapshot', 'init_user_cache',
+    'BloomFilter', 'UserExistenceFilter', 'init_user_filter',
+    'HashingBusyError', 'init_password_hasher',
+    'LoginRateLimiter', 'init_login_rate_limiter',
+    'ReplicaRouter', 'init_replicas',
+    'ShardRouter', 'init_shards',
+    'UserAgentCache', 'init_user_agent_cache',
+    'SessionStore', 'MemorySessionStore', 'SQLiteSessionStore', 'init_sessions', 'cached_user_snapshot',
+    'revoke_user_sessions',
+    'AuditSink', 'init_audit_sink',
+    'search_users',
+    'AsyncUserService',
+    'auth_bp',
+]
@@ -0,0 +1,229 @@
+"""
+异步用户服务
+基于 SQLAlchemy asyncio 扩展（MariaDB 使用 aiomysql，测试使用 aiosqlite），
+等待数据库与密码哈希时不占用线程。服务不依赖 Flask，供运行在单个事件循环中的程序
+（ASGI 服务、批处理脚本等）直接使用，引擎带连接池，只能在创建它的事件循环中使用：
+
+    service = AsyncUserService.from_url('sqlite+aiosqlite:///test.db')
+    user = await service.authenticate('admin@example.com', 'password123')
+
+Flask 应用（WSGI）不提供异步接口：Flask 的 async 视图在每个请求的新事件循环中运行，
+既不能复用连接也不能提高并发，登录接口使用同步的 UserService。
+"""
+
+import asyncio
+from datetime import datetime
+
+from flask import has_app_context
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .cache import UserSnapshot
+from .models import (GENERATED_INFO_COLUMNS, AccountLockedError, AuditLog, User, UserAgent, UserAlreadyExistsError,
+                     UserInfo, UserLoginStats, invalidate_user, is_duplicate_user_id)
+from .sessions import get_session_store
+from .useragents import ip_to_bytes, user_agent_id
+
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    'mysql': 'aiomysql',
+    'sqlite': 'aiosqlite',
+}
+
+
+def async_database_url(url):
+    """将同步连接串转换为对应的异步驱动连接串"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'没有可用的异步驱动: {backend}')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+class AsyncUserService:
+    """UserService 的异步版本（返回的 ORM 对象已与会话分离）"""
+
+    def __init__(self, engine, hasher=None, cache=None, audit_sink=None, user_filter=None, ua_cache=None,
+                 stats_window=3600, lockout_threshold=0, lockout_seconds=900):
+        self.engine = engine
+        self.sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+        self.hasher = hasher
+        self.cache = cache
+        self.audit_sink = audit_sink
+        self.user_filter = user_filter
+        self.ua_cache = ua_cache
+        self.stats_window = stats_window
+        self.lockout_threshold = lockout_threshold
+        self.lockout_seconds = lockout_seconds
+
+    @classmethod
+    def from_url(cls, url, engine_options=None, **kwargs):
+        """由连接串创建服务（同步驱动连接串会自动换成异步驱动）"""
+        engine = create_async_engine(async_database_url(url), **(engine_options or {}))
+        return cls(engine, **kwargs)
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+    async def _hash(self, password):
+        if self.hasher is not None:
+            return await self.hasher.generate_async(password)
+        return await asyncio.get_running_loop().run_in_executor(None, generate_password_hash, password)
+
+    async def _verify(self, pwhash, password):
+        if self.hasher is not None:
+            return await self.hasher.verify_async(pwhash, password)
+        return await asyncio.get_running_loop().run_in_executor(None, check_password_hash, pwhash, password)
+
+    async def _log_action(self, session, user_id, action, ip=None, ua=None, deferred=None):
+        """记录审计日志：有异步写入器时交给后台批量写入，否则加入当前会话"""
+        if self.audit_sink is not None and deferred is not False:
+            accepted = self.audit_sink.submit({
+                'actor_user_id': user_id,
+                'action': action,
+                'target': None,
+                'ip': ip,
+                'ua': ua,
+                'context': None,
+            })
+            if accepted:
+                return None
+        ua_id = await session.run_sync(user_agent_id, UserAgent.__table__, ua, self.ua_cache) if ua else None
+        log = AuditLog(actor_user_id=user_id, action=action, ip_bin=ip_to_bytes(ip), ua_id=ua_id)
+        session.add(log)
+        return log
+
+    async def log_action(self, user_id, action, ip=None, ua=None):
+        """单独记录一条审计日志"""
+        async with self.sessionmaker() as session:
+            if await self._log_action(session, user_id, action, ip=ip, ua=ua) is not None:
+                await session.commit()
+
+    def _user_changed(self, user):
+        if has_app_context():
+            # 在 Flask 中与同步服务一致：同时清空会话中的详情快照、写入后读主库
+            invalidate_user(user.user_id, user.id)
+            return
+        if self.cache is not None:
+            self.cache.invalidate(user_id=user.user_id, id=user.id)
+        if self.user_filter is not None:
+            self.user_filter.add(user.user_id)
+
+    async def _might_exist(self, user_id):
+        """账号过滤器判定一定不存在时返回 False；需要读取表尾时在线程中进行，不阻塞事件循环"""
+        if self.user_filter is None or self.user_filter.probably_contains(user_id):
+            return True
+        if not self.user_filter.tail_due:
+            return False
+        return await asyncio.to_thread(self.user_filter.might_exist, user_id)
+
+    async def find_by_user_id(self, user_id):
+        """根据登录账号查找用户（同时加载详细信息）"""
+        if not await self._might_exist(user_id):
+            return None
+        async with self.sessionmaker() as session:
+            result = await session.execute(
+                select(User).options(selectinload(User.user_info)).where(User.user_id == user_id)
+            )
+            return result.scalar_one_or_none()
+
+    async def lookup_by_user_id(self, user_id, use_cache=True):
+        """根据登录账号查找用户快照（读穿缓存；use_cache 为 False 时直接读库并刷新缓存）"""
+        if not await self._might_exist(user_id):
+            return None
+        generation = None
+        if self.cache is not None:
+            if use_cache:
+                found, snapshot = self.cache.get_by_user_id(user_id)
+                if found:
+                    return snapshot
+            generation = self.cache.generation
+
+        async with self.sessionmaker() as session:
+            user = (await session.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
+            snapshot = UserSnapshot.from_user(user) if user else None
+
+        if self.cache is not None:
+            if snapshot is None:
+                self.cache.put_missing(generation, user_id=user_id)
+            else:
+                self.cache.put(snapshot, generation)
+        return snapshot
+
+    async def create_user(self, user_id, password, login_type='email', user_type='passenger', info=None,
+                          ip=None, ua=None, **kwargs):
+        """创建用户（用户、详细信息与创建日志在同一事务中一次提交），账号重复时抛出 UserAlreadyExistsError"""
+        password_hash = await self._hash(password)
+        try:
+            async with self.sessionmaker() as session:
+                async with session.begin():
+                    user = User(
+                        user_id=user_id,
+                        login_type=login_type,
+                        user_type=user_type,
+                        password_hash=password_hash,
+                        pwd_changed_at=datetime.utcnow(),
+                        **kwargs
+                    )
+                    user.user_info = UserInfo(**(info or {}))
+                    session.add(user)
+                    await session.flush()
+                    await self._log_action(session, user.id, 'user_created', ip=ip, ua=ua, deferred=False)
+        except IntegrityError as e:
+            if not is_duplicate_user_id(e):
+                raise
+            raise UserAlreadyExistsError(user_id) from e
+        self._user_changed(user)
+        return user
+
+    async def authenticate(self, user_id, password, ip=None, ua=None):
+        """
+        用户认证，成功返回用户快照（UserSnapshot）；账号锁定时抛出 AccountLockedError
+        缓存只在本进程内失效，密码哈希与账号状态直接读库。
+        """
+        user = await self.lookup_by_user_id(user_id, use_cache=False)
+        if user is None:
+            return None
+
+        async with self.sessionmaker() as session:
+            if self.lockout_threshold:
+                stats = await session.get(UserLoginStats, user.id)
+                retry_after = stats.lockout_remaining(self.lockout_threshold, self.lockout_seconds,
+                                                      self.stats_window) if stats else 0
+                if retry_after:
+                    raise AccountLockedError(retry_after)
+
+            ok = await self._verify(user.password_hash, password) and user.is_active()
+            await session.execute(UserLoginStats.record_statement(
+                self.engine.dialect.name, user.id, ok, ip=ip, window=self.stats_window))
+            action = 'login_success' if ok else 'login_failed'
+            await self._log_action(session, user.id, action, ip=ip, ua=ua)
+            await session.commit()
+        if has_app_context():
+            # 详情快照包含登录统计，与同步服务一致在登录后清空
+            store = get_session_store()
+            if store is not None:
+                store.clear_snapshots(user.user_id)
+        return user if ok else None
+
+    async def update_user_info(self, user_id, **kwargs):
+        """更新用户信息"""
+        async with self.sessionmaker() as session:
+            async with session.begin():
+                user = (await session.execute(
+                    select(User).options(selectinload(User.user_info)).where(User.user_id == user_id)
+                )).scalar_one_or_none()
+                if user is None:
+                    return None
+                if user.user_info is None:
+                    user.user_info = UserInfo(id=user.id)
+                for key, value in kwargs.items():
+                    if hasattr(user.user_info, key) and key not in GENERATED_INFO_COLUMNS:
+                        setattr(user.user_info, key, value)
+        self._user_changed(user)
+        return user
+
@@ -0,0 +1,370 @@
+"""
+审计日志
+- 异步写入：将审计日志交给进程内有界队列，由后台线程按批量（多行 INSERT）写入数据库，
+  使登录等请求不再等待 audit_logs 的插入与提交。
+- 查询：按 (created_at, id) 键集分页，配合复合索引避免 OFFSET 与全表排序。
+- IP 与 User-Agent 以字典编码存储（见 useragents），旧版字符串列可由 backfill_audit_log_encoding 分批转换。
+- 启用分片时审计日志与用户在同一分片：批量写入按 actor_user_id 分组写入各分片，跨用户查询在各分片分别查询后合并。
+"""
+
+import atexit
+import base64
+import heapq
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, bindparam, column, inspect, or_, select, table
+
+from .models import db, AuditLog, UserAgent
+from .replicas import run_read
+from .sharding import route_to_id, scatter_read, shard_engine, shard_names
+from .useragents import encode_audit_rows, get_user_agent_cache, ip_to_bytes
+
+logger = logging.getLogger(__name__)
+
+# 队列满时的处理策略
+OVERFLOW_POLICIES = (
+    'drop_new',     # 丢弃新日志
+    'drop_oldest',  # 丢弃队列中最旧的日志
+    'block',        # 短暂阻塞等待，超时后丢弃
+    'sync',         # 回退为在请求事务中同步写入
+)
+
+
+class AuditSink:
+    """审计日志异步写入器"""
+
+    def __init__(self, engine, table, queue_size=10000, batch_size=500,
+                 flush_interval=1.0, overflow_policy='sync', block_timeout=0.05,
+                 ua_table=None, ua_cache=None, shard_router=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'未知的溢出策略: {overflow_policy}')
+        self.engine = engine
+        self.table = table
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.overflow_policy = overflow_policy
+        self.block_timeout = float(block_timeout)
+        self.ua_table = ua_table
+        self.ua_cache = ua_cache
+        self.shard_router = shard_router
+
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._stop = threading.Event()
+        self._thread = None
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'queued': 0,         # 成功入队
+            'written': 0,        # 已写入数据库
+            'dropped': 0,        # 因队列已满被丢弃
+            'rejected': 0,       # 队列已满，交由调用方同步写入
+            'failed': 0,         # 写入数据库失败
+            'batches': 0,        # 已执行的批量写入次数
+        }
+
+    def _incr(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+        self._thread.start()
+
+    def after_fork(self):
+        """fork 出的子进程中调用：丢弃父进程的队列与计数，重新启动写入线程"""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(self._stats, 0)
+        self._thread = None
+        self.start()
+
+    def submit(self, entry):
+        """
+        提交一条审计日志（字典，键与 audit_logs 列一致，ip/ua 为字符串，写入时再编码）。
+        返回 True 表示已入队（或按策略丢弃）；返回 False 表示需要调用方同步写入。
+        """
+        entry.setdefault('created_at', datetime.utcnow())
+        try:
+            self._queue.put_nowait(entry)
+            self._incr('queued')
+            return True
+        except queue.Full:
+            pass
+
+        if self.overflow_policy == 'sync':
+            self._incr('rejected')
+            return False
+
+        if self.overflow_policy == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                self._incr('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(entry)
+                self._incr('queued')
+                return True
+            except queue.Full:
+                pass
+        elif self.overflow_policy == 'block':
+            try:
+                self._queue.put(entry, timeout=self.block_timeout)
+                self._incr('queued')
+                return True
+            except queue.Full:
+                pass
+
+        self._incr('dropped')
+        return True
+
+    def _drain(self, limit):
+        """从队列中取出至多 limit 条日志（不阻塞）"""
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _targets(self, rows):
+        """按写入目标分组，返回 [(引擎, UA 缓存, 日志行), ...]"""
+        router = self.shard_router
+        if router is None:
+            return [(self.engine, self.ua_cache, rows)]
+        groups = {}
+        for row in rows:
+            # 不关联用户的日志写入第一个分片（默认数据库）
+            actor = row['actor_user_id']
+            name = router.shard_of_id(actor) if actor is not None else router.names[0]
+            groups.setdefault(name, []).append(row)
+        return [(router.engines[name], router.ua_caches.get(name), group) for name, group in groups.items()]
+
+    def _write(self, rows):
+        """以一次多行 INSERT 写入一批日志（启用分片时每个分片一次）"""
+        if not rows:
+            return
+        with self._write_lock:
+            for engine, ua_cache, group in self._targets(rows):
+                try:
+                    with engine.begin() as conn:
+                        # 同一批日志中的 UA 只解析一次，缓存未命中的一次查询/插入字典表
+                        group, learned = encode_audit_rows(conn, self.ua_table, group, ua_cache)
+                        conn.execute(self.table.insert(), group)
+                    if learned and ua_cache is not None:
+                        ua_cache.update(learned)
+                    self._incr('written', len(group))
+                    self._incr('batches')
+                except Exception:
+                    self._incr('failed', len(group))
+                    logger.exception('审计日志批量写入失败，丢弃 %d 条', len(group))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            # 按数量或时间窗口凑批
+            rows = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(rows)
+
+        # 退出前写完剩余日志
+        self.flush()
+
+    def flush(self):
+        """在当前线程中同步写完队列中的全部日志"""
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                break
+            self._write(rows)
+
+    def close(self, timeout=5.0):
+        """停止后台线程并写完剩余日志（进程退出时调用）"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """返回计数器快照"""
+        with self._stats_lock:
+            data = dict(self._stats)
+        data['pending'] = self._queue.qsize()
+        return data
+
+
+def init_audit_sink(app):
+    """根据配置为应用启用异步审计日志写入"""
+    if app.config.get('AUDIT_SINK_MODE', 'sync') != 'async':
+        return None
+
+    with app.app_context():
+        engine = db.engine
+
+    sink = AuditSink(
+        engine,
+        AuditLog.__table__,
+        queue_size=app.config.get('AUDIT_QUEUE_SIZE', 10000),
+        batch_size=app.config.get('AUDIT_BATCH_SIZE', 500),
+        flush_interval=app.config.get('AUDIT_FLUSH_INTERVAL', 1.0),
+        overflow_policy=app.config.get('AUDIT_OVERFLOW_POLICY', 'sync'),
+        ua_table=UserAgent.__table__,
+        ua_cache=app.extensions.get('user_agent_cache'),
+        shard_router=app.extensions.get('shard_router'),
+    )
+    sink.start()
+    app.extensions['audit_sink'] = sink
+    atexit.register(sink.close)
+    return sink
+
+
+def get_audit_sink():
+    """返回当前应用的异步写入器，未启用时返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('audit_sink')
+
+
+# 单页最多返回的条数
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at, id):
+    """将 (created_at, id) 编码为分页游标"""
+    raw = f'{created_at.isoformat()}|{id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+
+def query_audit_logs(actor_user_id=None, action=None, ip=None, since=None, until=None,
+                     cursor=None, limit=50):
+    """
+    按时间倒序分页查询审计日志（键集分页）。
+    返回 (日志列表, 下一页游标)；没有更多数据时游标为 None。
+    启用分片时：指定用户只查询其所在分片，否则各分片各取一页后按 (created_at, id) 合并。
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    stmt = select(AuditLog).order_by(AuditLog.created_at.desc(), AuditLog.id.desc())
+
+    if actor_user_id is not None:
+        stmt = stmt.where(AuditLog.actor_user_id == actor_user_id)
+    if action:
+        stmt = stmt.where(AuditLog.action == action)
+    if ip:
+        ip_bin = ip_to_bytes(ip)
+        if ip_bin is None:
+            raise ValueError(f'无效的 IP 地址: {ip}')
+        stmt = stmt.where(AuditLog.ip_bin == ip_bin)
+    if since:
+        stmt = stmt.where(AuditLog.created_at >= since)
+    if until:
+        stmt = stmt.where(AuditLog.created_at < until)
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            AuditLog.created_at < created_at,
+            and_(AuditLog.created_at == created_at, AuditLog.id < id),
+        ))
+
+    # 多取一条判断是否还有下一页
+    def query(session):
+        return session.execute(stmt.limit(limit + 1)).scalars().all()
+
+    if actor_user_id is not None and route_to_id(actor_user_id) is not None:
+        logs = query(db.session)
+    else:
+        pages = scatter_read(query)
+        logs = pages[0] if len(pages) == 1 else list(heapq.merge(
+            *pages, key=lambda log: (log.created_at, log.id), reverse=True))[:limit + 1]
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1].created_at, logs[-1].id)
+    return logs, next_cursor
+
+
+def backfill_audit_log_encoding(batch_size=5000, progress=None):
+    """
+    将旧版 audit_logs 的 ip/ua 字符串列分批转换为 ip_bin/ua_id（按 id 键集推进，每批单独提交，可中断后重复执行）。
+    返回转换的行数；旧列已删除时返回 0。progress(已转换行数, 当前 id) 用于输出进度。
+    """
+    total = 0
+    for shard in shard_names():
+        total = _backfill_shard(shard, batch_size, total, progress)
+    return total
+
+
+def _backfill_shard(shard, batch_size, total, progress):
+    engine = shard_engine(shard)
+    names = {c['name'] for c in inspect(engine).get_columns('audit_logs')}
+    if not {'ip', 'ua'} <= names:
+        return total
+
+    # 旧列已不在模型中，用轻量表对象访问
+    legacy = table('audit_logs', column('id'), column('created_at'), column('ip'), column('ua'),
+                   column('ip_bin'), column('ua_id'))
+    update_stmt = (
+        legacy.update()
+        # 带上分区列，分区表只需定位一个分区
+        .where(legacy.c.id == bindparam('_id'), legacy.c.created_at == bindparam('_created_at'))
+        .values(ip_bin=bindparam('ip_bin'), ua_id=bindparam('ua_id'))
+    )
+    cache = get_user_agent_cache(shard)
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(legacy.c.id, legacy.c.created_at, legacy.c.ip, legacy.c.ua)
+                .where(legacy.c.id > last_id, legacy.c.ip_bin.is_(None), legacy.c.ua_id.is_(None),
+                       or_(legacy.c.ip.isnot(None), legacy.c.ua.isnot(None)))
+                .order_by(legacy.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            encoded, learned = encode_audit_rows(
+                conn, UserAgent.__table__, [{'ip': row.ip, 'ua': row.ua} for row in rows], cache)
+            conn.execute(update_stmt, [
+                dict(values, _id=row.id, _created_at=row.created_at)
+                for row, values in zip(rows, encoded)
+            ])
+        if learned and cache is not None:
+            cache.update(learned)
+        last_id = rows[-1].id
+        total += len(rows)
+        if progress is not None:
+            progress(total, last_id)
+    return total
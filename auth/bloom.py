@@ -0,0 +1,312 @@
+"""
+账号存在性过滤器
+内存中的布隆过滤器保存全部 users.user_id，“一定不存在”的账号无需按账号查询数据库即可拒绝：
+- 首次查询时流式读取 users 表构建（此时表结构已创建；默认在后台线程中进行，
+  构建完成前所有查询照常走数据库）；
+- 本进程创建的账号在提交后立即加入；其他进程/批量导入新增的账号在过滤器判定“不存在”时，
+  通过按 id 增量读取主库表尾补齐，两次读取间隔不小于 tail_interval 秒，间隔内的否定结果直接采信
+  （即其他进程新建的账号最多 tail_interval 秒后可登录）；表尾回读 tail_overlap 个 id，
+  覆盖并发事务中较小 id 晚于较大 id 提交的情况；
+- 定期整体重建，以清除已删除账号并按当前用户数重新估算大小；
+- 启用分片时依次读取各分片，表尾位置按分片分别记录；
+- 位数组大小按容量与目标误判率计算，并受内存预算限制。
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import current_app, has_app_context
+from sqlalchemy import func, inspect, select
+
+from .database import db
+from .sharding import shard_names, shard_session
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """布隆过滤器（双重哈希）"""
+
+    def __init__(self, num_bits, num_hashes):
+        self.num_bits = max(8, int(num_bits))
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01, max_bytes=None):
+        """按容量与误判率计算位数与哈希次数，位数组超出 max_bytes 时截断（误判率随之上升）"""
+        capacity = max(1, int(capacity))
+        num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        if max_bytes and num_bits > max_bytes * 8:
+            logger.warning('布隆过滤器受内存预算限制：需要 %.1fMB，预算 %.1fMB',
+                           num_bits / 8 / 2 ** 20, max_bytes / 2 ** 20)
+            num_bits = int(max_bytes * 8)
+        num_hashes = round(num_bits / capacity * math.log(2))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+    def estimated_error_rate(self):
+        """按已加入数量估算当前误判率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class UserExistenceFilter:
+    """维护 users.user_id 的布隆过滤器"""
+
+    def __init__(self, app, error_rate=0.01, max_bytes=64 * 2 ** 20, growth=1.5,
+                 batch_size=10000, tail_interval=1.0, tail_overlap=100, rebuild_interval=3600.0,
+                 build_async=True):
+        self.app = app
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.growth = growth
+        self.batch_size = batch_size
+        self.tail_interval = tail_interval
+        self.tail_overlap = tail_overlap
+        self.rebuild_interval = rebuild_interval
+        self.build_async = build_async
+        self._filter = None      # 构建完成前为 None
+        self._max_ids = {}       # 分片 -> 已读入的最大用户 id（增量补齐的起点）
+        self._pending = None     # 重建期间新增的账号，构建完成后补入新过滤器
+        self._tail_checked = 0.0
+        self._build_started = False
+        self._lock = threading.Lock()
+        self._tail_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_build_seconds = None
+
+    @property
+    def ready(self):
+        return self._filter is not None
+
+    @property
+    def tail_due(self):
+        """距上次读取表尾已超过 tail_interval（下一次否定判断会读取数据库）"""
+        return time.monotonic() - self._tail_checked >= self.tail_interval
+
+    def probably_contains(self, user_id):
+        """只查内存：过滤器未就绪或可能存在时返回 True（首次调用时触发构建）"""
+        bloom = self._filter
+        if bloom is None:
+            self._ensure_build()
+            return True
+        return user_id in bloom
+
+    def might_exist(self, user_id):
+        """返回 False 表示账号一定不存在（允许 tail_interval 秒的滞后）；过滤器未就绪时返回 True"""
+        if self.probably_contains(user_id):
+            return True
+        # 可能是其他进程刚创建的账号：限频读取表尾后再判断
+        self.refresh_tail()
+        return user_id in self._filter
+
+    def _ensure_build(self):
+        with self._lock:
+            if self._build_started:
+                return
+            self._build_started = True
+        if self.build_async:
+            threading.Thread(target=self._safe_build, name='user-filter-build', daemon=True).start()
+        else:
+            self._safe_build()
+
+    def add(self, user_id):
+        """加入新账号（事务提交后调用）"""
+        with self._lock:
+            if self._filter is not None and user_id not in self._filter:
+                self._filter.add(user_id)
+            if self._pending is not None:
+                self._pending.append(user_id)
+
+    def build(self):
+        """流式读取 users 表构建新过滤器并替换旧的，返回耗时秒数；users 表尚未创建时返回 None"""
+        started = time.perf_counter()
+        # 在请求中（同步构建）沿用当前会话，后台线程中推入应用上下文，结束时自动释放会话
+        with nullcontext() if has_app_context() else self.app.app_context():
+            names = shard_names()
+            if not all(_has_users_table(name) for name in names):
+                logger.info('users 表尚未创建，暂不构建账号过滤器')
+                return None
+            with self._lock:
+                self._pending = []
+            try:
+                total = 0
+                for name in names:
+                    with shard_session(name) as session:
+                        total += session.execute(select(func.count()).select_from(db.metadata.tables['users'])).scalar()
+                bloom = BloomFilter.for_capacity(max(total * self.growth, 100000), self.error_rate, self.max_bytes)
+                max_ids = {}
+                for name in names:
+                    with shard_session(name) as session:
+                        max_ids[name] = self._load(session, bloom, None)
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+        with self._lock:
+            for user_id in self._pending:
+                bloom.add(user_id)
+            self._pending = None
+            self._filter = bloom
+            for name, max_id in max_ids.items():
+                self._max_ids[name] = max(max_id, self._max_ids.get(name, 0))
+        self.last_build_seconds = time.perf_counter() - started
+        logger.info('账号过滤器构建完成：%d 个账号，%.1fMB，%d 次哈希，耗时 %.1fs',
+                    bloom.count, bloom.size_bytes / 2 ** 20, bloom.num_hashes, self.last_build_seconds)
+        return self.last_build_seconds
+
+    def refresh_tail(self, force=False):
+        """读取 id 大于已知最大值的账号加入过滤器（两次读取间隔不小于 tail_interval）"""
+        if self._filter is None:
+            return
+        if not self._tail_lock.acquire(blocking=False):
+            # 其他线程正在读取：不排队等待，沿用当前过滤器
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self._tail_checked < self.tail_interval:
+                return
+            self._tail_checked = now
+            with nullcontext() if has_app_context() else self.app.app_context():
+                for name in shard_names():
+                    known = self._max_ids.get(name, 0)
+                    # 读主库：副本可能尚未同步刚创建的账号
+                    with _primary_session(name) as session:
+                        max_id = self._load(session, self._filter, max(known - self.tail_overlap, 0))
+                    with self._lock:
+                        self._max_ids[name] = max(max_id, self._max_ids.get(name, 0))
+        finally:
+            self._tail_lock.release()
+
+    def _load(self, session, bloom, after_id):
+        users = db.metadata.tables['users']
+        stmt = select(users.c.id, users.c.user_id).order_by(users.c.id)
+        if after_id is not None:
+            stmt = stmt.where(users.c.id > after_id)
+        max_id = after_id or 0
+        result = session.execute(stmt.execution_options(yield_per=self.batch_size))
+        try:
+            for id, user_id in result:
+                # 表尾回读的部分多数已在过滤器中，跳过以免计数虚高
+                if after_id is None or user_id not in bloom:
+                    bloom.add(user_id)
+                max_id = id
+        finally:
+            result.close()
+        return max_id
+
+    def start(self):
+        """启动定期重建线程（首次构建在第一次查询时进行，此时表结构已创建）"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='user-filter', daemon=True)
+        self._thread.start()
+
+    def _safe_build(self):
+        try:
+            built = self.build()
+        except Exception:
+            # 保持原状态，查询照常走数据库
+            logger.warning('账号过滤器构建失败', exc_info=True)
+            built = None
+        if built is None and self._filter is None:
+            # 允许下一次查询重新触发构建
+            with self._lock:
+                self._build_started = False
+
+    def _run(self):
+        while not self._stop.wait(self.rebuild_interval):
+            if self._filter is not None:
+                self._safe_build()
+
+    def after_fork(self):
+        """fork 出的子进程中调用：沿用父进程已构建的过滤器，重新启动重建线程"""
+        self._lock = threading.Lock()
+        self._tail_lock = threading.Lock()
+        self._pending = None
+        # 父进程中未完成的构建线程没有带到子进程
+        self._build_started = self._filter is not None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='user-filter', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self):
+        bloom = self._filter
+        if bloom is None:
+            return {'ready': False}
+        return {
+            'ready': True,
+            'count': bloom.count,
+            'size_bytes': bloom.size_bytes,
+            'num_hashes': bloom.num_hashes,
+            'estimated_error_rate': bloom.estimated_error_rate(),
+            'max_id': max(self._max_ids.values(), default=0),
+            'last_build_seconds': self.last_build_seconds,
+        }
+
+
+@contextmanager
+def _primary_session(name):
+    """分片（或未启用分片时默认数据库）主库上的会话"""
+    if name is None:
+        yield db.session
+    else:
+        with shard_session(name) as session:
+            yield session
+
+
+def _has_users_table(name):
+    with _primary_session(name) as session:
+        return inspect(session.connection()).has_table('users')
+
+
+def init_user_filter(app):
+    """根据配置为应用启用账号存在性过滤器"""
+    if not app.config.get('USER_FILTER_ENABLED', True):
+        return None
+    user_filter = UserExistenceFilter(
+        app,
+        error_rate=app.config.get('USER_FILTER_ERROR_RATE', 0.01),
+        max_bytes=int(app.config.get('USER_FILTER_MAX_MEMORY_MB', 64) * 2 ** 20),
+        tail_interval=app.config.get('USER_FILTER_TAIL_INTERVAL', 1.0),
+        rebuild_interval=app.config.get('USER_FILTER_REBUILD_INTERVAL', 3600),
+        build_async=app.config.get('USER_FILTER_BUILD_ASYNC', True),
+    )
+    app.extensions['user_filter'] = user_filter
+    user_filter.start()
+    return user_filter
+
+
+def get_user_filter():
+    """返回当前应用的账号过滤器，未启用时返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('user_filter')
@@ -0,0 +1,326 @@
+"""
+批量导入用户
+流式读取 CSV/JSONL，多进程并行计算密码哈希（或直接使用已有哈希），
+按批次以多行 INSERT 写入 users、users_info 与 audit_logs；
+支持断点续传与吞吐/进度报告，内存占用与输入大小无关。
+无效记录（缺少字段、age 不是整数、extra_profile 不是 JSON 对象、JSONL 行无法解析等）逐条跳过并报告，不中断导入。
+启用分片时每批按账号所在分片分组写入。
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+
+from .models import db, User, UserInfo, AuditLog
+from .sharding import get_shard_router, on_shard, scatter_read
+
+# 可从输入中读取的字段
+USER_FIELDS = ('user_id', 'login_type', 'user_type', 'status')
+INFO_FIELDS = ('full_name', 'phone', 'email', 'age', 'gender', 'display_name', 'address', 'extra_profile')
+
+# 统计结果中保留的无效记录条数（全部无效记录可写入错误文件）
+MAX_REPORTED_ERRORS = 100
+
+
+def iter_records(path, fmt=None):
+    """流式读取输入文件，逐条返回记录：CSV 为字典，JSONL 为未解析的行（由 _parse_record 解析，坏行只跳过该条）"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ImportCheckpoint:
+    """断点文件：记录已处理的输入条数"""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        """返回已处理条数（断点不存在或来源不一致时为 0）"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('source') != self.source:
+            return 0
+        return int(data.get('processed', 0))
+
+    def save(self, processed):
+        """原子写入断点"""
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'source': self.source, 'processed': processed}, f)
+        os.replace(tmp, self.path)
+
+
+def _parse_record(record):
+    """将 JSONL 行解析为字典（CSV 记录原样返回），无法解析时抛出 ValueError"""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            raise ValueError('不是有效的 JSON')
+    if not isinstance(record, dict):
+        raise ValueError('记录不是 JSON 对象')
+    return record
+
+
+def _normalize(record):
+    """整理一条输入记录，返回 (用户字段, 详细信息字段, 密码, 已有哈希)；无效记录抛出 ValueError（说明原因）"""
+    user_id = str(record.get('user_id') or '').strip()
+    password = record.get('password') or None
+    password_hash = record.get('password_hash') or None
+    if not user_id:
+        raise ValueError('缺少 user_id')
+    if not (password or password_hash):
+        raise ValueError('缺少 password 或 password_hash')
+
+    user = {key: record.get(key) or None for key in USER_FIELDS}
+    user['user_id'] = user_id
+    user['login_type'] = user['login_type'] or ('email' if '@' in user_id else 'phone')
+    user['user_type'] = user['user_type'] or 'passenger'
+    user['status'] = user['status'] or 'active'
+
+    info = {key: record.get(key) or None for key in INFO_FIELDS}
+    if info['age'] is not None:
+        try:
+            info['age'] = int(info['age'])
+        except (TypeError, ValueError):
+            raise ValueError(f"age 不是整数: {info['age']!r}")
+    if isinstance(info['extra_profile'], str):
+        try:
+            info['extra_profile'] = json.loads(info['extra_profile'])
+        except ValueError:
+            raise ValueError('extra_profile 不是有效的 JSON')
+    if info['extra_profile'] is not None and not isinstance(info['extra_profile'], dict):
+        raise ValueError('extra_profile 不是 JSON 对象')
+    return user, info, password, password_hash
+
+
+class UserImporter:
+    """流式批量导入器"""
+
+    def __init__(self, batch_size=1000, workers=None, checkpoint=None, report_every=10.0, out=sys.stderr,
+                 errors_path=None):
+        self.batch_size = max(1, int(batch_size))
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint = checkpoint
+        self.report_every = report_every
+        self.out = out
+        self.errors_path = errors_path
+        self.stats = {'processed': 0, 'inserted': 0, 'existing': 0, 'invalid': 0}
+        self.errors = []  # 前 MAX_REPORTED_ERRORS 条无效记录：{'record': 序号, 'user_id': ..., 'error': 原因}
+        self._errors_file = None
+        self._position = 0  # 已读取的输入条数（含断点跳过的部分）
+        self._pool = None
+        self._previous_ids = set()  # 上一批（尚未写入）的账号
+
+    def _hash_all(self, passwords):
+        """并行计算一批密码哈希（返回惰性结果，写入上一批时哈希在后台进行）"""
+        if not passwords:
+            return iter(())
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return self._pool.map(generate_password_hash, passwords, chunksize=chunksize)
+
+    def _reject(self, record, error):
+        """记录一条无效记录（跳过，不中断导入）"""
+        self.stats['invalid'] += 1
+        user_id = record.get('user_id') if isinstance(record, dict) else None
+        entry = {'record': self._position, 'user_id': user_id, 'error': str(error)}
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(entry)
+        if self.errors_path:
+            if self._errors_file is None:
+                self._errors_file = open(self.errors_path, 'a', encoding='utf-8')
+            self._errors_file.write(json.dumps(dict(entry, data=record), ensure_ascii=False, default=str) + '\n')
+
+    def _prepare(self, batch):
+        """过滤无效与已存在的账号，并提交密码哈希任务"""
+        rows = []
+        for record in batch:
+            self._position += 1
+            try:
+                record = _parse_record(record)
+                rows.append(_normalize(record))
+            except ValueError as e:
+                self._reject(record, e)
+
+        # 已存在的账号跳过（使导入可重复执行）
+        user_ids = [user['user_id'] for user, _, _, _ in rows]
+        existing = set()
+        if user_ids:
+            stmt = select(User.user_id).where(User.user_id.in_(user_ids))
+            for found in scatter_read(lambda session: session.execute(stmt).scalars().all()):
+                existing.update(found)
+        self.stats['existing'] += len(existing)
+
+        seen = set()
+        pending = []
+        for item in rows:
+            user_id = item[0]['user_id']
+            if user_id in existing:
+                continue
+            if user_id in seen or user_id in self._previous_ids:
+                self.stats['existing'] += 1
+                continue
+            seen.add(user_id)
+            pending.append(item)
+        self._previous_ids = seen
+
+        hashes = self._hash_all([password for _, _, password, password_hash in pending if not password_hash])
+        return len(batch), pending, hashes
+
+    def _write(self, prepared, source):
+        count, pending, hashes = prepared
+        if pending:
+            now = datetime.utcnow()
+            groups = {}
+            router = get_shard_router()
+            for user, info, _, password_hash in pending:
+                row = dict(user)
+                row['password_hash'] = password_hash or next(hashes)
+                row['pwd_changed_at'] = now
+                row['created_at'] = now
+                row['updated_at'] = now
+                shard = router.home(row['user_id']) if router is not None else None
+                groups.setdefault(shard, []).append((row, info))
+
+            for shard, items in groups.items():
+                with on_shard(shard):
+                    self._insert(items, source, now)
+        db.session.commit()
+
+        self.stats['inserted'] += len(pending)
+        self.stats['processed'] += count
+        if self.checkpoint:
+            self.checkpoint.save(self.stats['processed'])
+
+    def _insert(self, items, source, now):
+        """在 db.session 当前路由的数据库中写入一组用户（启用分片时各分片分别提交）"""
+        user_rows = [row for row, _ in items]
+        db.session.execute(insert(User.__table__), user_rows)
+        id_map = dict(db.session.execute(
+            select(User.user_id, User.id).where(User.user_id.in_([row['user_id'] for row in user_rows]))
+        ).all())
+
+        info_rows = []
+        audit_rows = []
+        for row, info in items:
+            id = id_map[row['user_id']]
+            info_rows.append(dict(info, id=id))
+            audit_rows.append({
+                'actor_user_id': id,
+                'action': 'user_imported',
+                'target': None,
+                'ip_bin': None,
+                'ua_id': None,
+                'context': {'source': source},
+                'created_at': now,
+            })
+        db.session.execute(insert(UserInfo.__table__), info_rows)
+        db.session.execute(insert(AuditLog.__table__), audit_rows)
+        if get_shard_router() is not None:
+            db.session.commit()
+
+    def _report(self, started, final=False):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        rate = self.stats['inserted'] / elapsed
+        label = '完成' if final else '进度'
+        print(
+            f"[{label}] 已处理 {self.stats['processed']} 条，新增 {self.stats['inserted']}，"
+            f"已存在 {self.stats['existing']}，无效 {self.stats['invalid']}，"
+            f"耗时 {elapsed:.1f}s，{rate:.0f} 用户/秒",
+            file=self.out,
+        )
+        if final:
+            for entry in self.errors[:10]:
+                print(f"  第 {entry['record']} 条无效（{entry['user_id'] or '-'}）：{entry['error']}", file=self.out)
+            if self.stats['invalid'] > 10:
+                where = f'，全部记录见 {self.errors_path}' if self.errors_path else ''
+                print(f"  ……共 {self.stats['invalid']} 条无效{where}", file=self.out)
+
+    def run(self, path, fmt=None):
+        """执行导入，返回统计信息（errors 为前 MAX_REPORTED_ERRORS 条无效记录）"""
+        source = os.path.basename(path)
+        skip = self.checkpoint.load() if self.checkpoint else 0
+        self.stats['processed'] = skip
+        self._position = skip
+        if skip:
+            print(f'从断点继续：跳过前 {skip} 条', file=self.out)
+
+        records = islice(iter_records(path, fmt), skip, None)
+        started = time.monotonic()
+        last_report = started
+        previous = None
+        try:
+            for batch in _batched(records, self.batch_size):
+                prepared = self._prepare(batch)
+                if previous is not None:
+                    self._write(previous, source)
+                previous = prepared
+
+                if time.monotonic() - last_report >= self.report_every:
+                    self._report(started)
+                    last_report = time.monotonic()
+            if previous is not None:
+                self._write(previous, source)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            if self._errors_file is not None:
+                self._errors_file.close()
+                self._errors_file = None
+
+        self._report(started, final=True)
+        return dict(self.stats, errors=list(self.errors))
+
+
+def import_users(path, fmt=None, batch_size=1000, workers=None, checkpoint_path=None, report_every=10.0,
+                 errors_path=None):
+    """从 CSV/JSONL 文件批量导入用户（需在应用上下文中调用）；errors_path 为无效记录的 JSONL 输出文件"""
+    checkpoint = ImportCheckpoint(checkpoint_path, path) if checkpoint_path else None
+    importer = UserImporter(
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint=checkpoint,
+        report_every=report_every,
+        errors_path=errors_path,
+    )
+    return importer.run(path, fmt)
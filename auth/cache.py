@@ -0,0 +1,160 @@
+"""
+用户查询缓存
+按登录账号与数值ID缓存用户的不可变快照（LRU + TTL），并缓存“账号不存在”的结果；
+快照与会话/ORM 对象无关，可以安全地跨请求、跨线程共享。
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, has_app_context
+
+from .hashing import verify_password
+
+
+class UserSnapshot(namedtuple('UserSnapshot', [
+    'id', 'user_id', 'login_type', 'password_hash', 'user_type', 'status',
+    'pwd_changed_at', 'created_at', 'updated_at',
+])):
+    """用户只读快照（与 User 同名的字段与常用方法）"""
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user):
+        """由 User 对象生成快照"""
+        return cls(*(getattr(user, name) for name in cls._fields))
+
+    def check_password(self, password):
+        """验证密码"""
+        return verify_password(self.password_hash, password)
+
+    def is_active(self):
+        """检查用户是否激活"""
+        return self.status == 'active'
+
+    def is_admin(self):
+        """检查是否为管理员"""
+        return self.user_type == 'admin'
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'login_type': self.login_type,
+            'user_type': self.user_type,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class UserCache:
+    """用户快照缓存（LRU + TTL，线程安全）"""
+
+    def __init__(self, maxsize=10000, ttl=60.0, negative_ttl=10.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self._entries = OrderedDict()  # key -> (过期时间, 快照或 None)
+        self._lock = threading.Lock()
+        # 每次失效递增；读库前记录，写回时若已变化则放弃，避免旧数据覆盖失效
+        self.generation = 0
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                       'invalidations': 0}
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._stats['misses'] += 1
+                return False, None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits' if value is not None else 'negative_hits'] += 1
+            return True, value
+
+    def get_by_user_id(self, user_id):
+        """按登录账号查找，返回 (是否命中, 快照或 None)"""
+        return self._get(('user_id', user_id))
+
+    def get_by_id(self, id):
+        """按数值ID查找，返回 (是否命中, 快照或 None)"""
+        return self._get(('id', id))
+
+    def _set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def put(self, snapshot, generation):
+        """写入用户快照（同时以登录账号和数值ID为键）"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._set(('user_id', snapshot.user_id), snapshot, self.ttl)
+            self._set(('id', snapshot.id), snapshot, self.ttl)
+
+    def put_missing(self, generation, user_id=None, id=None):
+        """记录账号不存在"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            if user_id is not None:
+                self._set(('user_id', user_id), None, self.negative_ttl)
+            if id is not None:
+                self._set(('id', id), None, self.negative_ttl)
+
+    def invalidate(self, user_id=None, id=None):
+        """使某个用户的缓存失效"""
+        with self._lock:
+            self.generation += 1
+            self._stats['invalidations'] += 1
+            for key in (('user_id', user_id), ('id', id)):
+                item = self._entries.pop(key, None)
+                # 通过一个键找到的快照，同时移除另一个键
+                if item and item[1] is not None:
+                    self._entries.pop(('user_id', item[1].user_id), None)
+                    self._entries.pop(('id', item[1].id), None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """返回命中/未命中/淘汰等统计"""
+        with self._lock:
+            data = dict(self._stats)
+            data['size'] = len(self._entries)
+        return data
+
+
+def init_user_cache(app):
+    """根据配置为应用启用用户查询缓存"""
+    if not app.config.get('USER_CACHE_ENABLED', True):
+        return None
+    cache = UserCache(
+        maxsize=app.config.get('USER_CACHE_SIZE', 10000),
+        ttl=app.config.get('USER_CACHE_TTL', 60),
+        negative_ttl=app.config.get('USER_CACHE_NEGATIVE_TTL', 10),
+    )
+    app.extensions['user_cache'] = cache
+    return cache
+
+
+def get_user_cache():
+    """返回当前应用的用户缓存，未启用时返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('user_cache')
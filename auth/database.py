@@ -0,0 +1,25 @@
+"""
+数据库实例
+单独定义以便模型之外的模块（如读副本路由、分片路由）引用，而不产生循环导入
+"""
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+# db.session.info 中当前路由到的分片名与引擎（见 sharding）
+SHARD_KEY = 'shard'
+SHARD_ENGINE_KEY = 'shard_engine'
+
+
+class RoutingSession(Session):
+    """info 中指定了分片引擎时，所有语句都发往该引擎；未启用分片时与默认会话一致"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = self.info.get(SHARD_ENGINE_KEY)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,122 @@
+"""
+用户流式导出
+使用服务端游标（yield_per）逐批读取 users 连接 users_info 的列，
+以 CSV、JSONL 或人类可读格式增量写出，内存占用与用户数量无关。
+启用分片时按分片顺序依次读取（各分片 id 区间递增，整体仍按 id 升序）。
+"""
+
+import csv
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from .models import User, UserInfo
+from .sharding import shard_names, shard_session
+
+EXPORT_FORMATS = ('text', 'csv', 'jsonl')
+
+# 导出的列（名称, 列）
+EXPORT_COLUMNS = (
+    ('id', User.id),
+    ('user_id', User.user_id),
+    ('login_type', User.login_type),
+    ('user_type', User.user_type),
+    ('status', User.status),
+    ('created_at', User.created_at),
+    ('full_name', UserInfo.full_name),
+    ('display_name', UserInfo.display_name),
+    ('email', UserInfo.email),
+    ('phone', UserInfo.phone),
+    ('extra_profile', UserInfo.extra_profile),
+)
+FIELD_NAMES = [name for name, _ in EXPORT_COLUMNS]
+
+
+def iter_users(user_type=None, status=None, created_from=None, created_to=None, batch_size=1000):
+    """按条件流式返回用户（字典），按 id 升序"""
+    stmt = (
+        select(*(column.label(name) for name, column in EXPORT_COLUMNS))
+        .outerjoin(UserInfo, UserInfo.id == User.id)
+        .order_by(User.id)
+    )
+    if user_type:
+        stmt = stmt.where(User.user_type == user_type)
+    if status:
+        stmt = stmt.where(User.status == status)
+    if created_from:
+        stmt = stmt.where(User.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(User.created_at < created_to)
+
+    for shard in shard_names():
+        with shard_session(shard) as session:
+            result = session.execute(stmt.execution_options(yield_per=batch_size))
+            try:
+                for row in result:
+                    yield dict(row._mapping)
+            finally:
+                result.close()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'无法序列化: {type(value)!r}')
+
+
+def _write_text(rows, out):
+    count = 0
+    for row in rows:
+        count += 1
+        out.write(f"ID: {row['id']}\n")
+        out.write(f"用户名: {row['user_id']}\n")
+        out.write(f"登录类型: {row['login_type']}\n")
+        out.write(f"用户类型: {row['user_type']}\n")
+        out.write(f"状态: {row['status']}\n")
+        out.write(f"创建时间: {row['created_at']}\n")
+        if any(row[key] is not None for key in ('full_name', 'display_name', 'email', 'phone', 'extra_profile')):
+            out.write(f"姓名: {row['full_name']}\n")
+            out.write(f"昵称: {row['display_name']}\n")
+            out.write(f"邮箱: {row['email']}\n")
+            out.write(f"手机: {row['phone']}\n")
+            if row['extra_profile']:
+                out.write(f"扩展资料: {row['extra_profile']}\n")
+        out.write("-" * 80 + "\n")
+    out.write(f"\n共有 {count} 个用户\n")
+    return count
+
+
+def _write_csv(rows, out):
+    writer = csv.DictWriter(out, fieldnames=FIELD_NAMES)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        count += 1
+        if row['created_at'] is not None:
+            row['created_at'] = row['created_at'].isoformat()
+        if row['extra_profile'] is not None:
+            row['extra_profile'] = json.dumps(row['extra_profile'], ensure_ascii=False)
+        writer.writerow(row)
+    return count
+
+
+def _write_jsonl(rows, out):
+    count = 0
+    for row in rows:
+        count += 1
+        out.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+        out.write('\n')
+    return count
+
+
+def export_users(out, fmt='text', **filters):
+    """将用户按指定格式增量写入 out（需在应用上下文中调用），返回导出条数"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'未知的导出格式: {fmt}')
+    rows = iter_users(**filters)
+    if fmt == 'csv':
+        return _write_csv(rows, out)
+    if fmt == 'jsonl':
+        return _write_jsonl(rows, out)
+    return _write_text(rows, out)
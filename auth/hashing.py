@@ -0,0 +1,198 @@
+"""
+密码哈希执行器
+将 CPU 密集的密码哈希/校验交给有界的工作池（优先进程池，可回退线程池），
+请求线程只等待结果；排队已满时立即失败，而不是无限排队拖垮其他路由。
+异步视图使用 generate_async/verify_async，在事件循环中等待工作池结果而不占用线程。
+"""
+
+import asyncio
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ('process', 'thread', 'inline')
+
+
+class HashingBusyError(RuntimeError):
+    """哈希工作池已满或等待超时（应返回 503）"""
+
+
+class PasswordHasher:
+    """有界的密码哈希执行器"""
+
+    def __init__(self, mode='process', max_workers=None, max_pending=None, timeout=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f'未知的哈希执行模式: {mode}')
+        self.max_workers = max(1, int(max_workers or os.cpu_count() or 1))
+        # 正在执行 + 排队等待的总上限
+        if max_pending is None:
+            max_pending = self.max_workers * 4
+        self.max_pending = max(0, int(max_pending))
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.mode = mode
+        self.executor = self._create_executor(mode)
+        # 哈希完成后的回调：callback(操作名, 耗时秒数)
+        self.observers = []
+
+    def _create_executor(self, mode):
+        if mode == 'inline':
+            return None
+        if mode == 'process':
+            try:
+                # spawn 避免在多线程的 Web 进程中 fork
+                return ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            except (OSError, NotImplementedError, ImportError) as e:
+                logger.warning('无法创建哈希进程池，回退为线程池: %s', e)
+                self.mode = 'thread'
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pwhash')
+
+    def _run(self, op, fn, *args):
+        started = time.perf_counter()
+        result = self._execute(fn, *args)
+        elapsed = time.perf_counter() - started
+        for observer in self.observers:
+            observer(op, elapsed)
+        return result
+
+    def _execute(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 尚未开始的任务直接取消；已在执行的任务完成后才释放名额
+            future.cancel()
+            raise HashingBusyError('密码哈希等待超时')
+
+    async def _run_async(self, op, fn, *args):
+        started = time.perf_counter()
+        if self.executor is None:
+            # inline 模式也不能阻塞事件循环，交给默认线程池
+            result = await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        else:
+            try:
+                # 超时时 wait_for 会取消包装的 future，尚未开始的任务随之取消
+                result = await asyncio.wait_for(asyncio.wrap_future(self._submit(fn, *args)), self.timeout)
+            except asyncio.TimeoutError:
+                raise HashingBusyError('密码哈希等待超时')
+        elapsed = time.perf_counter() - started
+        for observer in self.observers:
+            observer(op, elapsed)
+        return result
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusyError('密码哈希队列已满')
+
+    def _submit(self, fn, *args):
+        """占用名额并提交任务；名额在任务结束（完成、失败或取消）时释放，而不是调用方停止等待时"""
+        self._acquire_slot()
+        slots = self._slots
+        try:
+            try:
+                future = self.executor.submit(fn, *args)
+            except BrokenProcessPool:
+                logger.error('哈希进程池已损坏，回退为线程池')
+                self.mode = 'thread'
+                self.executor = self._create_executor('thread')
+                future = self.executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def generate(self, password):
+        """生成密码哈希"""
+        return self._run('generate', generate_password_hash, password)
+
+    def verify(self, pwhash, password):
+        """校验密码"""
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    async def generate_async(self, password):
+        """生成密码哈希（异步等待）"""
+        return await self._run_async('generate', generate_password_hash, password)
+
+    async def verify_async(self, pwhash, password):
+        """校验密码（异步等待）"""
+        return await self._run_async('verify', check_password_hash, pwhash, password)
+
+    def share_among(self, processes):
+        """
+        多进程部署时由主进程在 fork 前调用：并发与排队上限按整台主机计算，由 processes 个 worker 平分，
+        避免每个 worker 都按 CPU 数创建工作池。工作池在各 worker 的 after_fork 中按新的上限重建。
+        """
+        processes = max(1, int(processes))
+        self.max_workers = max(1, math.ceil(self.max_workers / processes))
+        self.max_pending = math.ceil(self.max_pending / processes)
+
+    def after_fork(self):
+        """fork 出的子进程中调用：父进程的工作池不可用，重新创建"""
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.executor = self._create_executor(self.mode)
+
+    def shutdown(self, wait=True):
+        """关闭工作池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+
+def init_password_hasher(app):
+    """根据配置创建应用的密码哈希执行器"""
+    hasher = PasswordHasher(
+        mode=app.config.get('PASSWORD_HASH_EXECUTOR', 'process'),
+        max_workers=app.config.get('PASSWORD_HASH_WORKERS'),
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING'),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT'),
+    )
+    app.extensions['password_hasher'] = hasher
+    atexit.register(hasher.shutdown, False)
+    return hasher
+
+
+def get_password_hasher():
+    """返回当前应用的哈希执行器，应用上下文之外返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('password_hasher')
+
+
+def hash_password(password):
+    """生成密码哈希（有执行器时交给工作池）"""
+    hasher = get_password_hasher()
+    if hasher is None:
+        return generate_password_hash(password)
+    return hasher.generate(password)
+
+
+def verify_password(pwhash, password):
+    """校验密码（有执行器时交给工作池）"""
+    hasher = get_password_hasher()
+    if hasher is None:
+        return check_password_hash(pwhash, password)
+    return hasher.verify(pwhash, password)
@@ -0,0 +1,83 @@
+"""
+JSON 列的方言相关表达式
+- json_scalar：取 JSON 文档中某个键的标量值，可用作生成列表达式
+  （MariaDB 为 JSON_VALUE，SQLite 为 json_extract）；
+- json_set：在一条 UPDATE 中就地修改 JSON 文档中的若干键（MariaDB 的 JSON_SET / SQLite 的 json_set），
+  不必读出整个文档再整体写回。
+"""
+
+import json
+
+from sqlalchemy import bindparam, func, literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from sqlalchemy.types import String
+
+
+def json_path(key):
+    """
+    生成顶层键的 JSON 路径（键名加引号，允许包含 . 等字符）
+    SQLite 的路径不支持转义，含双引号的键 JSON_SET 会静默忽略，因此不允许双引号与反斜杠。
+    """
+    if '"' in key or '\\' in key:
+        raise ValueError(f'扩展资料键不能包含双引号或反斜杠: {key!r}')
+    return f'$."{key}"'
+
+
+class json_scalar(ColumnElement):
+    """JSON 文档中某个键的标量值（用于生成列，列名按字面写入 DDL）"""
+    inherit_cache = True
+    type = String()
+    _traverse_internals = [
+        ('column_name', InternalTraversal.dp_string),
+        ('key', InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, column_name, key):
+        self.column_name = column_name
+        self.key = key
+
+
+@compiles(json_scalar)
+def _compile_json_scalar(element, compiler, **kw):
+    path = json_path(element.key).replace("'", "''")
+    return f"json_extract({element.column_name}, '{path}')"
+
+
+@compiles(json_scalar, 'mysql')
+def _compile_json_scalar_mysql(element, compiler, **kw):
+    path = json_path(element.key).replace("'", "''")
+    return f"JSON_VALUE({element.column_name}, '{path}')"
+
+
+class json_document(ColumnElement):
+    """以 JSON 文本传入的值（对象、数组、布尔），在 JSON_SET 中作为 JSON 而不是字符串写入"""
+    inherit_cache = True
+    type = String()
+    _traverse_internals = [('text', InternalTraversal.dp_clauseelement)]
+
+    def __init__(self, value):
+        self.text = bindparam(None, json.dumps(value, ensure_ascii=False), type_=String(), unique=True)
+
+
+@compiles(json_document)
+def _compile_json_document(element, compiler, **kw):
+    return f'json({compiler.process(element.text, **kw)})'
+
+
+@compiles(json_document, 'mysql')
+def _compile_json_document_mysql(element, compiler, **kw):
+    return f"JSON_EXTRACT({compiler.process(element.text, **kw)}, '$')"
+
+
+def json_set(column, values):
+    """生成 JSON_SET(COALESCE(column, '{}'), path1, value1, ...) 表达式"""
+    args = [func.coalesce(column, literal('{}', String()))]
+    for key, value in values.items():
+        args.append(json_path(key))
+        if isinstance(value, (dict, list, tuple, bool)):
+            args.append(json_document(value))
+        else:
+            args.append(value)
+    return func.json_set(*args)
@@ -0,0 +1,113 @@
+"""
+登录统计重建
+按用户 id 分段，从 audit_logs 按 (actor_user_id, created_at, id) 索引顺序流式读取 login_success/login_failed，
+重新计算 user_login_stats：每段先聚合、再在一个事务中删除并重写该段的统计行，
+读写不交叠，内存占用只与段大小有关，与日志总量无关。
+已归档删除的日志不再计入；重建期间发生的登录由增量更新继续累加。
+启用分片时依次重建各分片（用户与其日志在同一分片）。
+"""
+
+import calendar
+import time
+
+from sqlalchemy import delete, insert, select
+
+from .models import AuditLog, User, UserLoginStats
+from .sharding import shard_engine, shard_names
+
+LOGIN_ACTIONS = ('login_success', 'login_failed')
+
+
+def _epoch(value):
+    """UTC 时间（无时区）转 Unix 秒"""
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def _empty_stats(id, window_start):
+    return {
+        'id': id,
+        'login_count': 0,
+        'failure_count': 0,
+        'consecutive_failures': 0,
+        'last_success_at': None,
+        'last_success_ip': None,
+        'last_failure_at': None,
+        'failure_window_start': window_start,
+        'failures_previous': 0,
+        'failures_current': 0,
+    }
+
+
+def _aggregate(rows, window_start, window):
+    """按用户与时间顺序累加登录事件，返回 ({用户ID: 统计行}, 事件数)"""
+    stats = {}
+    count = 0
+    for actor_user_id, action, ip_bin, created_at in rows:
+        count += 1
+        row = stats.get(actor_user_id)
+        if row is None:
+            row = stats[actor_user_id] = _empty_stats(actor_user_id, window_start)
+        if action == 'login_success':
+            row['login_count'] += 1
+            row['consecutive_failures'] = 0
+            row['last_success_at'] = created_at
+            row['last_success_ip'] = ip_bin
+        else:
+            row['failure_count'] += 1
+            row['consecutive_failures'] += 1
+            row['last_failure_at'] = created_at
+            at = _epoch(created_at)
+            if at >= window_start:
+                row['failures_current'] += 1
+            elif at >= window_start - window:
+                row['failures_previous'] += 1
+    return stats, count
+
+
+def rebuild_login_stats(batch_size=1000, window=3600, now=None, progress=None):
+    """
+    由审计日志重建登录统计，每段 batch_size 个用户。
+    返回 (处理的用户数, 读取的登录事件数)；progress(用户数, 事件数, 当前用户ID) 用于输出进度。
+    """
+    now = now or time.time()
+    window_start = int(now // window) * window
+    users = 0
+    events = 0
+    for shard in shard_names():
+        users, events = _rebuild_shard(shard_engine(shard), batch_size, window, window_start,
+                                       users, events, progress)
+    return users, events
+
+
+def _rebuild_shard(engine, batch_size, window, window_start, users, events, progress):
+    table = UserLoginStats.__table__
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            ids = conn.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            first, last_id = ids[0], ids[-1]
+            result = conn.execute(
+                select(AuditLog.actor_user_id, AuditLog.action, AuditLog.ip_bin, AuditLog.created_at)
+                .where(AuditLog.actor_user_id.between(first, last_id), AuditLog.action.in_(LOGIN_ACTIONS))
+                .order_by(AuditLog.actor_user_id, AuditLog.created_at, AuditLog.id)
+                .execution_options(yield_per=5000)
+            )
+            try:
+                stats, count = _aggregate(result, window_start, window)
+            finally:
+                result.close()
+
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.id.between(first, last_id)))
+            if stats:
+                conn.execute(insert(table), list(stats.values()))
+
+        users += len(ids)
+        events += count
+        if progress is not None:
+            progress(users, events, last_id)
+    return users, events
@@ -1,15 +1,149 @@
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app, has_app_context
+from sqlalchemy import DDL, Computed, case, event, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+from collections import namedtuple
+from datetime import datetime, timedelta
 import json
+import time
+
+from .hashing import hash_password, verify_password
+from .bloom import get_user_filter
+from .cache import UserSnapshot, get_user_cache
+from .database import db
+from .jsonfields import json_scalar, json_set
+from .normalize import normalized_email, normalized_phone
+from .ratelimit import sliding_window_estimate
+from .replicas import get_replica_router, run_read
+from .sessions import get_session_store
+from .sharding import (exists_on_other_shards, is_home_id, route_to_id, route_to_user, scatter_read,
+                       with_user_shard)
+from .useragents import get_user_agent_cache, ip_from_bytes, ip_to_bytes, user_agent_id
+
+# 自增主键：SQLite 只有 INTEGER PRIMARY KEY 才会自增
+BigIntPK = db.BigInteger().with_variant(db.Integer(), 'sqlite')
+
+# 定长/变长二进制：MariaDB 使用 BINARY/VARBINARY 才能建普通索引（BLOB 需要前缀长度）
+Binary16 = db.LargeBinary(16).with_variant(mysql.BINARY(16), 'mysql')
+VarBinary16 = db.LargeBinary(16).with_variant(mysql.VARBINARY(16), 'mysql')
+
+
+class UserAlreadyExistsError(Exception):
+    """登录账号已存在"""
+
+
+def is_duplicate_user_id(error):
+    """IntegrityError 是否由 users.user_id 唯一索引冲突引起（外键、非空等其他约束冲突返回 False）"""
+    message = str(getattr(error, 'orig', None) or error)
+    # SQLite：UNIQUE constraint failed: users.user_id；MariaDB/MySQL（1062）：Duplicate entry ... for key 'ix_users_user_id'
+    return ('UNIQUE constraint failed: users.user_id' in message
+            or ('Duplicate entry' in message and 'ix_users_user_id' in message))
+
+
+class AccountLockedError(Exception):
+    """连续登录失败过多，账号暂时锁定"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'账号已锁定，请 {retry_after} 秒后重试')
+        self.retry_after = retry_after
+
+
+# 会话中待失效的用户缓存键
+_USER_CACHE_KEYS = 'user_cache_invalidate'
+
+# 会话中待吊销登录会话的账号
+_USER_SESSION_REVOKE = 'user_session_revoke'
+
+
+def mark_user_changed(user, revoke_sessions=False):
+    """标记用户已变更，所在事务提交后使其缓存失效；revoke_sessions 为 True 时同时吊销其全部登录会话"""
+    db.session.info.setdefault(_USER_CACHE_KEYS, set()).add((user.user_id, user.id))
+    if revoke_sessions:
+        db.session.info.setdefault(_USER_SESSION_REVOKE, set()).add(user.user_id)
+
+
+def invalidate_user(user_id, id, revoke_sessions=False):
+    """
+    用户变更提交后的处理：使缓存失效、加入账号过滤器、清空会话中的详情快照（或吊销全部会话），
+    并在一段时间内让该账号读主库。同步服务在 after_commit 中调用，异步服务在事务提交后调用。
+    """
+    store = get_session_store()
+    if store is not None:
+        if revoke_sessions:
+            store.revoke_user(user_id)
+        else:
+            store.clear_snapshots(user_id)
+    cache = get_user_cache()
+    if cache is not None:
+        cache.invalidate(user_id=user_id, id=id)
+    user_filter = get_user_filter()
+    if user_filter is not None:
+        user_filter.add(user_id)
+    # 写入后的一段时间内该账号读主库
+    router = get_replica_router()
+    if router is not None:
+        router.mark_written(user_id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(session):
+    keys = session.info.pop(_USER_CACHE_KEYS, None)
+    revoked = session.info.pop(_USER_SESSION_REVOKE, ())
+    for user_id, id in keys or ():
+        invalidate_user(user_id, id, revoke_sessions=user_id in revoked)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop(_USER_CACHE_KEYS, None)
+    session.info.pop(_USER_SESSION_REVOKE, None)
+
+
+def _might_exist(user_id):
+    """账号过滤器判定账号一定不存在时返回 False（未启用过滤器时返回 True）"""
+    user_filter = get_user_filter()
+    return user_filter is None or user_filter.might_exist(user_id)
+
+
+def _read_user_snapshot(criterion, user_id=None):
+    """在只读会话（可能是副本）中查询用户并转为快照"""
+    def query(session):
+        user = session.execute(select(User).where(criterion)).scalar_one_or_none()
+        return UserSnapshot.from_user(user) if user else None
+    return run_read(query, user_id)
+
+
+def _read_user_snapshot_by_user_id(user_id):
+    """按登录账号读取快照（启用分片时在账号所在分片查询）"""
+    return with_user_shard(user_id, lambda: _read_user_snapshot(User.user_id == user_id, user_id))
+
+
+def _read_primary_snapshot(user_id):
+    """
+    在主库（账号所在分片）读取用户快照，不经过进程内缓存与读副本，并用结果刷新本进程缓存。
+    缓存失效只作用于当前进程：其他 worker 或 init_db.py 修改的密码与状态在缓存过期前不可见，
+    因此认证等依赖最新数据的操作必须走这里。
+    """
+    cache = get_user_cache()
+    generation = cache.generation if cache is not None else None
+    user = with_user_shard(user_id, lambda: db.session.execute(
+        select(User).where(User.user_id == user_id)).scalar_one_or_none())
+    if user is None:
+        if cache is not None:
+            cache.put_missing(generation, user_id=user_id)
+        return None
+    snapshot = UserSnapshot.from_user(user)
+    if cache is not None:
+        cache.put(snapshot, generation)
+    return snapshot
 
-db = SQLAlchemy()
 
 class User(db.Model):
     """用户基础信息表"""
     __tablename__ = 'users'
     
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
     user_id = db.Column(db.String(255), unique=True, nullable=False, index=True)  # 登录账号
     login_type = db.Column(db.String(16), nullable=False, default='email')  # email/phone
     password_hash = db.Column(db.Text, nullable=False)
@@ -21,26 +155,37 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # MySQL特定配置
-    __table_args__ = {
-        'mysql_engine': 'InnoDB',
-        'mysql_charset': 'utf8mb4',
-        'mysql_collate': 'utf8mb4_unicode_ci'
-    }
+    __table_args__ = (
+        # 客服按类型/状态筛选用户时按 id 顺序扫描
+        db.Index('ix_users_type_status_id', 'user_type', 'status', 'id'),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+            'mysql_collate': 'utf8mb4_unicode_ci',
+            # SQLite 使用 AUTOINCREMENT 才能为各分片设置 id 起点
+            'sqlite_autoincrement': True
+        },
+    )
     
     # 与用户详细信息的一对一关系
     user_info = db.relationship('UserInfo', backref='user', uselist=False, cascade='all, delete-orphan')
     
+    # 与登录统计的一对一关系（按主键读取）
+    login_stats = db.relationship('UserLoginStats', uselist=False, cascade='all, delete-orphan')
+    
     # 与审计日志的一对多关系
     audit_logs = db.relationship('AuditLog', backref='actor_user', lazy='dynamic', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """设置密码"""
-        self.password_hash = generate_password_hash(password)
+        """设置密码（哈希计算交给哈希执行器）"""
+        self.password_hash = hash_password(password)
         self.pwd_changed_at = datetime.utcnow()
+        # 修改已有账号的密码时吊销其登录会话（新建账号还没有会话）
+        mark_user_changed(self, revoke_sessions=self.id is not None)
     
     def check_password(self, password):
-        """验证密码"""
-        return check_password_hash(self.password_hash, password)
+        """验证密码（哈希计算交给哈希执行器）"""
+        return verify_password(self.password_hash, password)
     
     def is_active(self):
         """检查用户是否激活"""
@@ -66,6 +211,20 @@ class User(db.Model):
         return f'<User {self.user_id}>'
 
 
+# extra_profile 中经常用于查询的键：以数据库生成列（带索引）的形式暴露，只读
+PROFILE_KEY_COLUMNS = ('license_number', 'vehicle_type')
+
+
+def profile_key_column(key, type_):
+    """由 extra_profile 中的键生成的索引列（MariaDB JSON_VALUE / SQLite json_extract）"""
+    return db.Column(type_, Computed(json_scalar('extra_profile', key)), index=True)
+
+
+def normalized_column(length):
+    """规范化查询列的类型（SQLite 使用 NOCASE 排序规则，LIKE 前缀查询才能走索引）"""
+    return db.String(length).with_variant(db.String(length, collation='NOCASE'), 'sqlite')
+
+
 class UserInfo(db.Model):
     """用户详细信息表"""
     __tablename__ = 'users_info'
@@ -79,21 +238,50 @@ class UserInfo(db.Model):
     display_name = db.Column(db.String(128), nullable=True)
     address = db.Column(db.String(255), nullable=True)
     extra_profile = db.Column(db.JSON, nullable=True)  # 扩展资料
+    license_number = profile_key_column('license_number', db.String(64))  # 驾照号（生成列）
+    vehicle_type = profile_key_column('vehicle_type', db.String(32))  # 车型（生成列）
+    email_norm = db.Column(normalized_column(255), Computed(normalized_email('email')))  # 规范化邮箱（生成列）
+    phone_norm = db.Column(normalized_column(32), Computed(normalized_phone('phone')))  # 规范化手机号（生成列）
     
     # MySQL特定配置
-    __table_args__ = {
-        'mysql_engine': 'InnoDB',
-        'mysql_charset': 'utf8mb4',
-        'mysql_collate': 'utf8mb4_unicode_ci'
-    }
+    __table_args__ = (
+        # 前缀查询按 (规范化值, id) 有序扫描，支持键集分页
+        db.Index('ix_users_info_email_norm', 'email_norm', 'id'),
+        db.Index('ix_users_info_phone_norm', 'phone_norm', 'id'),
+        # 中日韩文字或过短的姓名关键词按前缀匹配
+        db.Index('ix_users_info_full_name', 'full_name'),
+        # 姓名/昵称全文索引（SQLite 使用 FTS5 虚拟表 users_info_fts）
+        db.Index('ix_users_info_names_fulltext', 'full_name', 'display_name',
+                 mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+            'mysql_collate': 'utf8mb4_unicode_ci'
+        },
+    )
     
     def set_extra_profile(self, key, value):
-        """设置扩展资料"""
-        if self.extra_profile is None:
-            self.extra_profile = {}
-        self.extra_profile[key] = value
-        # 标记字段已修改
-        db.session.merge(self)
+        """设置扩展资料（整体写回文档；修改多个键请用 update_extra_profile）"""
+        # 赋值新字典，变更才能被检测到（原地修改 JSON 字典不会被跟踪）
+        profile = dict(self.extra_profile or {})
+        profile[key] = value
+        self.extra_profile = profile
+    
+    def update_extra_profile(self, **keys):
+        """以一条 UPDATE 就地修改扩展资料中的若干键（JSON_SET），随当前事务提交"""
+        if not keys:
+            return
+        db.session.execute(
+            update(UserInfo)
+            .where(UserInfo.id == self.id)
+            .values(extra_profile=json_set(UserInfo.extra_profile, keys))
+            .execution_options(synchronize_session=False)
+        )
+        # 同步内存中的文档（不标记为已修改，避免提交时整体写回）；生成列在下次访问时重新加载
+        profile = dict(self.extra_profile or {})
+        profile.update(keys)
+        set_committed_value(self, 'extra_profile', profile)
+        db.session.expire(self, list(PROFILE_KEY_COLUMNS))
     
     def get_extra_profile(self, key, default=None):
         """获取扩展资料"""
@@ -119,35 +307,97 @@ class UserInfo(db.Model):
         return f'<UserInfo {self.full_name or self.display_name}>'
 
 
+class UserAgent(db.Model):
+    """User-Agent 字典表（审计日志只保存 id）"""
+    __tablename__ = 'user_agents'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    ua_hash = db.Column(Binary16, nullable=False)  # UA 内容摘要
+    ua = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ux_user_agents_ua_hash', 'ua_hash', unique=True),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+            'mysql_collate': 'utf8mb4_unicode_ci'
+        }
+    )
+
+    def __repr__(self):
+        return f'<UserAgent {self.id}>'
+
+
 class AuditLog(db.Model):
     """审计日志表"""
     __tablename__ = 'audit_logs'
     
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
-    actor_user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
+    # 操作者；按 IP 汇总的限流记录等不属于某个账号的事件为 NULL
+    actor_user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), nullable=True)
     action = db.Column(db.String(64), nullable=False)  # login_success/login_failed等
     target = db.Column(db.String(64), nullable=True)  # 作用对象
-    ip = db.Column(db.String(64), nullable=True)  # IP地址
-    ua = db.Column(db.Text, nullable=True)  # User-Agent
+    ip_bin = db.Column(VarBinary16, nullable=True)  # IP地址（IPv4 4 字节 / IPv6 16 字节）
+    ua_id = db.Column(db.Integer, nullable=True)  # User-Agent（user_agents.id；分区表不支持外键）
     context = db.Column(db.JSON, nullable=True)  # 上下文信息
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
+    # 索引均以 (created_at, id) 结尾，支持按 (created_at, id) 键集分页而无需排序
     # MySQL特定配置
-    __table_args__ = {
-        'mysql_engine': 'InnoDB',
-        'mysql_charset': 'utf8mb4',
-        'mysql_collate': 'utf8mb4_unicode_ci'
-    }
+    __table_args__ = (
+        db.Index('ix_audit_logs_created', 'created_at', 'id'),
+        db.Index('ix_audit_logs_actor_created', 'actor_user_id', 'created_at', 'id'),
+        db.Index('ix_audit_logs_action_created', 'action', 'created_at', 'id'),
+        db.Index('ix_audit_logs_ip_bin_created', 'ip_bin', 'created_at', 'id'),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+            'mysql_collate': 'utf8mb4_unicode_ci',
+            'sqlite_autoincrement': True
+        }
+    )
+    
+    user_agent = db.relationship('UserAgent', primaryjoin='foreign(AuditLog.ua_id) == UserAgent.id',
+                                 lazy='joined', viewonly=True)
+    
+    @property
+    def ip(self):
+        """IP 地址字符串"""
+        return ip_from_bytes(self.ip_bin)
+    
+    @property
+    def ua(self):
+        """User-Agent 字符串"""
+        return self.user_agent.ua if self.user_agent is not None else None
     
     @staticmethod
-    def log_action(user_id, action, target=None, ip=None, ua=None, context=None):
-        """记录审计日志"""
+    def log_action(user_id, action, target=None, ip=None, ua=None, context=None, deferred=None):
+        """
+        记录审计日志
+        启用异步写入（AUDIT_SINK_MODE=async）时交给后台批量写入并返回 None；
+        deferred=False 时强制加入当前会话，随调用方事务一起提交。
+        """
+        sink = current_app.extensions.get('audit_sink') if has_app_context() else None
+        if sink is not None and deferred is not False:
+            accepted = sink.submit({
+                'actor_user_id': user_id,
+                'action': action,
+                'target': target,
+                'ip': ip,
+                'ua': ua,
+                'context': context,
+            })
+            if accepted:
+                return None
+
+        route_to_id(user_id)
         log = AuditLog(
             actor_user_id=user_id,
             action=action,
             target=target,
-            ip=ip,
-            ua=ua,
+            ip_bin=ip_to_bytes(ip),
+            ua_id=user_agent_id(db.session, UserAgent.__table__, ua, get_user_agent_cache()),
             context=context
         )
         db.session.add(log)
@@ -170,13 +420,171 @@ class AuditLog(db.Model):
         return f'<AuditLog {self.action} by user {self.actor_user_id}>'
 
 
+def upsert(dialect_name, table, values, updates):
+    """
+    插入一行，主键冲突时按 updates（[(列, 表达式), ...]）更新，表达式中的列引用的是已有行的值。
+    MariaDB 按顺序赋值，后面的表达式会看到前面已更新的列，依赖旧值的列需排在前面。
+    """
+    if dialect_name in ('mysql', 'mariadb'):
+        return mysql.insert(table).values(values).on_duplicate_key_update(updates)
+    return sqlite.insert(table).values(values).on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_={column.name: value for column, value in updates},
+    )
+
+
+class UserLoginStats(db.Model):
+    """
+    用户登录统计表（每个用户一行，登录时在同一事务中增量更新）
+    失败次数按对齐的固定窗口计数，用“上一窗口 × 剩余比例 + 当前窗口”估算最近一个窗口内的失败次数。
+    """
+    __tablename__ = 'user_login_stats'
+    
+    id = db.Column(db.BigInteger, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    login_count = db.Column(db.Integer, nullable=False, default=0)  # 累计成功登录次数
+    failure_count = db.Column(db.Integer, nullable=False, default=0)  # 累计失败次数
+    consecutive_failures = db.Column(db.Integer, nullable=False, default=0)  # 上次成功后的连续失败次数
+    last_success_at = db.Column(db.DateTime, nullable=True)
+    last_success_ip = db.Column(VarBinary16, nullable=True)
+    last_failure_at = db.Column(db.DateTime, nullable=True)
+    failure_window_start = db.Column(db.BigInteger, nullable=False, default=0)  # 当前窗口起点（Unix 秒）
+    failures_previous = db.Column(db.Integer, nullable=False, default=0)  # 上一窗口失败次数
+    failures_current = db.Column(db.Integer, nullable=False, default=0)  # 当前窗口失败次数
+    
+    __table_args__ = (
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+            'mysql_collate': 'utf8mb4_unicode_ci'
+        },
+    )
+    
+    @staticmethod
+    def record_statement(dialect_name, user_id, success, ip=None, window=3600, now=None):
+        """生成累加一次登录结果的 upsert 语句（单条语句，不需要先读出统计行）"""
+        table = UserLoginStats.__table__
+        c = table.c
+        now = now or time.time()
+        at = datetime.utcfromtimestamp(now)
+        window_start = int(now // window) * window
+        values = {'id': user_id, 'failure_window_start': window_start}
+        if success:
+            ip_bin = ip_to_bytes(ip)
+            values.update(login_count=1, failure_count=0, consecutive_failures=0,
+                          last_success_at=at, last_success_ip=ip_bin,
+                          failures_previous=0, failures_current=0)
+            updates = [
+                (c.login_count, c.login_count + 1),
+                (c.consecutive_failures, 0),
+                (c.last_success_at, at),
+                (c.last_success_ip, ip_bin),
+            ]
+        else:
+            values.update(login_count=0, failure_count=1, consecutive_failures=1,
+                          last_failure_at=at, failures_previous=0, failures_current=1)
+            same_window = c.failure_window_start == window_start
+            updates = [
+                (c.failure_count, c.failure_count + 1),
+                (c.consecutive_failures, c.consecutive_failures + 1),
+                (c.last_failure_at, at),
+                # 跨入新窗口：相邻时上一窗口计数为旧的当前计数，否则清零
+                (c.failures_previous, case(
+                    (same_window, c.failures_previous),
+                    (c.failure_window_start == window_start - window, c.failures_current),
+                    else_=0,
+                )),
+                (c.failures_current, case((same_window, c.failures_current + 1), else_=1)),
+                (c.failure_window_start, window_start),
+            ]
+        return upsert(dialect_name, table, values, updates)
+    
+    def recent_failures(self, window=3600, now=None):
+        """估算最近一个窗口内的失败次数"""
+        now = now or time.time()
+        return sliding_window_estimate(self.failure_window_start, self.failures_previous,
+                                       self.failures_current, now, window)[3]
+    
+    def lockout_remaining(self, threshold, lockout_seconds, window=3600, now=None):
+        """最近失败次数达到阈值时返回剩余锁定秒数（自最后一次失败起算），否则返回 0"""
+        if not threshold or self.last_failure_at is None:
+            return 0
+        now = now or time.time()
+        if self.recent_failures(window, now) < threshold:
+            return 0
+        unlock_at = self.last_failure_at + timedelta(seconds=lockout_seconds)
+        remaining = (unlock_at - datetime.utcfromtimestamp(now)).total_seconds()
+        return max(0, int(remaining + 0.999))
+    
+    def to_dict(self, window=3600, sep='T'):
+        """转换为字典（sep 为时间中日期与时刻的分隔符）"""
+        return {
+            'login_count': self.login_count,
+            'failure_count': self.failure_count,
+            'consecutive_failures': self.consecutive_failures,
+            'recent_failures': int(self.recent_failures(window)),
+            'last_success_at': self.last_success_at.isoformat(sep) if self.last_success_at else None,
+            'last_success_ip': ip_from_bytes(self.last_success_ip),
+            'last_failure_at': self.last_failure_at.isoformat(sep) if self.last_failure_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<UserLoginStats {self.id}>'
+
+
+# 由数据库生成、不能直接写入的列
+GENERATED_INFO_COLUMNS = PROFILE_KEY_COLUMNS + ('email_norm', 'phone_norm')
+
+
+# SQLite 下用 FTS5 外部内容表为姓名/昵称提供全文检索，由触发器与 users_info 保持同步
+_USERS_INFO_FTS_DDL = (
+    "CREATE VIRTUAL TABLE users_info_fts USING fts5("
+    "full_name, display_name, content='users_info', content_rowid='id')",
+    "CREATE TRIGGER users_info_fts_ai AFTER INSERT ON users_info BEGIN "
+    "INSERT INTO users_info_fts(rowid, full_name, display_name) "
+    "VALUES (new.id, new.full_name, new.display_name); END",
+    "CREATE TRIGGER users_info_fts_ad AFTER DELETE ON users_info BEGIN "
+    "INSERT INTO users_info_fts(users_info_fts, rowid, full_name, display_name) "
+    "VALUES ('delete', old.id, old.full_name, old.display_name); END",
+    "CREATE TRIGGER users_info_fts_au AFTER UPDATE OF full_name, display_name ON users_info BEGIN "
+    "INSERT INTO users_info_fts(users_info_fts, rowid, full_name, display_name) "
+    "VALUES ('delete', old.id, old.full_name, old.display_name); "
+    "INSERT INTO users_info_fts(rowid, full_name, display_name) "
+    "VALUES (new.id, new.full_name, new.display_name); END",
+)
+for _statement in _USERS_INFO_FTS_DDL:
+    event.listen(UserInfo.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(UserInfo.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS users_info_fts').execute_if(dialect='sqlite'))
+
+
+class UserProfile(namedtuple('UserProfile', [
+    'user_id', 'login_type', 'user_type', 'status', 'created_at', 'updated_at',
+    'full_name', 'email', 'phone', 'display_name', 'age', 'gender', 'address', 'extra_profile',
+])):
+    """用户详情只读视图（仅包含详情页渲染的列）"""
+    __slots__ = ()
+
+
+# 详情视图对应的列（顺序与 UserProfile 字段一致）
+_PROFILE_COLUMNS = (
+    User.user_id, User.login_type, User.user_type, User.status, User.created_at, User.updated_at,
+    UserInfo.full_name, UserInfo.email, UserInfo.phone, UserInfo.display_name, UserInfo.age,
+    UserInfo.gender, UserInfo.address, UserInfo.extra_profile,
+)
+
+
 # 便捷的查询方法
 class UserService:
     """用户服务类，提供常用的用户操作方法"""
     
     @staticmethod
-    def create_user(user_id, password, login_type='email', user_type='passenger', **kwargs):
-        """创建用户"""
+    def create_user(user_id, password, login_type='email', user_type='passenger', info=None,
+                    ip=None, ua=None, **kwargs):
+        """创建用户（用户、详细信息与创建日志在同一事务中一次提交）"""
+        # 启用分片时写入账号应在的分片；迁移期间账号可能仍在其他分片，需要额外判重
+        if exists_on_other_shards(user_id):
+            raise UserAlreadyExistsError(user_id)
+        route_to_user(user_id)
         user = User(
             user_id=user_id,
             login_type=login_type,
@@ -186,44 +594,192 @@ class UserService:
         user.set_password(password)
         
         # 创建用户详细信息
-        user_info = UserInfo(id=user.id)
-        user.user_info = user_info
+        user.user_info = UserInfo(**(info or {}))
         
         db.session.add(user)
-        db.session.commit()
-        
-        # 记录创建日志
-        AuditLog.log_action(user.id, 'user_created')
+        # 刷新以获得 user.id，创建日志随同一事务提交
+        db.session.flush()
+        AuditLog.log_action(user.id, 'user_created', ip=ip, ua=ua, deferred=False)
+        mark_user_changed(user)
         db.session.commit()
         
         return user
     
+    @staticmethod
+    def register_user(user_id, password, login_type=None, user_type='passenger', ip=None, ua=None, **info):
+        """
+        注册用户：单事务一次提交。
+        不预先查询账号是否存在，而是依赖 users.user_id 的唯一索引，
+        冲突时抛出 UserAlreadyExistsError（同时避免“先查后插”的竞态）；其他约束冲突原样抛出。
+        """
+        if login_type is None:
+            login_type = 'email' if '@' in user_id else 'phone'
+        fields = {key: value for key, value in info.items()
+                  if hasattr(UserInfo, key) and key not in GENERATED_INFO_COLUMNS}
+        
+        try:
+            return UserService.create_user(
+                user_id=user_id,
+                password=password,
+                login_type=login_type,
+                user_type=user_type,
+                info=fields,
+                ip=ip,
+                ua=ua
+            )
+        except IntegrityError as e:
+            db.session.rollback()
+            if not is_duplicate_user_id(e):
+                raise
+            raise UserAlreadyExistsError(user_id) from e
+    
     @staticmethod
     def find_by_user_id(user_id):
-        """根据登录账号查找用户"""
-        return User.query.filter_by(user_id=user_id).first()
+        """根据登录账号查找用户（主库，返回会话内对象，用于写操作）"""
+        if not _might_exist(user_id):
+            return None
+        return with_user_shard(user_id, lambda: User.query.filter_by(user_id=user_id).first())
     
     @staticmethod
     def find_by_id(id):
-        """根据ID查找用户"""
+        """根据ID查找用户（主库，返回会话内对象，用于写操作）"""
+        route_to_id(id)
         return User.query.get(id)
     
     @staticmethod
-    def authenticate(user_id, password, ip=None, ua=None):
-        """用户认证"""
-        user = UserService.find_by_user_id(user_id)
+    def lookup_by_user_id(user_id):
+        """根据登录账号查找用户快照（读穿缓存，未命中时读副本；账号不存在返回 None）"""
+        if not _might_exist(user_id):
+            return None
+        cache = get_user_cache()
+        if cache is None:
+            return _read_user_snapshot_by_user_id(user_id)
         
-        if user and user.check_password(password) and user.is_active():
-            # 记录登录成功
-            AuditLog.log_action(user.id, 'login_success', ip=ip, ua=ua)
-            db.session.commit()
-            return user
+        found, snapshot = cache.get_by_user_id(user_id)
+        # 账号迁移到其他分片后，其他进程缓存的快照中仍是旧 id，按未命中处理
+        if found and (snapshot is None or is_home_id(user_id, snapshot.id)):
+            return snapshot
+        
+        generation = cache.generation
+        snapshot = _read_user_snapshot_by_user_id(user_id)
+        if snapshot is None:
+            cache.put_missing(generation, user_id=user_id)
         else:
-            # 记录登录失败
-            if user:
-                AuditLog.log_action(user.id, 'login_failed', ip=ip, ua=ua)
-            db.session.commit()
+            cache.put(snapshot, generation)
+        return snapshot
+    
+    @staticmethod
+    def lookup_by_id(id):
+        """根据ID查找用户快照（读穿缓存，未命中时读副本；用户不存在返回 None）"""
+        route_to_id(id)
+        cache = get_user_cache()
+        if cache is None:
+            return _read_user_snapshot(User.id == id)
+        
+        found, snapshot = cache.get_by_id(id)
+        if found:
+            return snapshot
+        
+        generation = cache.generation
+        snapshot = _read_user_snapshot(User.id == id)
+        if snapshot is None:
+            cache.put_missing(generation, id=id)
+        else:
+            cache.put(snapshot, generation)
+        return snapshot
+    
+    @staticmethod
+    def get_profile(user_id):
+        """查询用户详情（users 与 users_info 一次连接查询），返回 UserProfile，不存在返回 None"""
+        stmt = (
+            select(*_PROFILE_COLUMNS)
+            .outerjoin(UserInfo, UserInfo.id == User.id)
+            .where(User.user_id == user_id)
+        )
+        row = with_user_shard(user_id, lambda: run_read(lambda session: session.execute(stmt).first(), user_id))
+        return UserProfile._make(row) if row else None
+    
+    @staticmethod
+    def authenticate(user_id, password, ip=None, ua=None):
+        """
+        用户认证，成功返回用户快照（UserSnapshot）
+        登录统计与审计日志在同一事务中写入；配置了 LOGIN_LOCKOUT_THRESHOLD 时，
+        最近失败次数达到阈值的账号在锁定期内不再校验密码，直接抛出 AccountLockedError。
+        密码哈希与账号状态读主库，不使用缓存的快照。
+        登录统计有变化，提交后清空该账号各会话中缓存的详情快照（快照包含登录统计）。
+        """
+        if not _might_exist(user_id):
             return None
+        user = _read_primary_snapshot(user_id)
+        if user is None:
+            return None
+        
+        config = current_app.config
+        window = config.get('LOGIN_STATS_WINDOW', 3600)
+        threshold = config.get('LOGIN_LOCKOUT_THRESHOLD', 0)
+        if threshold:
+            stats = UserService.get_login_stats(user.id)
+            retry_after = stats.lockout_remaining(threshold, config.get('LOGIN_LOCKOUT_SECONDS', 900),
+                                                  window) if stats else 0
+            if retry_after:
+                raise AccountLockedError(retry_after)
+        
+        ok = user.check_password(password) and user.is_active()
+        route_to_id(user.id)
+        db.session.execute(UserLoginStats.record_statement(
+            db.session.get_bind().dialect.name, user.id, ok, ip=ip, window=window))
+        # 异步写入审计日志时，本事务只包含统计更新
+        AuditLog.log_action(user.id, 'login_success' if ok else 'login_failed', ip=ip, ua=ua)
+        db.session.commit()
+        store = get_session_store()
+        if store is not None:
+            store.clear_snapshots(user.user_id)
+        return user if ok else None
+    
+    @staticmethod
+    def get_login_stats(id):
+        """按用户数值ID读取登录统计（主键读取，读主库），没有登录记录时返回 None"""
+        route_to_id(id)
+        return db.session.get(UserLoginStats, id)
+
+    @staticmethod
+    def get_detail_snapshot(user_id, window=3600):
+        """
+        详情页所需的资料与登录统计（可 JSON 序列化，用于缓存在会话中），用户不存在时返回 None
+        users、users_info 与 user_login_stats 一次连接查询；时间统一格式化为“日期 时刻”。
+        """
+        stmt = (
+            select(*_PROFILE_COLUMNS, UserLoginStats)
+            .outerjoin(UserInfo, UserInfo.id == User.id)
+            .outerjoin(UserLoginStats, UserLoginStats.id == User.id)
+            .where(User.user_id == user_id)
+        )
+        row = with_user_shard(user_id, lambda: run_read(lambda session: session.execute(stmt).first(), user_id))
+        if row is None:
+            return None
+        *profile, stats = row
+        return {
+            'profile': {name: value.isoformat(' ') if isinstance(value, datetime) else value
+                        for name, value in zip(UserProfile._fields, profile)},
+            'login_stats': stats.to_dict(window, sep=' ') if stats else None,
+        }
+
+    @staticmethod
+    def record_login_throttled(scope, user_id, count, ip=None, ua=None):
+        """
+        记录一段时间内被限流拒绝的登录请求（汇总为一条）
+        按 IP 限流（scope='ip'）时被拒请求涉及许多账号，不查询账号，日志不关联用户（actor_user_id 为 NULL）；
+        按账号限流时记在该账号名下，账号不存在时不记录。
+        """
+        actor = None
+        if scope == 'account':
+            user = UserService.lookup_by_user_id(user_id)
+            if user is None:
+                return
+            actor = user.id
+        context = {'scope': scope, 'count': count}
+        if AuditLog.log_action(actor, 'login_throttled', ip=ip, ua=ua, context=context) is not None:
+            db.session.commit()
     
     @staticmethod
     def update_user_info(user_id, **kwargs):
@@ -236,8 +792,59 @@ class UserService:
             user.user_info = UserInfo(id=user.id)
         
         for key, value in kwargs.items():
-            if hasattr(user.user_info, key):
+            if hasattr(user.user_info, key) and key not in GENERATED_INFO_COLUMNS:
                 setattr(user.user_info, key, value)
         
+        mark_user_changed(user)
+        db.session.commit()
+        return user
+    
+    @staticmethod
+    def update_extra_profile(user_id, **keys):
+        """批量修改扩展资料中的若干键（一条 JSON_SET 更新，不读出整个文档），返回用户快照"""
+        user = _read_primary_snapshot(user_id) if _might_exist(user_id) else None
+        if not user:
+            return None
+        
+        route_to_id(user.id)
+        result = db.session.execute(
+            update(UserInfo)
+            .where(UserInfo.id == user.id)
+            .values(extra_profile=json_set(UserInfo.extra_profile, keys))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            # 尚无详细信息记录
+            db.session.add(UserInfo(id=user.id, extra_profile=dict(keys)))
+        
+        mark_user_changed(user)
+        db.session.commit()
+        return user
+    
+    @staticmethod
+    def find_by_profile_key(key, value, limit=100):
+        """按扩展资料中已建索引的键查找用户（如驾照号），返回 UserProfile 列表"""
+        if key not in PROFILE_KEY_COLUMNS:
+            raise ValueError(f'扩展资料键未建立索引: {key}')
+        stmt = (
+            select(*_PROFILE_COLUMNS)
+            .join(UserInfo, UserInfo.id == User.id)
+            .where(getattr(UserInfo, key) == value)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        # 各分片 id 区间按分片顺序递增，依次拼接即为按 id 排序
+        rows = [row for rows in scatter_read(lambda session: session.execute(stmt).all()) for row in rows]
+        return [UserProfile._make(row) for row in rows[:limit]]
+    
+    @staticmethod
+    def set_status(user_id, status):
+        """修改账号状态（active/disabled/pending）"""
+        user = UserService.find_by_user_id(user_id)
+        if not user:
+            return None
+        
+        user.status = status
+        mark_user_changed(user, revoke_sessions=True)
         db.session.commit()
         return user
\ No newline at end of file
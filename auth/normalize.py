@@ -0,0 +1,62 @@
+"""
+邮箱与手机号的规范化
+同一规则既用于数据库生成列（建索引供前缀查询），也用于规范化查询输入，两边必须一致：
+- 邮箱：去掉首尾空白并转小写；
+- 手机号：只保留数字（去掉 +、空格、横线、括号、点）。
+"""
+
+import re
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from sqlalchemy.types import String
+
+# SQLite 没有正则替换，逐个去掉手机号中常见的分隔字符
+PHONE_SEPARATORS = ('+', ' ', '-', '(', ')', '.')
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_phone(value):
+    return re.sub(r'[^0-9]', '', value or '')
+
+
+class normalized_email(ColumnElement):
+    """规范化邮箱的 SQL 表达式（用于生成列，列名按字面写入 DDL）"""
+    inherit_cache = True
+    type = String()
+    _traverse_internals = [('column_name', InternalTraversal.dp_string)]
+
+    def __init__(self, column_name):
+        self.column_name = column_name
+
+
+@compiles(normalized_email)
+def _compile_normalized_email(element, compiler, **kw):
+    return f'lower(trim({element.column_name}))'
+
+
+class normalized_phone(ColumnElement):
+    """规范化手机号的 SQL 表达式（用于生成列，列名按字面写入 DDL）"""
+    inherit_cache = True
+    type = String()
+    _traverse_internals = [('column_name', InternalTraversal.dp_string)]
+
+    def __init__(self, column_name):
+        self.column_name = column_name
+
+
+@compiles(normalized_phone)
+def _compile_normalized_phone(element, compiler, **kw):
+    expression = element.column_name
+    for char in PHONE_SEPARATORS:
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+
+@compiles(normalized_phone, 'mysql')
+def _compile_normalized_phone_mysql(element, compiler, **kw):
+    return f"REGEXP_REPLACE({element.column_name}, '[^0-9]', '')"
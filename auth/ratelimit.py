@@ -0,0 +1,228 @@
+"""
+登录限流
+在密码哈希与任何数据库写入之前，按账号和客户端 IP 做滑动窗口计数，超限直接拒绝。
+- 滑动窗口用“上一窗口计数 × 剩余比例 + 当前窗口计数”估算，每个键只需常数空间；
+- memory 后端为进程内字典；sqlite 后端把计数放在本机 SQLite 文件中，多个 worker 进程共享；
+- 被拒绝的请求不逐条写审计日志，按触发拒绝的限流键（IP 或账号）每个窗口最多写一条 login_throttled，
+  记录期间累计拒绝次数；按 IP 汇总时轮换账号的撞库请求不会逐个账号产生记录。
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+BACKENDS = ('memory', 'sqlite')
+
+# allowed: 是否放行；scope: 触发限流的维度（account/ip）；retry_after: 建议重试秒数
+RateLimitDecision = namedtuple('RateLimitDecision', ['allowed', 'scope', 'retry_after'])
+
+ALLOWED = RateLimitDecision(True, None, 0)
+
+
+def sliding_window_estimate(window_start, prev_count, curr_count, now, window):
+    """按滑动窗口估算当前请求数，返回 (当前窗口起点, 上一窗口计数, 当前窗口计数, 估算值)"""
+    current = int(now // window) * window
+    if window_start != current:
+        # 跨入新窗口：相邻时上一窗口计数为旧的当前计数，否则清零
+        prev_count = curr_count if window_start == current - window else 0
+        curr_count = 0
+        window_start = current
+    weight = 1.0 - (now - current) / window
+    return window_start, prev_count, curr_count, prev_count * weight + curr_count
+
+
+class MemoryBackend:
+    """进程内计数"""
+
+    def __init__(self):
+        # 键 -> (窗口起点, 上一窗口计数, 当前窗口计数)，按最后一次计数的先后排列
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        """未超限时计数并返回 True，超限返回 False（不计数）"""
+        with self._lock:
+            start, prev, curr = self._counters.get(key, (0, 0, 0))
+            start, prev, curr, estimated = sliding_window_estimate(start, prev, curr, now, window)
+            allowed = estimated < limit
+            if allowed:
+                curr += 1
+            self._counters[key] = (start, prev, curr)
+            self._counters.move_to_end(key)
+            self._prune(now, window)
+            return allowed
+
+    def reset(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def _prune(self, now, window):
+        # 两个窗口之前的计数已不影响估算；最久未计数的键在最前，逐个弹出即可，不遍历整个字典
+        expired = now - 2 * window
+        counters = self._counters
+        while counters:
+            key, value = next(iter(counters.items()))
+            if value[0] > expired:
+                break
+            del counters[key]
+
+    def prune(self, window, now=None):
+        """接口与 SQLiteBackend 一致；计数时已逐步清理"""
+        with self._lock:
+            self._prune(time.time() if now is None else now, window)
+
+
+class SQLiteBackend:
+    """基于本机 SQLite 文件的计数，供同一主机上的多个 worker 共享"""
+
+    def __init__(self, path, busy_timeout=1.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS login_rate_limits ('
+            'key TEXT PRIMARY KEY, window_start REAL NOT NULL, '
+            'prev_count INTEGER NOT NULL, curr_count INTEGER NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS login_rate_limits_window ON login_rate_limits (window_start)')
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程使用，fork 后也需重新打开
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, limit, window, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_start, prev_count, curr_count FROM login_rate_limits WHERE key = ?', (key,)
+            ).fetchone()
+            start, prev, curr, estimated = sliding_window_estimate(*(row or (0, 0, 0)), now, window)
+            allowed = estimated < limit
+            if allowed:
+                curr += 1
+            conn.execute(
+                'INSERT OR REPLACE INTO login_rate_limits (key, window_start, prev_count, curr_count) '
+                'VALUES (?, ?, ?, ?)', (key, start, prev, curr)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed
+
+    def reset(self, key):
+        self._connect().execute('DELETE FROM login_rate_limits WHERE key = ?', (key,))
+
+    def prune(self, window, now=None):
+        """删除已过期的计数（LoginRateLimiter 每个窗口调用一次）"""
+        now = time.time() if now is None else now
+        self._connect().execute('DELETE FROM login_rate_limits WHERE window_start <= ?', (now - 2 * window,))
+
+
+class LoginRateLimiter:
+    """按账号与 IP 的登录限流"""
+
+    def __init__(self, backend, window=60.0, account_limit=10, ip_limit=50):
+        self.backend = backend
+        self.window = float(window)
+        self.account_limit = account_limit
+        self.ip_limit = ip_limit
+        # 限流键（scope:key）-> [本窗口已写日志的截止时间, 未写入日志的拒绝次数]，按最后一次被拒绝的先后排列
+        self._throttled = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def check(self, user_id, ip=None, now=None):
+        """登录前检查，放行时计入窗口；先查 IP 再查账号，被 IP 拒绝的请求不消耗账号额度"""
+        now = time.time() if now is None else now
+        self._maybe_prune(now)
+        if ip and self.ip_limit and not self.backend.hit(f'ip:{ip}', self.ip_limit, self.window, now):
+            return self._reject('ip', now)
+        if self.account_limit and not self.backend.hit(f'account:{user_id}', self.account_limit, self.window, now):
+            return self._reject('account', now)
+        return ALLOWED
+
+    def _maybe_prune(self, now):
+        # 每个窗口最多清理一次存储中的过期计数；其他线程正在清理时直接跳过
+        if now < self._next_prune or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.window
+        finally:
+            self._lock.release()
+        self.backend.prune(self.window, now)
+
+    def reset_account(self, user_id):
+        """登录成功后清空该账号的计数"""
+        self.backend.reset(f'account:{user_id}')
+
+    def _reject(self, scope, now):
+        retry_after = max(1, math.ceil(self.window - now % self.window))
+        return RateLimitDecision(False, scope, retry_after)
+
+    def record_throttled(self, scope, key, now=None):
+        """
+        汇总被拒绝的请求：scope 为拒绝结果中的维度（ip/account），key 为对应的 IP 或账号。
+        同一限流键每个窗口最多返回一次累计次数（应写入审计日志），其余返回 None。
+        攻击结束时尚未写入的零头会计入该键下一个窗口内被限流时的记录，之后不再被限流则丢弃。
+        """
+        now = time.time() if now is None else now
+        key = f'{scope}:{key}'
+        with self._lock:
+            self._prune_throttled(now)
+            state = self._throttled.get(key)
+            if state is None:
+                state = self._throttled[key] = [0.0, 0]
+            else:
+                self._throttled.move_to_end(key)
+            state[1] += 1
+            if now < state[0]:
+                return None
+            count, state[1] = state[1], 0
+            state[0] = now + self.window
+            return count
+
+    def _prune_throttled(self, now):
+        # 截止时间已过去一个窗口的键最近一个窗口内未被拒绝，从最早的开始逐个弹出
+        expired = now - self.window
+        throttled = self._throttled
+        while throttled:
+            key, state = next(iter(throttled.items()))
+            if state[0] > expired:
+                break
+            del throttled[key]
+
+
+def init_login_rate_limiter(app):
+    """根据配置为应用启用登录限流"""
+    if not app.config.get('LOGIN_RATE_LIMIT_ENABLED', True):
+        return None
+    backend_name = app.config.get('LOGIN_RATE_LIMIT_BACKEND', 'memory')
+    if backend_name not in BACKENDS:
+        raise ValueError(f'未知的限流存储: {backend_name}')
+    if backend_name == 'sqlite':
+        backend = SQLiteBackend(app.config.get('LOGIN_RATE_LIMIT_PATH') or 'login_rate_limits.db')
+    else:
+        backend = MemoryBackend()
+    limiter = LoginRateLimiter(
+        backend,
+        window=app.config.get('LOGIN_RATE_LIMIT_WINDOW', 60),
+        account_limit=app.config.get('LOGIN_RATE_LIMIT_ACCOUNT', 10),
+        ip_limit=app.config.get('LOGIN_RATE_LIMIT_IP', 50),
+    )
+    app.extensions['login_rate_limiter'] = limiter
+    return limiter
@@ -0,0 +1,120 @@
+"""
+读副本路由
+只读查询（返回快照/视图、不返回会话内 ORM 对象的方法）发往只读副本，按轮询或最少连接选择；
+写入之后的一段时间内（read-your-writes），同一账号/同一浏览器会话的读取仍走主库，
+避免刚注册就登录时读到尚未同步的副本。
+"""
+
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context, has_request_context, session as flask_session
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = 'replica_'
+STRATEGIES = ('round_robin', 'least_loaded')
+
+# 浏览器会话中记录“主库粘滞截止时间”的键
+SESSION_PIN_KEY = '_db_primary_until'
+
+
+class ReplicaRouter:
+    """副本选择与读写粘滞"""
+
+    def __init__(self, engines, strategy='round_robin', sticky_seconds=5.0):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'未知的副本选择策略: {strategy}')
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.sticky_seconds = float(sticky_seconds)
+        self._counter = itertools.count()
+        self._pinned = {}  # 登录账号 -> 粘滞截止时间
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """选择一个副本引擎"""
+        if self.strategy == 'least_loaded':
+            return min(self.engines, key=lambda engine: engine.pool.checkedout()
+                       if hasattr(engine.pool, 'checkedout') else 0)
+        return self.engines[next(self._counter) % len(self.engines)]
+
+    def mark_written(self, user_id=None):
+        """记录一次写入：该账号与当前浏览器会话在粘滞窗口内读主库"""
+        until = time.time() + self.sticky_seconds
+        if user_id is not None:
+            with self._lock:
+                self._pinned[user_id] = until
+                # 顺带清理过期记录，避免无限增长
+                if len(self._pinned) > 10000:
+                    now = time.time()
+                    self._pinned = {k: v for k, v in self._pinned.items() if v > now}
+        if has_request_context():
+            flask_session[SESSION_PIN_KEY] = until
+
+    def is_pinned(self, user_id=None):
+        """当前读取是否应走主库"""
+        now = time.time()
+        if has_request_context() and flask_session.get(SESSION_PIN_KEY, 0) > now:
+            return True
+        if user_id is not None:
+            with self._lock:
+                return self._pinned.get(user_id, 0) > now
+        return False
+
+
+def init_replicas(app):
+    """根据 SQLALCHEMY_BINDS 中的 replica_* 配置启用读副本路由"""
+    keys = sorted(key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                  if key and key.startswith(REPLICA_BIND_PREFIX))
+    if not keys:
+        return None
+    with app.app_context():
+        engines = [db.engines[key] for key in keys]
+    router = ReplicaRouter(
+        engines,
+        strategy=app.config.get('DB_REPLICA_STRATEGY', 'round_robin'),
+        sticky_seconds=app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5.0),
+    )
+    app.extensions['replica_router'] = router
+    return router
+
+
+def get_replica_router():
+    """返回当前应用的副本路由，未配置副本时返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('replica_router')
+
+
+@contextmanager
+def read_session(user_id=None):
+    """只读会话：有可用副本且未处于粘滞窗口时绑定副本，否则为主库会话"""
+    router = get_replica_router()
+    if router is None or router.is_pinned(user_id):
+        yield db.session
+        return
+    session = Session(bind=router.choose())
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def run_read(fn, user_id=None):
+    """在只读会话中执行 fn(session)；副本查询失败时回退到主库，主库查询失败直接抛出（不重试）"""
+    with read_session(user_id) as session:
+        if session is db.session:
+            return fn(session)
+        try:
+            return fn(session)
+        except OperationalError:
+            logger.warning('读副本查询失败，回退到主库', exc_info=True)
+    return fn(db.session)
@@ -0,0 +1,144 @@
+"""
+分片迁移（reshard）
+在 SHARD_URIS 末尾追加分片后，按账号重新计算应在的分片，把不在应在分片上的用户迁移过去：
+- 逐个源分片按 id 键集扫描 users，每批只读取 batch_size 个用户；
+- 每批按目标分片分组，在目标分片的一个事务中写入 users（获得目标分片区间内的新 id）、
+  users_info（生成列由数据库计算）、user_login_stats 与该用户的审计日志（流式读取，
+  User-Agent 在目标分片的字典表中重新编码）；
+- 目标事务提交后再从源分片删除，中断后重复执行即可：目标分片已有的账号不再复制，只删除源分片中的残留；
+- 迁移后用户 id 改变：吊销这些用户的登录会话（会话中保存了旧 id）并使缓存失效，
+  其他进程缓存中的旧 id 不在账号应在的分片上，使用前会被识别并重新查询。
+SHARD_LOOKUP_FALLBACK 默认关闭，迁移期间（追加分片到迁移完成）所有进程都须设为 1，未迁移的账号仍可在源分片查到；
+每批复制与删除之间写入源分片的审计日志会随源数据一起删除，建议在低峰期执行。
+"""
+
+from sqlalchemy import delete, insert, select
+
+from .models import AuditLog, User, UserAgent, UserInfo, UserLoginStats, invalidate_user
+from .sharding import get_shard_router
+from .useragents import intern_user_agents
+
+
+def _copy_columns(table):
+    """可直接复制的列（不含生成列）"""
+    return [column for column in table.c if column.computed is None]
+
+
+def _move_users(source, target, ids, batch_size):
+    """将源分片中的一批用户迁移到目标分片，返回 (迁移的用户数, 复制的日志数)"""
+    users = User.__table__
+    info = UserInfo.__table__
+    stats = UserLoginStats.__table__
+    logs = AuditLog.__table__
+    ua_table = UserAgent.__table__
+
+    with source.connect() as src, target.begin() as dst:
+        rows = src.execute(select(users).where(users.c.id.in_(ids))).mappings().all()
+        existing = set(dst.execute(
+            select(users.c.user_id).where(users.c.user_id.in_([row['user_id'] for row in rows]))
+        ).scalars())
+        # 上次中断时已复制的账号以目标分片为准
+        rows = [row for row in rows if row['user_id'] not in existing]
+        if not rows:
+            return 0, 0
+
+        dst.execute(insert(users), [{key: value for key, value in row.items() if key != 'id'} for row in rows])
+        new_ids = dict(dst.execute(
+            select(users.c.user_id, users.c.id).where(users.c.user_id.in_([row['user_id'] for row in rows]))
+        ).all())
+        id_map = {row['id']: new_ids[row['user_id']] for row in rows}
+        moved = list(id_map)
+
+        for table in (info, stats):
+            columns = _copy_columns(table)
+            copied = [
+                dict(row, id=id_map[row['id']])
+                for row in src.execute(select(*columns).where(table.c.id.in_(moved))).mappings()
+            ]
+            if copied:
+                dst.execute(insert(table), copied)
+
+        log_columns = [column for column in logs.c if column.name not in ('id', 'ua_id')]
+        result = src.execute(
+            select(*log_columns, ua_table.c.ua)
+            .select_from(logs.outerjoin(ua_table, ua_table.c.id == logs.c.ua_id))
+            .where(logs.c.actor_user_id.in_(moved))
+            .order_by(logs.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        count = 0
+        try:
+            for chunk in result.mappings().partitions():
+                ua_ids = intern_user_agents(dst, ua_table, [row['ua'] for row in chunk])
+                dst.execute(insert(logs), [
+                    {
+                        **{column.name: row[column.name] for column in log_columns},
+                        'actor_user_id': id_map[row['actor_user_id']],
+                        'ua_id': ua_ids.get(row['ua']),
+                    }
+                    for row in chunk
+                ])
+                count += len(chunk)
+        finally:
+            result.close()
+    return len(rows), count
+
+
+def _delete_users(source, ids):
+    """从源分片删除已迁移（或已存在于目标分片）的用户及其关联数据"""
+    with source.begin() as conn:
+        conn.execute(delete(AuditLog.__table__).where(AuditLog.__table__.c.actor_user_id.in_(ids)))
+        conn.execute(delete(UserLoginStats.__table__).where(UserLoginStats.__table__.c.id.in_(ids)))
+        conn.execute(delete(UserInfo.__table__).where(UserInfo.__table__.c.id.in_(ids)))
+        conn.execute(delete(User.__table__).where(User.__table__.c.id.in_(ids)))
+
+
+def reshard(batch_size=500, dry_run=False, progress=None):
+    """
+    将所有用户迁移到其账号应在的分片（需在应用上下文中调用）。
+    返回 {'scanned': 扫描的用户数, 'moved': 迁移的用户数, 'logs': 复制的日志数}；
+    dry_run 时只统计需要迁移的用户数。progress(分片名, 统计) 在每批之后调用。
+    """
+    router = get_shard_router()
+    if router is None:
+        raise RuntimeError('未启用分片（SHARD_URIS）')
+    users = User.__table__
+    stats = {'scanned': 0, 'moved': 0, 'logs': 0}
+
+    for source_name in router.names:
+        source = router.engines[source_name]
+        last_id = 0
+        while True:
+            with source.connect() as conn:
+                rows = conn.execute(
+                    select(users.c.id, users.c.user_id)
+                    .where(users.c.id > last_id)
+                    .order_by(users.c.id)
+                    .limit(batch_size)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            stats['scanned'] += len(rows)
+
+            groups = {}
+            for id, user_id in rows:
+                home = router.home(user_id)
+                if home != source_name:
+                    groups.setdefault(home, []).append((id, user_id))
+
+            for target_name, members in groups.items():
+                ids = [id for id, _ in members]
+                if dry_run:
+                    stats['moved'] += len(ids)
+                    continue
+                moved, logs = _move_users(source, router.engines[target_name], ids, batch_size)
+                _delete_users(source, ids)
+                stats['moved'] += moved
+                stats['logs'] += logs
+                for id, user_id in members:
+                    invalidate_user(user_id, id, revoke_sessions=True)
+
+            if progress is not None:
+                progress(source_name, dict(stats))
+    return stats
@@ -0,0 +1,284 @@
+"""
+审计日志保留与归档
+- MariaDB：audit_logs 按月 RANGE 分区（TO_DAYS(created_at)），过期分区导出后直接 DROP PARTITION；
+- SQLite（测试）：没有分区，按自然月视为逻辑分区，导出后分批 DELETE。
+归档文件为按月的 gzip JSONL（audit_logs-YYYYMM.jsonl.gz），导出与读取都是流式的，内存占用固定；
+最早的分区没有下界，早于该月写入（如导入的历史日志）的记录也在其中，随该月一起导出与删除；
+归档中的 ip/ua 为解码后的字符串，不依赖 user_agents 字典表。
+各函数作用于 db.session 当前路由的数据库；启用分片时归档按分片写入归档目录下的同名子目录。
+"""
+
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from .models import db, AuditLog, UserAgent
+from .sharding import SHARD_BIND_PREFIX, on_shard, shard_names
+from .useragents import ip_from_bytes
+
+ARCHIVE_PATTERN = re.compile(r'^audit_logs-(\d{4})(\d{2})\.jsonl\.gz$')
+PARTITION_PATTERN = re.compile(r'^p(\d{4})(\d{2})$')
+
+
+def _is_mysql():
+    return db.session.get_bind().dialect.name in ('mysql', 'mariadb')
+
+
+def month_start(value):
+    """返回所在月份的第一天"""
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value):
+    """返回下个月的第一天"""
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1)
+    return datetime(value.year, value.month + 1, 1)
+
+
+def partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def archive_filename(month):
+    return f'audit_logs-{month:%Y%m}.jsonl.gz'
+
+
+def _partition_clause(month):
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{next_month(month):%Y-%m-%d}'))"
+
+
+def list_partitions():
+    """
+    返回按月的分区列表 [(名称, 月份起始), ...]，按时间升序。
+    MariaDB 读取 information_schema；SQLite 按现有数据推算逻辑分区。
+    """
+    if _is_mysql():
+        rows = db.session.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'audit_logs' AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        )).scalars().all()
+        partitions = []
+        for name in rows:
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+        return partitions
+
+    oldest = db.session.execute(select(func.min(AuditLog.created_at))).scalar()
+    if oldest is None:
+        return []
+    partitions = []
+    month = month_start(oldest)
+    current = month_start(datetime.utcnow())
+    while month <= current:
+        partitions.append((partition_name(month), month))
+        month = next_month(month)
+    return partitions
+
+
+def enable_partitioning(months_ahead=3):
+    """
+    将 audit_logs 转为按月分区（仅 MariaDB）。
+    分区表不支持外键，且主键必须包含分区列，因此会删除外键并把主键改为 (id, created_at)。
+    """
+    if not _is_mysql():
+        return False
+    if list_partitions():
+        return True
+
+    foreign_keys = db.session.execute(text(
+        "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+        "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'audit_logs'"
+    )).scalars().all()
+    for name in foreign_keys:
+        db.session.execute(text(f'ALTER TABLE audit_logs DROP FOREIGN KEY `{name}`'))
+    db.session.execute(text('ALTER TABLE audit_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)'))
+
+    oldest = db.session.execute(select(func.min(AuditLog.created_at))).scalar() or datetime.utcnow()
+    last = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = next_month(last)
+
+    clauses = []
+    month = month_start(oldest)
+    while month <= last:
+        clauses.append(_partition_clause(month))
+        month = next_month(month)
+    clauses.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    db.session.execute(text(
+        'ALTER TABLE audit_logs PARTITION BY RANGE (TO_DAYS(created_at)) (' + ', '.join(clauses) + ')'
+    ))
+    db.session.commit()
+    return True
+
+
+def ensure_partitions(months_ahead=3):
+    """预建未来若干个月的分区（仅 MariaDB，建议每天定时执行），返回新建的分区名"""
+    if not _is_mysql():
+        return []
+    partitions = list_partitions()
+    if not partitions:
+        raise RuntimeError('audit_logs 尚未分区，请先执行 config/migrations/002_audit_log_partitioning.sql')
+
+    created = []
+    month = next_month(partitions[-1][1])
+    last = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    while month <= last:
+        db.session.execute(text(
+            f'ALTER TABLE audit_logs REORGANIZE PARTITION pmax INTO ('
+            f'{_partition_clause(month)}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+        ))
+        created.append(partition_name(month))
+        month = next_month(month)
+    db.session.commit()
+    return created
+
+
+def _row_to_json(row):
+    data = dict(row._mapping)
+    data['ip'] = ip_from_bytes(data.pop('ip_bin'))
+    data['created_at'] = data['created_at'].isoformat() if data['created_at'] else None
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _month_range(table, month, include_older):
+    """某个月（include_older 时包括更早）的日志条件"""
+    if include_older:
+        return (table.c.created_at < next_month(month),)
+    return (table.c.created_at >= month, table.c.created_at < next_month(month))
+
+
+def export_month(month, archive_dir, batch_size=5000, include_older=False):
+    """
+    将某个月的审计日志流式导出为 gzip JSONL，返回 (文件路径, 条数)
+    include_older 为 True 时一并导出更早的日志（导出最早的分区时使用，与分区的实际范围一致）。
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, archive_filename(month))
+    tmp = f'{path}.tmp'
+
+    table = AuditLog.__table__
+    ua_table = UserAgent.__table__
+    stmt = (
+        select(table.c.id, table.c.actor_user_id, table.c.action, table.c.target,
+               table.c.ip_bin, ua_table.c.ua, table.c.context, table.c.created_at)
+        .select_from(table.outerjoin(ua_table, ua_table.c.id == table.c.ua_id))
+        .where(*_month_range(table, month, include_older))
+        .order_by(table.c.created_at, table.c.id)
+        .execution_options(yield_per=batch_size)
+    )
+    count = 0
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        result = db.session.execute(stmt)
+        try:
+            for row in result:
+                f.write(_row_to_json(row))
+                f.write('\n')
+                count += 1
+        finally:
+            result.close()
+    # 写完后再改名，避免读取到不完整的归档
+    os.replace(tmp, path)
+    return path, count
+
+
+def drop_month(month, batch_size=5000, include_older=False):
+    """
+    删除某个月（include_older 时包括更早）的审计日志：MariaDB 删除分区，SQLite 分批 DELETE。
+    MariaDB 分区中有早于该月的日志而 include_older 为 False 时，这些日志未被导出，拒绝删除。
+    """
+    if _is_mysql():
+        name = partition_name(month)
+        if not include_older and db.session.execute(
+            text(f'SELECT 1 FROM audit_logs PARTITION ({name}) WHERE created_at < :month LIMIT 1'),
+            {'month': month},
+        ).first():
+            raise RuntimeError(f'分区 {name} 中有早于 {month:%Y-%m} 的日志，请使用 include_older 导出后再删除')
+        db.session.execute(text(f'ALTER TABLE audit_logs DROP PARTITION {name}'))
+        db.session.commit()
+        return
+
+    table = AuditLog.__table__
+    while True:
+        ids = db.session.execute(
+            select(table.c.id)
+            .where(*_month_range(table, month, include_older))
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        db.session.commit()
+
+
+def archive_old_logs(older_than_days, archive_dir, batch_size=5000, dry_run=False):
+    """
+    归档并删除早于 older_than_days 天的整月审计日志（启用分片时逐个分片处理）。
+    返回 [(分区名, 归档文件, 条数), ...]
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = []
+    for shard in shard_names():
+        directory = os.path.join(archive_dir, shard) if shard else archive_dir
+        with on_shard(shard):
+            for name, month in list_partitions():
+                if next_month(month) > cutoff:
+                    break
+                if dry_run:
+                    archived.append((f'{shard}/{name}' if shard else name, None, None))
+                    continue
+                # 前面的分区都已删除，当前分区是最早的，包含更早的日志
+                path, count = export_month(month, directory, batch_size=batch_size, include_older=True)
+                drop_month(month, batch_size=batch_size, include_older=True)
+                archived.append((name, path, count))
+    return archived
+
+
+def _archive_files(archive_dir):
+    """归档目录（及分片子目录）中的归档文件 [(月份, 路径), ...]"""
+    directories = [archive_dir]
+    for name in os.listdir(archive_dir):
+        path = os.path.join(archive_dir, name)
+        if name.startswith(SHARD_BIND_PREFIX) and os.path.isdir(path):
+            directories.append(path)
+    files = []
+    for directory in directories:
+        for filename in os.listdir(directory):
+            match = ARCHIVE_PATTERN.match(filename)
+            if match:
+                files.append((datetime(int(match.group(1)), int(match.group(2)), 1), os.path.join(directory, filename)))
+    return files
+
+
+def iter_archived_logs(archive_dir, actor_user_id=None, action=None, ip=None, since=None, until=None):
+    """按条件流式读取归档的审计日志（字典），按月份升序（包括各分片子目录中的归档）"""
+    if not os.path.isdir(archive_dir):
+        return
+
+    for month, path in sorted(_archive_files(archive_dir)):
+        # 跳过与时间范围无交集的月份（归档中可能有早于该月的日志，不能按 until 跳过）
+        if since and next_month(month) <= since:
+            continue
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                log = json.loads(line)
+                if actor_user_id is not None and log['actor_user_id'] != actor_user_id:
+                    continue
+                if action and log['action'] != action:
+                    continue
+                if ip and log['ip'] != ip:
+                    continue
+                created_at = datetime.fromisoformat(log['created_at']) if log['created_at'] else None
+                if since and (created_at is None or created_at < since):
+                    continue
+                if until and (created_at is None or created_at >= until):
+                    continue
+                yield log
@@ -0,0 +1,166 @@
+"""
+用户检索（客服/管理员）
+- 邮箱、手机号：对规范化后的生成列做前缀匹配，按 (规范化值, id) 的索引顺序扫描并键集分页；
+- 姓名、昵称：全文检索（MariaDB FULLTEXT 布尔模式，SQLite FTS5），结果按 id 键集分页；
+  内置分词器按空白切分，连续的中日韩文字是一个词，短于 SEARCH_FULLTEXT_MIN_TOKEN_SIZE 的词不被索引，
+  因此含中日韩文字或过短的关键词改为对 full_name 索引做前缀匹配（只匹配姓名开头，不匹配昵称）；
+- 可按 user_type、status 过滤；不带关键词时按 (user_type, status, id) 索引顺序列出。
+每页只读取 limit + 1 行，不使用 OFFSET，翻页耗时与页码无关。
+启用分片时各分片各取一页，按相同的排序键合并后截取。
+"""
+
+import base64
+import heapq
+import json
+import re
+
+from flask import current_app
+from sqlalchemy import literal_column, select, text
+from sqlalchemy.dialects.mysql import match
+
+from .models import User, UserInfo
+from .normalize import normalize_email, normalize_phone
+from .sharding import scatter_read
+
+MAX_PAGE_SIZE = 200
+
+SEARCH_FIELDS = ('email', 'phone', 'name')
+
+# 检索结果的列（名称, 列）
+RESULT_COLUMNS = (
+    ('id', User.id),
+    ('user_id', User.user_id),
+    ('login_type', User.login_type),
+    ('user_type', User.user_type),
+    ('status', User.status),
+    ('created_at', User.created_at),
+    ('full_name', UserInfo.full_name),
+    ('display_name', UserInfo.display_name),
+    ('email', UserInfo.email),
+    ('phone', UserInfo.phone),
+)
+
+# MariaDB 布尔模式中有特殊含义的字符
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+# 中日韩文字（假名、汉字、韩文音节）
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def guess_field(q):
+    """根据关键词猜测检索字段：含 @ 为邮箱，数字（可带分隔符）为手机号，否则为姓名"""
+    if '@' in q:
+        return 'email'
+    if normalize_phone(q) and re.fullmatch(r'[0-9+\-() .]+', q.strip()):
+        return 'phone'
+    return 'name'
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError
+        return values
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+
+def _escape_like(value):
+    # 使用 ! 作为转义符，避免反斜杠在 MariaDB 字符串中的二次转义
+    return value.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def use_name_prefix(q, min_token_size=3):
+    """姓名关键词是否改用 full_name 前缀匹配：含中日韩文字，或有词短于全文索引的最短词长"""
+    return bool(_CJK.search(q)) or any(len(term) < min_token_size for term in q.split())
+
+
+def _fulltext_condition(dialect_name, q):
+    terms = [term for term in q.split() if term]
+    if dialect_name == 'mysql':
+        # 每个词都必须出现，并按前缀匹配
+        words = [_BOOLEAN_OPERATORS.sub(' ', term).strip() for term in terms]
+        query = ' '.join(f'+{word}*' for word in words if word)
+        return match(UserInfo.full_name, UserInfo.display_name, against=query).in_boolean_mode()
+    # FTS5：每个词加引号按字面匹配，* 表示前缀
+    query = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    fts_ids = (
+        select(literal_column('rowid'))
+        .select_from(text('users_info_fts'))
+        .where(text('users_info_fts MATCH :fts_query').bindparams(fts_query=query))
+    )
+    return UserInfo.id.in_(fts_ids)
+
+
+def search_users(q=None, field=None, user_type=None, status=None, cursor=None, limit=50):
+    """
+    检索用户，返回 (结果字典列表, 下一页游标)；没有更多数据时游标为 None。
+    field 为 email/phone/name，不指定时根据 q 猜测。
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    q = (q or '').strip()
+    if q and field is None:
+        field = guess_field(q)
+    if field is not None and field not in SEARCH_FIELDS:
+        raise ValueError(f'未知的检索字段: {field}')
+    after = _decode_cursor(cursor) if cursor else None
+    name_prefix = field == 'name' and use_name_prefix(q, current_app.config.get('SEARCH_FULLTEXT_MIN_TOKEN_SIZE', 3))
+
+    columns = [column.label(name) for name, column in RESULT_COLUMNS]
+    base = select(*columns).select_from(User).join(UserInfo, UserInfo.id == User.id)
+    if user_type:
+        base = base.where(User.user_type == user_type)
+    if status:
+        base = base.where(User.status == status)
+
+    def query(session):
+        stmt = base
+        sort_column = None
+        if q and field in ('email', 'phone'):
+            sort_column = UserInfo.email_norm if field == 'email' else UserInfo.phone_norm
+            prefix = normalize_email(q) if field == 'email' else normalize_phone(q)
+            stmt = stmt.where(sort_column.like(_escape_like(prefix) + '%', escape='!'))
+        elif q and name_prefix:
+            stmt = stmt.where(UserInfo.full_name.like(_escape_like(q) + '%', escape='!'))
+        elif q:
+            stmt = stmt.where(_fulltext_condition(session.get_bind().dialect.name, q))
+
+        if sort_column is not None:
+            stmt = stmt.add_columns(sort_column.label('_sort')).order_by(sort_column, UserInfo.id)
+            if after is not None:
+                value, id = after
+                stmt = stmt.where((sort_column > value) | ((sort_column == value) & (UserInfo.id > id)))
+        else:
+            stmt = stmt.order_by(User.id)
+            if after is not None:
+                stmt = stmt.where(User.id > after[1])
+        return session.execute(stmt.limit(limit + 1)).all()
+
+    pages = scatter_read(query)
+    if len(pages) == 1:
+        rows = pages[0]
+    else:
+        by_sort = q and field in ('email', 'phone')
+        rows = list(heapq.merge(*pages, key=(lambda row: (row._sort, row.id)) if by_sort else (lambda row: row.id)))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    results = []
+    for row in rows:
+        item = {name: getattr(row, name) for name, _ in RESULT_COLUMNS}
+        if item['created_at'] is not None:
+            item['created_at'] = item['created_at'].isoformat()
+        results.append(item)
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = _encode_cursor([getattr(last, '_sort', None), last.id])
+    return results, next_cursor
@@ -0,0 +1,416 @@
+"""
+服务端会话
+Flask 默认把会话签名后整体放在 Cookie 中，服务端无法吊销，也无法在会话上附加缓存。
+SESSION_BACKEND 不为 cookie 时，Cookie 中只保存随机会话 ID，会话数据存放在服务端：
+- memory 为进程内字典（单进程/测试）；sqlite 为本机 SQLite 文件，同一主机上的多个 worker 共享；
+  其他存储（如 Redis）实现 SessionStore 抽象接口的全部方法后传给 init_sessions 即可；
+- 会话附带用户详情快照（cached_user_snapshot），/detail 在快照有效期内不查询数据库；
+  用户资料变更提交或登录（快照含登录统计）后清空其所有会话的快照，账号状态或密码变更后吊销其全部会话；
+- 请求结束时已有会话只在仍存在时更新，请求处理期间被吊销的会话不会被写回；
+- 闲置超过 SESSION_IDLE_TIMEOUT 秒的会话失效；只读请求最多每 SESSION_TOUCH_INTERVAL 秒续期一次，
+  过期会话由后台线程每 SESSION_SWEEP_INTERVAL 秒清理。
+"""
+
+import atexit
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from flask import current_app, has_app_context, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('cookie', 'memory', 'sqlite')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """服务端会话（内容修改后整体写回存储）"""
+
+    def __init__(self, initial=None, sid=None, snapshot=None, expires_at=0.0):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.previous_sid = None
+        self.snapshot = snapshot  # {'loaded_at': 时间戳, 'value': 快照}
+        self.snapshot_modified = False
+        self.expires_at = expires_at
+        self.modified = False
+
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.snapshot_modified = True
+
+    def regenerate(self):
+        """清空会话并在保存时更换会话 ID（登录与退出时调用，防止会话固定）"""
+        if self.sid is not None:
+            self.previous_sid = self.sid
+            self.sid = None
+        self.snapshot = None
+        self.clear()
+        self.modified = True
+
+
+class SessionStore(ABC):
+    """
+    会话存储接口。data 为序列化后的会话内容，snapshot 为序列化后的快照（可为 None），
+    user_id 为会话所属的登录账号（未登录为 None），用于按用户吊销。
+    """
+
+    @abstractmethod
+    def load(self, sid, now):
+        """返回未过期会话的 (data, snapshot, expires_at)，不存在时返回 None"""
+
+    @abstractmethod
+    def save(self, sid, user_id, data, snapshot, expires_at):
+        """保存新会话"""
+
+    @abstractmethod
+    def update(self, sid, user_id, data, snapshot, expires_at):
+        """更新已有会话；会话已不存在（被吊销或删除）时不写入并返回 False"""
+
+    @abstractmethod
+    def touch(self, sid, expires_at):
+        """只延长有效期（会话不存在时不写入）"""
+
+    @abstractmethod
+    def delete(self, sid):
+        """删除会话"""
+
+    @abstractmethod
+    def revoke_user(self, user_id):
+        """删除某个用户的全部会话"""
+
+    @abstractmethod
+    def clear_snapshots(self, user_id):
+        """清空某个用户全部会话中的快照（会话仍有效，下次访问时重新加载）"""
+
+    @abstractmethod
+    def sweep(self, now):
+        """删除过期会话，返回删除数"""
+
+    def after_fork(self):
+        """fork 出的子进程中调用"""
+
+
+class MemorySessionStore(SessionStore):
+    """进程内会话存储（多 worker 部署时各进程不共享）"""
+
+    def __init__(self):
+        self._sessions = {}  # 会话 ID -> [user_id, data, snapshot, expires_at]
+        self._by_user = {}   # user_id -> {会话 ID}
+        self._lock = threading.Lock()
+
+    def load(self, sid, now):
+        with self._lock:
+            item = self._sessions.get(sid)
+            if item is None or item[3] <= now:
+                return None
+            return item[1], item[2], item[3]
+
+    def save(self, sid, user_id, data, snapshot, expires_at):
+        with self._lock:
+            self._remove(sid)
+            self._sessions[sid] = [user_id, data, snapshot, expires_at]
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(sid)
+
+    def update(self, sid, user_id, data, snapshot, expires_at):
+        with self._lock:
+            if sid not in self._sessions:
+                return False
+            self._remove(sid)
+            self._sessions[sid] = [user_id, data, snapshot, expires_at]
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(sid)
+            return True
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            item = self._sessions.get(sid)
+            if item is not None:
+                item[3] = expires_at
+
+    def delete(self, sid):
+        with self._lock:
+            self._remove(sid)
+
+    def _remove(self, sid):
+        item = self._sessions.pop(sid, None)
+        if item is not None and item[0] is not None:
+            sids = self._by_user.get(item[0])
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_user[item[0]]
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            sids = self._by_user.pop(user_id, ())
+            for sid in sids:
+                self._sessions.pop(sid, None)
+            return len(sids)
+
+    def clear_snapshots(self, user_id):
+        with self._lock:
+            for sid in self._by_user.get(user_id, ()):
+                self._sessions[sid][2] = None
+
+    def sweep(self, now):
+        with self._lock:
+            expired = [sid for sid, item in self._sessions.items() if item[3] <= now]
+            for sid in expired:
+                self._remove(sid)
+            return len(expired)
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+
+class SQLiteSessionStore(SessionStore):
+    """基于本机 SQLite 文件的会话存储，供同一主机上的多个 worker 共享"""
+
+    def __init__(self, path, busy_timeout=1.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'sid TEXT PRIMARY KEY, user_id TEXT, data TEXT NOT NULL, snapshot TEXT, expires_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_sessions_user_id ON sessions (user_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)')
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程使用，fork 后也需重新打开
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, sid, now):
+        return self._connect().execute(
+            'SELECT data, snapshot, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, now)
+        ).fetchone()
+
+    def save(self, sid, user_id, data, snapshot, expires_at):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO sessions (sid, user_id, data, snapshot, expires_at) VALUES (?, ?, ?, ?, ?)',
+            (sid, user_id, data, snapshot, expires_at)
+        )
+
+    def update(self, sid, user_id, data, snapshot, expires_at):
+        return self._connect().execute(
+            'UPDATE sessions SET user_id = ?, data = ?, snapshot = ?, expires_at = ? WHERE sid = ?',
+            (user_id, data, snapshot, expires_at, sid)
+        ).rowcount > 0
+
+    def touch(self, sid, expires_at):
+        self._connect().execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+    def delete(self, sid):
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def revoke_user(self, user_id):
+        return self._connect().execute('DELETE FROM sessions WHERE user_id = ?', (user_id,)).rowcount
+
+    def clear_snapshots(self, user_id):
+        self._connect().execute(
+            'UPDATE sessions SET snapshot = NULL WHERE user_id = ? AND snapshot IS NOT NULL', (user_id,)
+        )
+
+    def sweep(self, now):
+        return self._connect().execute('DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    """Cookie 只保存会话 ID，会话内容读写 SessionStore"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, idle_timeout=1800, touch_interval=60, snapshot_ttl=300):
+        self.store = store
+        self.idle_timeout = float(idle_timeout)
+        self.touch_interval = min(float(touch_interval), self.idle_timeout)
+        self.snapshot_ttl = float(snapshot_ttl)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.store.load(sid, time.time())
+            if record is not None:
+                data, snapshot, expires_at = record
+                return ServerSession(self.serializer.loads(data), sid=sid,
+                                     snapshot=json.loads(snapshot) if snapshot else None,
+                                     expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                session.sid = None
+            if session.sid is None and session.modified:
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       httponly=httponly, samesite=samesite)
+            return
+
+        response.vary.add('Cookie')
+        now = time.time()
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        expires_at = now + self.idle_timeout
+        if new or session.modified or session.snapshot_modified:
+            snapshot = json.dumps(session.snapshot, separators=(',', ':')) if session.snapshot else None
+            args = (session.sid, session.get('user_id'), self.serializer.dumps(dict(session)), snapshot, expires_at)
+            if new:
+                self.store.save(*args)
+            elif not self.store.update(*args):
+                # 请求处理期间会话已被吊销：不重新写回，让浏览器丢弃会话 ID
+                session.sid = None
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       httponly=httponly, samesite=samesite)
+                return
+        elif session.expires_at - now <= self.idle_timeout - self.touch_interval:
+            # 只读请求按间隔续期，避免每个请求都写存储
+            self.store.touch(session.sid, expires_at)
+        else:
+            return
+
+        if new or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+
+
+class SessionSweeper:
+    """定期删除过期会话的后台线程"""
+
+    def __init__(self, store, interval=60.0):
+        self.store = store
+        self.interval = float(interval)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                removed = self.store.sweep(time.time())
+                if removed:
+                    logger.debug('清理过期会话 %d 个', removed)
+            except Exception:
+                logger.exception('清理过期会话失败')
+
+    def after_fork(self):
+        """fork 出的子进程中调用：重建存储的锁并重新启动清理线程"""
+        self.store.after_fork()
+        self._stop = threading.Event()
+        self._thread = None
+        self.start()
+
+    def close(self):
+        self._stop.set()
+
+
+def login_session(user):
+    """登录成功后写入会话（服务端会话同时更换会话 ID）"""
+    if isinstance(session, ServerSession):
+        session.regenerate()
+    session['user_id'] = user.user_id
+    session['user_type'] = user.user_type
+    # 数值ID：退出登录写日志时不需要再按账号查询
+    session['id'] = user.id
+
+
+def end_session():
+    """退出登录：清空会话（服务端会话删除原会话并更换会话 ID）"""
+    if isinstance(session, ServerSession):
+        session.regenerate()
+    else:
+        session.clear()
+
+
+def cached_user_snapshot(loader):
+    """
+    返回会话中缓存的用户详情快照；没有快照或已超过 SESSION_SNAPSHOT_TTL 秒时调用 loader() 重新加载并写回会话。
+    使用 Cookie 会话时每次都调用 loader()。
+    """
+    if not isinstance(session, ServerSession):
+        return loader()
+    now = time.time()
+    snapshot = session.snapshot
+    if snapshot is not None and now - snapshot['loaded_at'] < current_app.session_interface.snapshot_ttl:
+        return snapshot['value']
+    value = loader()
+    if value is not None:
+        session.set_snapshot({'loaded_at': now, 'value': value})
+    return value
+
+
+def init_sessions(app, store=None):
+    """根据配置启用服务端会话；传入 store 时使用该存储（如外部的 Redis 实现）"""
+    backend = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend not in BACKENDS:
+        raise ValueError(f'未知的会话存储: {backend}')
+    if store is None:
+        if backend == 'cookie':
+            return None
+        if backend == 'sqlite':
+            store = SQLiteSessionStore(app.config.get('SESSION_PATH') or 'sessions.db')
+        else:
+            store = MemorySessionStore()
+    app.session_interface = ServerSessionInterface(
+        store,
+        idle_timeout=app.config.get('SESSION_IDLE_TIMEOUT', 1800),
+        touch_interval=app.config.get('SESSION_TOUCH_INTERVAL', 60),
+        snapshot_ttl=app.config.get('SESSION_SNAPSHOT_TTL', 300),
+    )
+    sweeper = SessionSweeper(store, interval=app.config.get('SESSION_SWEEP_INTERVAL', 60))
+    sweeper.start()
+    app.extensions['session_store'] = store
+    app.extensions['session_sweeper'] = sweeper
+    atexit.register(sweeper.close)
+    return store
+
+
+def get_session_store():
+    """返回当前应用的服务端会话存储，使用 Cookie 会话时返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('session_store')
+
+
+def revoke_user_sessions(user_id):
+    """吊销某个用户的全部会话，返回吊销数（使用 Cookie 会话时无法吊销，返回 0）"""
+    store = get_session_store()
+    return store.revoke_user(user_id) if store is not None else 0
@@ -0,0 +1,285 @@
+"""
+按登录账号水平分片（可选）
+配置 SHARD_URIS（逗号分隔）后，users、users_info、user_login_stats、audit_logs 与 user_agents 分布在多个数据库中：
+- 账号所在分片由登录账号的最高随机权重哈希（rendezvous hashing）决定，
+  在末尾增加分片时只有约 1/N 的账号需要迁移（init_db.py reshard）；
+- 第 i 个分片的自增 id 从 i × SHARD_ID_SPAN 开始，各分片 id 区间互不重叠：
+  由用户 id 即可算出分片，用户缓存、审计日志的 actor_user_id 与分页游标在全局唯一；
+- UserService 访问前把 db.session 路由到账号所在分片（在本次会话内保持，直到下次路由）；
+  管理端列表、检索与导出在各分片的独立会话中分别查询后合并（scatter-gather）；
+- 迁移期间（SHARD_LOOKUP_FALLBACK）按账号在应在的分片查不到时，依次查找其他分片。
+分片只能在末尾追加，不能删除或调整顺序（顺序决定 id 区间）。
+未配置 SHARD_URIS 时，各函数退化为使用默认数据库（及读副本）。
+"""
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from .database import SHARD_ENGINE_KEY, SHARD_KEY, db
+from .replicas import read_session, run_read
+
+SHARD_BIND_PREFIX = 'shard_'
+
+# 每个分片的 id 区间大小
+SHARD_ID_SPAN = 10 ** 12
+
+# 自增 id 需要按分片错开的表
+ID_RANGE_TABLES = ('users', 'audit_logs')
+
+
+class ShardRouter:
+    """分片定位：账号 -> 分片（rendezvous hashing），用户 id -> 分片（id 区间）"""
+
+    def __init__(self, engines, fallback=False):
+        """engines 为 [(分片名, 引擎), ...]，顺序决定 id 区间"""
+        self.names = [name for name, _ in engines]
+        self.engines = dict(engines)
+        self.fallback = fallback
+        self.ua_caches = {}  # 分片名 -> UserAgentCache（字典 id 各分片独立）
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def home(self, user_id):
+        """账号应在的分片"""
+        key = user_id.encode('utf-8')
+        return max(self.names, key=lambda name: hashlib.blake2b(
+            key, digest_size=8, key=name.encode('utf-8')).digest())
+
+    def shard_of_id(self, id):
+        """用户（或审计日志）id 所在的分片"""
+        index = (int(id) - 1) // SHARD_ID_SPAN
+        if not 0 <= index < len(self.names):
+            raise ValueError(f'id 不属于任何分片: {id}')
+        return self.names[index]
+
+    def id_base(self, name):
+        """分片自增 id 的起点（不含）"""
+        return self.names.index(name) * SHARD_ID_SPAN
+
+    def others(self, name):
+        return [other for other in self.names if other != name]
+
+    def map(self, fn, names=None):
+        """在各分片上并行执行 fn(分片名)，按分片顺序返回结果"""
+        names = list(names or self.names)
+        if len(names) == 1:
+            return [fn(names[0])]
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self.names), thread_name_prefix='shard')
+            executor = self._executor
+        return list(executor.map(fn, names))
+
+    def after_fork(self):
+        """fork 出的子进程中调用：丢弃父进程的线程池"""
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        for cache in self.ua_caches.values():
+            cache.after_fork()
+
+
+def shard_binds(uris):
+    """由分片连接串列表生成 SQLALCHEMY_BINDS"""
+    return {f'{SHARD_BIND_PREFIX}{i}': uri for i, uri in enumerate(uris)}
+
+
+def init_shards(app):
+    """根据 SQLALCHEMY_BINDS 中的 shard_* 配置启用分片路由"""
+    keys = sorted((key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                   if key and key.startswith(SHARD_BIND_PREFIX)),
+                  key=lambda key: int(key[len(SHARD_BIND_PREFIX):]))
+    if not keys:
+        return None
+    if app.extensions.get('replica_router') is not None:
+        raise ValueError('分片（SHARD_URIS）与读副本（DB_REPLICA_URIS）不能同时启用')
+    with app.app_context():
+        engines = [(key, db.engines[key]) for key in keys]
+    router = ShardRouter(engines, fallback=app.config.get('SHARD_LOOKUP_FALLBACK', False))
+    app.extensions['shard_router'] = router
+    return router
+
+
+def get_shard_router():
+    """返回当前应用的分片路由，未启用分片时返回 None"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('shard_router')
+
+
+def current_shard():
+    """db.session 当前路由到的分片名，未路由时返回 None"""
+    return db.session.info.get(SHARD_KEY)
+
+
+def route(name):
+    """将 db.session 路由到分片（保持到下次路由或会话结束）；未启用分片时不做任何事"""
+    router = get_shard_router()
+    if router is not None and name is not None:
+        info = db.session.info
+        info[SHARD_KEY] = name
+        info[SHARD_ENGINE_KEY] = router.engines[name]
+    return name
+
+
+def route_to_id(id):
+    """将 db.session 路由到用户 id 所在的分片"""
+    router = get_shard_router()
+    if router is not None and id is not None:
+        return route(router.shard_of_id(id))
+    return None
+
+
+def route_to_user(user_id):
+    """将 db.session 路由到账号应在的分片"""
+    router = get_shard_router()
+    if router is not None:
+        return route(router.home(user_id))
+    return None
+
+
+@contextmanager
+def on_shard(name):
+    """临时将 db.session 路由到分片，退出时恢复原路由"""
+    info = db.session.info
+    previous = info.get(SHARD_KEY), info.get(SHARD_ENGINE_KEY)
+    route(name)
+    try:
+        yield
+    finally:
+        if previous[0] is None:
+            info.pop(SHARD_KEY, None)
+            info.pop(SHARD_ENGINE_KEY, None)
+        else:
+            info[SHARD_KEY], info[SHARD_ENGINE_KEY] = previous
+
+
+def with_user_shard(user_id, fn):
+    """
+    在账号所在分片执行 fn()。结果为 None 且允许回退（迁移期间）时依次在其他分片执行，
+    db.session 保持路由到找到账号的分片，后续写入无需再次定位。
+    """
+    router = get_shard_router()
+    if router is None:
+        return fn()
+    home = route(router.home(user_id))
+    result = fn()
+    if result is None and router.fallback:
+        for name in router.others(home):
+            route(name)
+            result = fn()
+            if result is not None:
+                return result
+        route(home)
+    return result
+
+
+def is_home_id(user_id, id):
+    """
+    用户 id 是否位于账号应在的分片；迁移（reshard）后会话或其他进程缓存中残留的旧 id 返回 False，
+    调用方应按账号重新查询。未启用分片时总为 True。
+    """
+    router = get_shard_router()
+    if router is None or id is None:
+        return True
+    try:
+        return router.shard_of_id(id) == router.home(user_id)
+    except ValueError:
+        return False
+
+
+def shard_names():
+    """分片名列表；未启用分片时为 [None]（表示默认数据库）"""
+    router = get_shard_router()
+    return list(router.names) if router is not None else [None]
+
+
+def shard_engine(name):
+    """分片的引擎；name 为 None 时为默认引擎"""
+    if name is None:
+        return db.engine
+    return get_shard_router().engines[name]
+
+
+@contextmanager
+def shard_session(name):
+    """分片上的独立会话（用于跨分片读取）；name 为 None 时为只读会话（可能是读副本）"""
+    if name is None:
+        with read_session() as session:
+            yield session
+        return
+    session = Session(bind=get_shard_router().engines[name])
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def scatter_read(fn):
+    """
+    在每个分片的独立会话中并行执行 fn(session)，按分片顺序返回结果列表；
+    未启用分片时等同于 [run_read(fn)]。
+    """
+    router = get_shard_router()
+    if router is None:
+        return [run_read(fn)]
+
+    def task(name):
+        session = Session(bind=router.engines[name])
+        try:
+            return fn(session)
+        finally:
+            session.close()
+
+    return router.map(task)
+
+
+def set_id_base(engine, base):
+    """设置分片自增 id 的起点（只会调大）；SQLite 需要表使用 AUTOINCREMENT"""
+    if base <= 0:
+        return
+    with engine.begin() as conn:
+        for table in ID_RANGE_TABLES:
+            if engine.dialect.name in ('mysql', 'mariadb'):
+                # 小于当前最大 id 时 MariaDB 会忽略
+                conn.execute(text(f'ALTER TABLE {table} AUTO_INCREMENT = {int(base) + 1}'))
+                continue
+            params = {'name': table, 'base': int(base)}
+            conn.execute(text('UPDATE sqlite_sequence SET seq = :base WHERE name = :name AND seq < :base'), params)
+            conn.execute(text(
+                'INSERT INTO sqlite_sequence (name, seq) SELECT :name, :base '
+                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'
+            ), params)
+
+
+def create_shard_tables(drop=False):
+    """在每个分片上建表并设置 id 区间（drop=True 时先删除已有表，仅用于开发环境）"""
+    router = get_shard_router()
+    for name in router.names:
+        engine = router.engines[name]
+        if drop:
+            db.metadata.drop_all(engine)
+        db.metadata.create_all(engine)
+        set_id_base(engine, router.id_base(name))
+
+
+def exists_on_other_shards(user_id):
+    """账号是否存在于应在分片之外的分片（迁移期间注册时防止重复）"""
+    router = get_shard_router()
+    if router is None or not router.fallback:
+        return False
+    others = router.others(router.home(user_id))
+    if not others:
+        return False
+    stmt = text('SELECT 1 FROM users WHERE user_id = :user_id').bindparams(bindparam('user_id', user_id))
+
+    def task(name):
+        with router.engines[name].connect() as conn:
+            return conn.execute(stmt).first() is not None
+
+    return any(router.map(task, others))
@@ -0,0 +1,177 @@
+"""
+审计日志中 IP 与 User-Agent 的紧凑存储
+- IP：IPv4/IPv6 统一转为网络字节序的二进制（4 或 16 字节，与 MariaDB 的 INET6_ATON 一致），存入 VARBINARY(16)；
+- User-Agent：去重后存入 user_agents 字典表（按内容摘要唯一），审计日志只保存其 id；
+  进程内缓存 UA -> id，常见的 UA 写日志时不需要查询字典表。
+缓存只写入已提交的字典项，事务回滚不会在缓存中留下不存在的 id；启用分片时各分片的字典与缓存相互独立。
+"""
+
+import hashlib
+import ipaddress
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+from .database import SHARD_KEY, db
+
+# 会话中待写入缓存的字典项（事务提交后写入）
+_PENDING_KEY = 'user_agent_cache_pending'
+
+
+def ip_to_bytes(ip):
+    """将 IP 字符串转为二进制；X-Forwarded-For 取第一个地址，无法解析时返回 None"""
+    if not ip:
+        return None
+    try:
+        return ipaddress.ip_address(ip.split(',')[0].strip()).packed
+    except ValueError:
+        return None
+
+
+def ip_from_bytes(value):
+    """将二进制 IP 还原为字符串"""
+    if not value:
+        return None
+    return str(ipaddress.ip_address(bytes(value)))
+
+
+def ua_digest(ua):
+    """User-Agent 的内容摘要（字典表的唯一键）"""
+    return hashlib.blake2b(ua.encode('utf-8', 'replace'), digest_size=16).digest()
+
+
+class UserAgentCache:
+    """User-Agent -> id 的进程内 LRU 缓存"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = max(1, int(maxsize))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ua):
+        with self._lock:
+            id = self._data.get(ua)
+            if id is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(ua)
+            self.hits += 1
+            return id
+
+    def update(self, mapping):
+        """写入已提交的 {UA: id}"""
+        with self._lock:
+            for ua, id in mapping.items():
+                self._data[ua] = id
+                self._data.move_to_end(ua)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def after_fork(self):
+        """fork 出的子进程中调用：缓存内容仍然有效，只重建锁"""
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+def intern_user_agents(conn, table, uas):
+    """
+    返回 {UA: id}；字典表中没有的 UA 先插入。
+    并发插入同一 UA 时由唯一索引去重（INSERT IGNORE），插入后重新查询得到 id。
+    """
+    digests = {ua_digest(ua): ua for ua in set(uas) if ua}
+    if not digests:
+        return {}
+
+    def fetch(keys):
+        rows = conn.execute(select(table.c.ua_hash, table.c.id).where(table.c.ua_hash.in_(keys))).all()
+        return {digests[bytes(ua_hash)]: id for ua_hash, id in rows}
+
+    found = fetch(list(digests))
+    missing = [digest for digest, ua in digests.items() if ua not in found]
+    if missing:
+        now = datetime.utcnow()
+        stmt = insert(table).prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite')
+        conn.execute(stmt, [{'ua_hash': digest, 'ua': digests[digest], 'created_at': now} for digest in missing])
+        found.update(fetch(missing))
+    return found
+
+
+def encode_audit_rows(conn, table, rows, cache=None):
+    """
+    将 ip/ua 为字符串的审计日志行转换为 ip_bin/ua_id（用于批量写入）。
+    返回 (转换后的行, 本次从字典表查到的 {UA: id})，后者应在事务提交后写入缓存。
+    """
+    ids = {}
+    missing = set()
+    for row in rows:
+        ua = row.get('ua')
+        if ua and ua not in ids and ua not in missing:
+            id = cache.get(ua) if cache is not None else None
+            if id is None:
+                missing.add(ua)
+            else:
+                ids[ua] = id
+    learned = intern_user_agents(conn, table, missing) if missing else {}
+    ids.update(learned)
+
+    encoded = []
+    for row in rows:
+        row = dict(row)
+        ua = row.pop('ua', None)
+        row['ip_bin'] = ip_to_bytes(row.pop('ip', None))
+        row['ua_id'] = ids.get(ua) if ua else None
+        encoded.append(row)
+    return encoded, learned
+
+
+def user_agent_id(session, table, ua, cache=None):
+    """在会话中解析 UA 的 id：先查进程缓存，未命中时查询/插入字典表，所在事务提交后写入缓存"""
+    if not ua:
+        return None
+    id = cache.get(ua) if cache is not None else None
+    if id is None:
+        id = intern_user_agents(session.connection(), table, [ua])[ua]
+        if cache is not None:
+            session.info.setdefault(_PENDING_KEY, []).append((cache, {ua: id}))
+    return id
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_user_agents(session):
+    for cache, mapping in session.info.pop(_PENDING_KEY, ()):
+        cache.update(mapping)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_user_agents(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def init_user_agent_cache(app):
+    """为应用创建 User-Agent id 缓存（启用分片时每个分片一个）"""
+    maxsize = app.config.get('AUDIT_UA_CACHE_SIZE', 4096)
+    cache = UserAgentCache(maxsize=maxsize)
+    app.extensions['user_agent_cache'] = cache
+    router = app.extensions.get('shard_router')
+    if router is not None:
+        router.ua_caches = {name: UserAgentCache(maxsize=maxsize) for name in router.names}
+    return cache
+
+
+def get_user_agent_cache(shard=None):
+    """返回 User-Agent id 缓存：启用分片时为指定分片（默认 db.session 当前路由的分片）的缓存"""
+    if not has_app_context():
+        return None
+    router = current_app.extensions.get('shard_router')
+    if router is not None:
+        return router.ua_caches.get(shard or db.session.info.get(SHARD_KEY))
+    return current_app.extensions.get('user_agent_cache')
@@ -1,9 +1,32 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-from .models import db, User, UserInfo, AuditLog, UserService
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify
+from .models import db, User, UserInfo, AuditLog, UserService, UserAlreadyExistsError, AccountLockedError
+from .hashing import HashingBusyError
+from .audit import query_audit_logs
+from .search import search_users
+from .sessions import end_session, login_session
+from .sharding import is_home_id
 
 # 创建蓝图（指定本蓝图的模板目录）
 auth_bp = Blueprint('auth', __name__, template_folder='templates')
 
+
+def role_required(*user_types):
+    """限制 API 只能由指定类型的已登录用户访问"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not session.get('user_id'):
+                return jsonify({'ok': False, 'error': 'unauthorized', 'detail': '请先登录'}), 401
+            if session.get('user_type') not in user_types:
+                return jsonify({'ok': False, 'error': 'forbidden', 'detail': '没有访问权限'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 # page
 @auth_bp.route('/login', methods=['GET'])
 def page_login():
@@ -17,38 +40,45 @@ def page_register():
         full_name = request.form.get('full_name', '')
         email = request.form.get('email', '')
         
-        # 检查用户是否已存在
-        existing_user = UserService.find_by_user_id(user_id)
-        if existing_user:
+        # 判断登录类型
+        login_type = 'email' if '@' in user_id else 'phone'
+        
+        # 详细信息（与原流程一致：填写了姓名或邮箱时才写入）
+        info = {}
+        if full_name or email:
+            info = {
+                'full_name': full_name,
+                'email': email if email else (user_id if login_type == 'email' else None),
+                'phone': user_id if login_type == 'phone' else None
+            }
+        
+        ip = request.remote_addr
+        ua = request.headers.get('User-Agent')
+        
+        try:
+            # 单事务创建用户、详细信息与创建日志，依赖唯一索引判重
+            UserService.register_user(
+                user_id=user_id,
+                password=password,
+                login_type=login_type,
+                user_type='passenger',
+                ip=ip,
+                ua=ua,
+                **info
+            )
+            
+            flash('注册成功！请登录。', 'success')
+            return redirect(url_for('auth.page_login'))
+            
+        except UserAlreadyExistsError:
             flash('用户名已存在！', 'error')
-        else:
-            try:
-                # 判断登录类型
-                login_type = 'email' if '@' in user_id else 'phone'
-                
-                # 创建用户
-                user = UserService.create_user(
-                    user_id=user_id,
-                    password=password,
-                    login_type=login_type,
-                    user_type='passenger'
-                )
-                
-                # 更新用户详细信息
-                if full_name or email:
-                    UserService.update_user_info(
-                        user_id=user_id,
-                        full_name=full_name,
-                        email=email if email else (user_id if login_type == 'email' else None),
-                        phone=user_id if login_type == 'phone' else None
-                    )
-                
-                flash('注册成功！请登录。', 'success')
-                return redirect(url_for('auth.page_login'))
-                
-            except Exception as e:
-                db.session.rollback()
-                flash(f'注册失败：{str(e)}', 'error')
+        except HashingBusyError:
+            db.session.rollback()
+            flash('系统繁忙，请稍后重试。', 'error')
+            return render_template('register.html'), 503
+        except Exception as e:
+            db.session.rollback()
+            flash(f'注册失败：{str(e)}', 'error')
     
     return render_template('register.html')
 
@@ -67,17 +97,47 @@ def api_login():
             'detail': '用户名或密码不能为空'
         }), 400
 
-    ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
+    ip = request.remote_addr
     ua = request.headers.get('User-Agent')
 
-    user = UserService.authenticate(user_id, password, ip=ip, ua=ua)
+    # 限流在哈希与写库之前执行，撞库请求不消耗 CPU 与审计日志
+    limiter = current_app.extensions.get('login_rate_limiter')
+    if limiter is not None:
+        decision = limiter.check(user_id, ip)
+        if not decision.allowed:
+            # 按触发拒绝的键汇总：IP 限流不按账号拆分，也不查询账号
+            count = limiter.record_throttled(decision.scope, ip if decision.scope == 'ip' else user_id)
+            if count:
+                UserService.record_login_throttled(decision.scope, user_id, count, ip=ip, ua=ua)
+            return jsonify({
+                'ok': False,
+                'error': 'too_many_attempts',
+                'detail': '尝试次数过多，请稍后重试'
+            }), 429, {'Retry-After': str(decision.retry_after)}
+
+    try:
+        user = UserService.authenticate(user_id, password, ip=ip, ua=ua)
+    except HashingBusyError:
+        db.session.rollback()
+        return jsonify({
+            'ok': False,
+            'error': 'server_busy',
+            'detail': '系统繁忙，请稍后重试'
+        }), 503, {'Retry-After': '1'}
+    except AccountLockedError as e:
+        return jsonify({
+            'ok': False,
+            'error': 'account_locked',
+            'detail': '登录失败次数过多，账号已暂时锁定，请稍后重试'
+        }), 429, {'Retry-After': str(e.retry_after)}
     if user:
+        if limiter is not None:
+            limiter.reset_account(user_id)
         # 设置会话
-        session['user_id'] = user.user_id
-        session['user_type'] = user.user_type
+        login_session(user)
         return jsonify({
             'ok': True,
-            'redirect': url_for('index')
+            'redirect': url_for('main.index')
         })
     else:
         return jsonify({
@@ -90,19 +150,77 @@ def api_login():
 def api_logout():
     user_login = session.get('user_id')
     if user_login:
-        # 记录退出日志（需要将登录名转换为用户数值ID）
-        ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
+        # 记录退出日志（会话中保存了用户数值ID；旧会话或账号已迁移到其他分片时需要按登录名查询）
+        ip = request.remote_addr
         ua = request.headers.get('User-Agent')
-        from .models import UserService
-        user = UserService.find_by_user_id(user_login)
-        if user:
-            AuditLog.log_action(user.id, 'logout', ip=ip, ua=ua)
+        id = session.get('id')
+        if id is None or not is_home_id(user_login, id):
+            user = UserService.lookup_by_user_id(user_login)
+            id = user.id if user else None
+        if id is not None and AuditLog.log_action(id, 'logout', ip=ip, ua=ua) is not None:
             db.session.commit()
         else:
             db.session.rollback()
     
-    session.clear()
+    end_session()
     flash('已退出登录！', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+# 移除重复的 /register 路由（已合并到 page_register）
+
+
+@auth_bp.route('/api/v1/admin/audit_logs', methods=['GET'])
+@role_required('admin')
+def api_audit_logs():
+    """按条件分页查询审计日志（键集分页，使用 next_cursor 获取下一页）"""
+    args = request.args
+    try:
+        actor_user_id = args.get('actor_id', type=int)
+        if args.get('user'):
+            user = UserService.lookup_by_user_id(args['user'])
+            if user is None:
+                return jsonify({'ok': True, 'items': [], 'next_cursor': None})
+            actor_user_id = user.id
+        since = datetime.fromisoformat(args['since']) if args.get('since') else None
+        until = datetime.fromisoformat(args['until']) if args.get('until') else None
+        logs, next_cursor = query_audit_logs(
+            actor_user_id=actor_user_id,
+            action=args.get('action'),
+            ip=args.get('ip'),
+            since=since,
+            until=until,
+            cursor=args.get('cursor'),
+            limit=args.get('limit', 50, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': 'invalid_params', 'detail': str(e)}), 400
+
+    return jsonify({
+        'ok': True,
+        'items': [log.to_dict() for log in logs],
+        'next_cursor': next_cursor
+    })
+
+
+@auth_bp.route('/api/v1/admin/users/search', methods=['GET'])
+@role_required('admin', 'cs')
+def api_search_users():
+    """检索用户：邮箱/手机号前缀匹配，姓名/昵称全文检索（键集分页，使用 next_cursor 获取下一页）"""
+    args = request.args
+    try:
+        users, next_cursor = search_users(
+            q=args.get('q'),
+            field=args.get('field') or None,
+            user_type=args.get('user_type'),
+            status=args.get('status'),
+            cursor=args.get('cursor'),
+            limit=args.get('limit', 50, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': 'invalid_params', 'detail': str(e)}), 400
 
-# 移除重复的 /register 路由（已合并到 page_register）
\ No newline at end of file
+    return jsonify({
+        'ok': True,
+        'users': users,
+        'next_cursor': next_cursor
+    })
@@ -8,20 +8,149 @@ from sqlalchemy.engine import URL
 # 加载 .env 文件
 load_dotenv()
 
+
+def pool_options(pool_size=5, max_overflow=0, pool_timeout=20, pool_recycle=300, pre_ping='always'):
+    """
+    连接池参数，环境变量优先于各环境的默认值：
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE / DB_POOL_PRE_PING
+    """
+    pre_ping = os.environ.get('DB_POOL_PRE_PING') or pre_ping
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or pool_size),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or max_overflow),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT') or pool_timeout),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or pool_recycle),
+        # always：每次取连接都 ping；idle：仅空闲超过 DB_POOL_PRE_PING_IDLE 秒时 ping；never：不 ping
+        'pool_pre_ping': pre_ping == 'always',
+    }
+
+def replica_binds():
+    """由 DB_REPLICA_URIS（逗号分隔）生成读副本的 SQLALCHEMY_BINDS"""
+    uris = [uri.strip() for uri in (os.environ.get('DB_REPLICA_URIS') or '').split(',') if uri.strip()]
+    return {f'replica_{i}': uri for i, uri in enumerate(uris)}
+
+
+def shard_uris():
+    """SHARD_URIS（逗号分隔）中的分片连接串，顺序决定各分片的 id 区间，只能在末尾追加"""
+    return [uri.strip() for uri in (os.environ.get('SHARD_URIS') or '').split(',') if uri.strip()]
+
+
+def shard_binds():
+    """由 SHARD_URIS 生成分片的 SQLALCHEMY_BINDS"""
+    return {f'shard_{i}': uri for i, uri in enumerate(shard_uris())}
+
+
+def database_uri(default):
+    """启用分片时默认数据库为第一个分片"""
+    uris = shard_uris()
+    return uris[0] if uris else default
+
+
 class Config:
     """基础配置"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-this-in-production'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_pre_ping': True,
-        'pool_recycle': 300,
-        'pool_timeout': 20,
-        'max_overflow': 0
-    }
+    SQLALCHEMY_ENGINE_OPTIONS = pool_options()
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING') or 'always'  # 取连接前检测策略：always/idle/never
+    DB_POOL_PRE_PING_IDLE = float(os.environ.get('DB_POOL_PRE_PING_IDLE') or 30)  # idle 策略的空闲秒数
+    DB_POOL_WARMUP = int(os.environ.get('DB_POOL_WARMUP') or 0)  # 启动时预先建立的连接数
+    DB_POOL_SLOW_CHECKOUT_MS = float(os.environ.get('DB_POOL_SLOW_CHECKOUT_MS') or 100)  # 取连接超过该毫秒数记日志
+    
+    # 读副本：只读查询按策略（round_robin/least_loaded）发往副本，写入后粘滞主库若干秒
+    SQLALCHEMY_BINDS = {**replica_binds(), **shard_binds()}
+    DB_REPLICA_STRATEGY = os.environ.get('DB_REPLICA_STRATEGY') or 'round_robin'
+    DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS') or 5)
+    
+    # 水平分片：SHARD_URIS 非空时按登录账号把用户分布到多个库（不能与读副本同时启用）
+    # 迁移（init_db.py reshard）期间设为 1：在账号应在的分片查不到时依次查找其他分片（每次未命中多查其余分片）
+    SHARD_LOOKUP_FALLBACK = (os.environ.get('SHARD_LOOKUP_FALLBACK') or '0') == '1'
+    
+    # 审计日志写入模式：sync（随请求事务提交）/ async（后台线程批量写入）
+    AUDIT_SINK_MODE = os.environ.get('AUDIT_SINK_MODE') or 'sync'
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE') or 10000)  # 队列容量
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE') or 500)  # 单批最多写入条数
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL') or 1.0)  # 凑批最长等待秒数
+    # 队列满时的策略：drop_new/drop_oldest/block/sync
+    AUDIT_OVERFLOW_POLICY = os.environ.get('AUDIT_OVERFLOW_POLICY') or 'sync'
+    AUDIT_UA_CACHE_SIZE = int(os.environ.get('AUDIT_UA_CACHE_SIZE') or 4096)  # User-Agent -> id 缓存条数
+    
+    # 密码哈希执行器：process（进程池）/ thread（线程池）/ inline（请求线程内计算）
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR') or 'process'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)  # 并发上限（server.py 下为整台主机，由各 worker 平分）
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING') or PASSWORD_HASH_WORKERS * 4)  # 排队上限
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT') or 10)  # 单次等待秒数
+    
+    # 用户查询缓存（进程内 LRU + TTL）
+    USER_CACHE_ENABLED = (os.environ.get('USER_CACHE_ENABLED') or '1') == '1'
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 10000)  # 最大条目数
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL') or 60)  # 用户快照有效秒数
+    USER_CACHE_NEGATIVE_TTL = float(os.environ.get('USER_CACHE_NEGATIVE_TTL') or 10)  # “账号不存在”有效秒数
+    
+    # 账号存在性过滤器（布隆过滤器）：一定不存在的账号不查询数据库
+    USER_FILTER_ENABLED = (os.environ.get('USER_FILTER_ENABLED') or '1') == '1'
+    USER_FILTER_ERROR_RATE = float(os.environ.get('USER_FILTER_ERROR_RATE') or 0.01)  # 目标误判率
+    USER_FILTER_MAX_MEMORY_MB = float(os.environ.get('USER_FILTER_MAX_MEMORY_MB') or 64)  # 位数组内存上限
+    USER_FILTER_BUILD_ASYNC = (os.environ.get('USER_FILTER_BUILD_ASYNC') or '1') == '1'  # 首次查询时后台构建
+    USER_FILTER_TAIL_INTERVAL = float(os.environ.get('USER_FILTER_TAIL_INTERVAL') or 1)  # 其他进程新建账号可见的最长滞后秒数
+    USER_FILTER_REBUILD_INTERVAL = float(os.environ.get('USER_FILTER_REBUILD_INTERVAL') or 3600)  # 整体重建间隔秒数
+    
+    # 生产启动入口（server.py）：worker 进程数、每进程线程数、处理多少请求后回收（加随机抖动错开）
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or os.cpu_count() or 2)
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 8)
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS') or 0)
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER') or 0)
+    SERVER_GRACEFUL_TIMEOUT = float(os.environ.get('SERVER_GRACEFUL_TIMEOUT') or 30)  # 停止时等待进行中请求的秒数
+    
+    # 服务端会话：cookie（Flask 默认签名 Cookie）/ memory（进程内）/ sqlite（本机文件，多 worker 共享）
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'cookie'
+    SESSION_PATH = os.environ.get('SESSION_PATH') or 'sessions.db'
+    SESSION_IDLE_TIMEOUT = float(os.environ.get('SESSION_IDLE_TIMEOUT') or 1800)  # 闲置多少秒后失效
+    SESSION_TOUCH_INTERVAL = float(os.environ.get('SESSION_TOUCH_INTERVAL') or 60)  # 只读请求的最短续期间隔
+    SESSION_SNAPSHOT_TTL = float(os.environ.get('SESSION_SNAPSHOT_TTL') or 300)  # 会话中用户详情快照的有效秒数
+    SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL') or 60)  # 清理过期会话的间隔
+    
+    # 登录限流：窗口内按账号/IP 的最大尝试次数，sqlite 后端在同一主机的多个 worker 间共享计数
+    LOGIN_RATE_LIMIT_ENABLED = (os.environ.get('LOGIN_RATE_LIMIT_ENABLED') or '1') == '1'
+    LOGIN_RATE_LIMIT_BACKEND = os.environ.get('LOGIN_RATE_LIMIT_BACKEND') or 'memory'
+    LOGIN_RATE_LIMIT_PATH = os.environ.get('LOGIN_RATE_LIMIT_PATH') or 'login_rate_limits.db'
+    LOGIN_RATE_LIMIT_WINDOW = float(os.environ.get('LOGIN_RATE_LIMIT_WINDOW') or 60)  # 窗口秒数
+    LOGIN_RATE_LIMIT_ACCOUNT = int(os.environ.get('LOGIN_RATE_LIMIT_ACCOUNT') or 10)
+    LOGIN_RATE_LIMIT_IP = int(os.environ.get('LOGIN_RATE_LIMIT_IP') or 50)
+    # 反向代理层数：大于 0 时按该层数信任 X-Forwarded-For 取客户端 IP（限流与审计日志），否则使用连接对端地址
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+    
+    # 登录统计与账号锁定：最近 LOGIN_STATS_WINDOW 秒内失败达到阈值时，自最后一次失败起锁定若干秒（阈值 0 表示不锁定）
+    LOGIN_STATS_WINDOW = int(os.environ.get('LOGIN_STATS_WINDOW') or 3600)
+    LOGIN_LOCKOUT_THRESHOLD = int(os.environ.get('LOGIN_LOCKOUT_THRESHOLD') or 0)
+    LOGIN_LOCKOUT_SECONDS = int(os.environ.get('LOGIN_LOCKOUT_SECONDS') or 900)
+    
+    # 用户检索：全文索引的最短词长（与 MariaDB innodb_ft_min_token_size 一致），
+    # 更短或含中日韩文字的姓名关键词改用 full_name 前缀匹配
+    SEARCH_FULLTEXT_MIN_TOKEN_SIZE = int(os.environ.get('SEARCH_FULLTEXT_MIN_TOKEN_SIZE') or 3)
+    
+    # 每请求数据库查询统计（SQL 条数、耗时、最慢语句、疑似 N+1）；每条语句都有额外开销，默认关闭
+    DB_INSTRUMENTATION_ENABLED = (os.environ.get('DB_INSTRUMENTATION_ENABLED') or '0') == '1'
+    DB_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('DB_INSTRUMENTATION_SAMPLE_RATE') or 1.0)  # 采样率
+    DB_INSTRUMENTATION_HEADERS = (os.environ.get('DB_INSTRUMENTATION_HEADERS') or '1') == '1'  # 输出 X-DB-* 响应头
+    DB_INSTRUMENTATION_SLOWEST = int(os.environ.get('DB_INSTRUMENTATION_SLOWEST') or 3)  # 记录最慢的语句数
+    DB_NPLUS1_THRESHOLD = int(os.environ.get('DB_NPLUS1_THRESHOLD') or 3)  # 同一语句重复次数达到即视为疑似 N+1
+    
+    # 匿名页面响应缓存（首页、登录、注册页；ETag/304 与 gzip/brotli 预压缩）
+    PAGE_CACHE_ENABLED = (os.environ.get('PAGE_CACHE_ENABLED') or '1') == '1'
+    PAGE_CACHE_MAX_AGE = int(os.environ.get('PAGE_CACHE_MAX_AGE') or 0)  # 0：浏览器每次用 ETag 校验
+    PAGE_CACHE_LOCALES = [locale.strip() for locale in (os.environ.get('PAGE_CACHE_LOCALES') or 'zh-CN').split(',')
+                          if locale.strip()]
+    
+    # 监控指标（/metrics，Prometheus 文本格式）
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or '1') == '1'
+    # 多进程部署时各进程写入快照的共享目录（为空表示单进程）
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or None
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL') or 5.0)  # 快照写入间隔秒数
 
 class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
+    DB_INSTRUMENTATION_ENABLED = (os.environ.get('DB_INSTRUMENTATION_ENABLED') or '1') == '1'
     
     # MariaDB 开发环境配置
     MYSQL_HOST = os.environ.get('MYSQL_HOST') or '192.168.189.10'
@@ -31,7 +160,7 @@ class DevelopmentConfig(Config):
     MYSQL_DATABASE = os.environ.get('MYSQL_DATABASE') or 'flask_auth_dev'
     
     # 使用 URL.create 安全构造连接串，避免密码中的特殊字符（如 @）破坏解析
-    SQLALCHEMY_DATABASE_URI = URL.create(
+    SQLALCHEMY_DATABASE_URI = database_uri(URL.create(
         drivername='mysql+pymysql',
         username=MYSQL_USER,
         password=MYSQL_PASSWORD,
@@ -39,11 +168,22 @@ class DevelopmentConfig(Config):
         port=int(MYSQL_PORT),
         database=MYSQL_DATABASE,
         query={'charset': 'utf8mb4'}
-    )
+    ))
 
 class ProductionConfig(Config):
     """生产环境配置"""
     DEBUG = False
+    # 生产环境：更大的连接池，突发时快速失败而不是阻塞 20 秒；仅对空闲连接做检测
+    SQLALCHEMY_ENGINE_OPTIONS = pool_options(pool_size=10, max_overflow=10, pool_timeout=5, pre_ping='idle')
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING') or 'idle'
+    DB_POOL_WARMUP = int(os.environ.get('DB_POOL_WARMUP') or 10)
+    AUDIT_SINK_MODE = os.environ.get('AUDIT_SINK_MODE') or 'async'
+    LOGIN_RATE_LIMIT_BACKEND = os.environ.get('LOGIN_RATE_LIMIT_BACKEND') or 'sqlite'  # 多 worker 共享限流计数
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'sqlite'  # 多 worker 共享会话，可吊销
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS') or 10000)
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER') or 1000)
+    DB_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('DB_INSTRUMENTATION_SAMPLE_RATE') or 0.05)
+    DB_INSTRUMENTATION_HEADERS = (os.environ.get('DB_INSTRUMENTATION_HEADERS') or '0') == '1'
     
     # MariaDB 生产环境配置
     MYSQL_HOST = os.environ.get('MYSQL_HOST') or '192.168.189.10'
@@ -52,7 +192,7 @@ class ProductionConfig(Config):
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or 'Bosun@0428'
     MYSQL_DATABASE = os.environ.get('MYSQL_DATABASE') or 'flask_auth'
     
-    SQLALCHEMY_DATABASE_URI = URL.create(
+    SQLALCHEMY_DATABASE_URI = database_uri(URL.create(
         drivername='mysql+pymysql',
         username=MYSQL_USER,
         password=MYSQL_PASSWORD,
@@ -60,14 +200,20 @@ class ProductionConfig(Config):
         port=int(MYSQL_PORT),
         database=MYSQL_DATABASE,
         query={'charset': 'utf8mb4'}
-    )
+    ))
 
 class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
+    PASSWORD_HASH_EXECUTOR = 'inline'
+    # SQLite 内存库使用 StaticPool，不接受连接池参数
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    DB_POOL_WARMUP = 0
+    USER_FILTER_BUILD_ASYNC = False  # 内存库只有一个连接，不在后台线程中构建
+    DB_INSTRUMENTATION_ENABLED = True  # 测试通过 X-DB-Query-Count 检查查询条数
     
     # 测试用SQLite内存数据库
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_DATABASE_URI = database_uri('sqlite:///:memory:')
 
 # 配置映射
 config = {
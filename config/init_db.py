@@ -6,9 +6,22 @@
 """
 
 from app import create_app
-from auth.models import db, User, UserInfo, UserService, AuditLog
+from config import shard_uris
+from auth.models import db, UserService
+from auth.bulk_import import import_users
+from auth.export import EXPORT_FORMATS, export_users
+from auth.loginstats import rebuild_login_stats
+from auth.audit import backfill_audit_log_encoding, query_audit_logs
+from auth.search import SEARCH_FIELDS, search_users
+from auth.resharding import reshard
+from auth.retention import archive_old_logs, enable_partitioning, ensure_partitions, iter_archived_logs
+from auth.sharding import create_shard_tables, get_shard_router, on_shard, shard_names
+from datetime import datetime
+import argparse
+import json
 import pymysql
 import os
+import sys
 
 # 管理员凭据环境变量（任选其一）
 ADMIN_USER_ENV_KEYS = [
@@ -111,8 +124,8 @@ def ensure_database_and_grants():
 
 def init_database():
     """初始化数据库（建库/授权 -> 建表 -> 插入测试数据）"""
-    # 确保数据库存在与权限就绪
-    if not ensure_database_and_grants():
+    # 确保数据库存在与权限就绪（分片库需预先创建）
+    if not shard_uris() and not ensure_database_and_grants():
         return
 
     app = create_app()
@@ -120,12 +133,23 @@ def init_database():
     with app.app_context():
         try:
             # 删除所有表（仅用于开发环境）
-            print("正在删除现有表...")
-            db.drop_all()
-
-            # 创建所有表
-            print("正在创建数据库表...")
-            db.create_all()
+            if get_shard_router() is not None:
+                # 每个分片建表并设置各自的 id 区间
+                print(f"正在重建 {len(shard_names())} 个分片的数据库表...")
+                create_shard_tables(drop=True)
+            else:
+                print("正在删除现有表...")
+                db.drop_all()
+
+                # 创建所有表
+                print("正在创建数据库表...")
+                db.create_all()
+
+            # MariaDB 下将审计日志表转为按月分区
+            for shard in shard_names():
+                with on_shard(shard):
+                    if enable_partitioning():
+                        print(f"审计日志表已按月分区{f'（{shard}）' if shard else ''}")
 
             # 创建默认用户
             print("正在创建默认用户...")
@@ -165,7 +189,7 @@ def init_database():
             )
 
             # 手机号用户
-            phone_user = UserService.create_user(
+            UserService.create_user(
                 user_id='13800138000',
                 password='123456',
                 login_type='phone',
@@ -182,11 +206,12 @@ def init_database():
                 gender='male',
             )
 
-            # 设置司机扩展资料
-            if phone_user.user_info:
-                phone_user.user_info.set_extra_profile('license_number', 'DL123456789')
-                phone_user.user_info.set_extra_profile('vehicle_type', 'sedan')
-                db.session.commit()
+            # 设置司机扩展资料（一条 JSON_SET 更新）
+            UserService.update_extra_profile(
+                '13800138000',
+                license_number='DL123456789',
+                vehicle_type='sedan',
+            )
 
             print("MySQL数据库初始化完成！")
             print(f"\n数据库连接信息:")
@@ -203,40 +228,77 @@ def init_database():
             print("请检查MySQL连接配置和权限")
 
 
-def show_users():
-    """显示所有用户"""
+def _parse_datetime(value):
+    """解析命令行中的日期/时间（ISO 格式）"""
+    return datetime.fromisoformat(value)
+
+
+def export_users_command(argv):
+    """流式导出用户：python init_db.py export [选项]"""
+    parser = argparse.ArgumentParser(prog='init_db.py export', description='流式导出用户（含详细信息）')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='text', help='输出格式（默认 text）')
+    parser.add_argument('--output', '-o', help='输出文件，默认标准输出')
+    parser.add_argument('--user-type', help='按用户类型过滤（passenger/driver/admin/cs）')
+    parser.add_argument('--status', help='按账号状态过滤（active/disabled/pending）')
+    parser.add_argument('--since', type=_parse_datetime, help='创建时间下限（含），如 2024-01-01')
+    parser.add_argument('--until', type=_parse_datetime, help='创建时间上限（不含）')
+    parser.add_argument('--batch-size', type=int, default=1000, help='服务端游标每批读取行数')
+    args = parser.parse_args(argv)
+
     app = create_app()
 
     with app.app_context():
-        users = User.query.all()
-        print(f"\n共有 {len(users)} 个用户:")
-        print("-" * 80)
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            count = export_users(
+                out,
+                fmt=args.format,
+                user_type=args.user_type,
+                status=args.status,
+                created_from=args.since,
+                created_to=args.until,
+                batch_size=args.batch_size,
+            )
+        finally:
+            if args.output:
+                out.close()
+        if args.output:
+            print(f"已导出 {count} 个用户到 {args.output}")
+
+
+def show_audit_logs(argv=()):
+    """分页显示审计日志：python init_db.py logs [选项]"""
+    parser = argparse.ArgumentParser(prog='init_db.py logs', description='按条件分页查看审计日志（按时间倒序）')
+    parser.add_argument('--user', help='按登录账号过滤')
+    parser.add_argument('--actor-id', type=int, help='按用户数值ID过滤')
+    parser.add_argument('--action', help='按动作过滤，如 login_failed')
+    parser.add_argument('--ip', help='按 IP 过滤')
+    parser.add_argument('--since', type=_parse_datetime, help='时间下限（含）')
+    parser.add_argument('--until', type=_parse_datetime, help='时间上限（不含）')
+    parser.add_argument('--limit', type=int, default=20, help='每页条数（默认 20）')
+    parser.add_argument('--cursor', help='上一页输出的游标')
+    args = parser.parse_args(list(argv))
 
-        for user in users:
-            print(f"ID: {user.id}")
-            print(f"用户名: {user.user_id}")
-            print(f"登录类型: {user.login_type}")
-            print(f"用户类型: {user.user_type}")
-            print(f"状态: {user.status}")
-            print(f"创建时间: {user.created_at}")
-
-            if user.user_info:
-                print(f"姓名: {user.user_info.full_name}")
-                print(f"昵称: {user.user_info.display_name}")
-                print(f"邮箱: {user.user_info.email}")
-                print(f"手机: {user.user_info.phone}")
-                if user.user_info.extra_profile:
-                    print(f"扩展资料: {user.user_info.extra_profile}")
-
-            print("-" * 80)
-
-
-def show_audit_logs():
-    """显示审计日志"""
     app = create_app()
 
     with app.app_context():
-        logs = AuditLog.query.order_by(AuditLog.created_at.desc()).limit(20).all()
+        actor_user_id = args.actor_id
+        if args.user:
+            user = UserService.lookup_by_user_id(args.user)
+            if user is None:
+                print(f"用户不存在: {args.user}")
+                return
+            actor_user_id = user.id
+
+        logs, next_cursor = query_audit_logs(
+            actor_user_id=actor_user_id,
+            action=args.action,
+            ip=args.ip,
+            since=args.since,
+            until=args.until,
+            cursor=args.cursor,
+            limit=args.limit,
+        )
         print(f"\n最近 {len(logs)} 条审计日志:")
         print("-" * 80)
 
@@ -248,88 +310,242 @@ def show_audit_logs():
             print(f"IP: {log.ip}")
             print("-" * 40)
 
+        if next_cursor:
+            print(f"下一页: python init_db.py logs --cursor {next_cursor}")
 
-if __name__ == '__main__':
-    import sys
 
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+def search_users_command(argv=()):
+    """检索用户：python init_db.py search 关键词 [选项]"""
+    parser = argparse.ArgumentParser(prog='init_db.py search', description='按邮箱、手机号前缀或姓名全文检索用户')
+    parser.add_argument('q', nargs='?', default='', help='关键词（不填则按类型/状态列出）')
+    parser.add_argument('--field', choices=SEARCH_FIELDS, help='检索字段（默认根据关键词猜测）')
+    parser.add_argument('--user-type', help='按用户类型过滤')
+    parser.add_argument('--status', help='按状态过滤')
+    parser.add_argument('--limit', type=int, default=20, help='每页条数（默认 20）')
+    parser.add_argument('--cursor', help='上一页输出的游标')
+    args = parser.parse_args(list(argv))
 
-        if command == 'init':
-            init_database()
-        elif command == 'users':
-            show_users()
-        elif command == 'logs':
-            show_audit_logs()
-        else:
-            print("使用方法:")
-            print("  python init_db.py init    - 初始化数据库")
-            print("  python init_db.py users   - 显示所有用户")
-            print("  python init_db.py logs    - 显示审计日志")
-    else:
-        init_database()
-    
-        
-def show_users():
-    """显示所有用户"""
     app = create_app()
-    
+
     with app.app_context():
-        users = User.query.all()
-        print(f"\n共有 {len(users)} 个用户:")
+        try:
+            users, next_cursor = search_users(
+                q=args.q,
+                field=args.field,
+                user_type=args.user_type,
+                status=args.status,
+                cursor=args.cursor,
+                limit=args.limit,
+            )
+        except ValueError as e:
+            print(f"参数错误: {e}")
+            return
+        print(f"\n找到 {len(users)} 个用户:")
         print("-" * 80)
-        
+
         for user in users:
-            print(f"ID: {user.id}")
-            print(f"用户名: {user.user_id}")
-            print(f"登录类型: {user.login_type}")
-            print(f"用户类型: {user.user_type}")
-            print(f"状态: {user.status}")
-            print(f"创建时间: {user.created_at}")
-            
-            if user.user_info:
-                print(f"姓名: {user.user_info.full_name}")
-                print(f"昵称: {user.user_info.display_name}")
-                print(f"邮箱: {user.user_info.email}")
-                print(f"手机: {user.user_info.phone}")
-                if user.user_info.extra_profile:
-                    print(f"扩展资料: {user.user_info.extra_profile}")
-            
-            print("-" * 80)
-
-def show_audit_logs():
-    """显示审计日志"""
+            print(f"ID: {user['id']}  账号: {user['user_id']}  类型: {user['user_type']}  状态: {user['status']}")
+            print(f"姓名: {user['full_name']}  昵称: {user['display_name']}")
+            print(f"邮箱: {user['email']}  手机: {user['phone']}")
+            print("-" * 40)
+
+        if next_cursor:
+            print(f"下一页: python init_db.py search {args.q} --cursor {next_cursor}")
+
+
+def import_users_command(argv):
+    """批量导入用户：python init_db.py import <文件> [选项]"""
+    parser = argparse.ArgumentParser(prog='init_db.py import', description='从 CSV/JSONL 流式批量导入用户')
+    parser.add_argument('path', help='输入文件（.csv 或 .jsonl）')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='输入格式，默认按扩展名判断')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的用户数（默认 1000）')
+    parser.add_argument('--workers', type=int, default=None, help='密码哈希进程数（默认 CPU 核数）')
+    parser.add_argument('--checkpoint', help='断点文件，中断后使用同一文件重新执行即可续传')
+    parser.add_argument('--report-every', type=float, default=10.0, help='进度报告间隔秒数')
+    parser.add_argument('--errors', help='无效记录输出文件（JSONL，追加写入序号、原因与原始记录）')
+    args = parser.parse_args(argv)
+
     app = create_app()
-    
+
     with app.app_context():
-        logs = AuditLog.query.order_by(AuditLog.created_at.desc()).limit(20).all()
-        print(f"\n最近 {len(logs)} 条审计日志:")
-        print("-" * 80)
-        
-        for log in logs:
-            print(f"时间: {log.created_at}")
-            print(f"用户ID: {log.actor_user_id}")
-            print(f"动作: {log.action}")
-            print(f"目标: {log.target}")
-            print(f"IP: {log.ip}")
-            print("-" * 40)
+        import_users(
+            args.path,
+            fmt=args.format,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            checkpoint_path=args.checkpoint,
+            report_every=args.report_every,
+            errors_path=args.errors,
+        )
+
+
+def partitions_command(argv):
+    """预建审计日志分区：python init_db.py partitions [--ahead N]"""
+    parser = argparse.ArgumentParser(prog='init_db.py partitions', description='预建未来月份的审计日志分区（MariaDB）')
+    parser.add_argument('--ahead', type=int, default=3, help='预建未来几个月（默认 3）')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+
+    with app.app_context():
+        for shard in shard_names():
+            with on_shard(shard):
+                created = ensure_partitions(months_ahead=args.ahead)
+            prefix = f"[{shard}] " if shard else ''
+            print(f"{prefix}新建分区: {', '.join(created) if created else '无'}")
+
+
+def backfill_audit_command(argv):
+    """转换旧版审计日志的 IP/UA 列：python init_db.py backfill-audit [--batch-size N]"""
+    parser = argparse.ArgumentParser(prog='init_db.py backfill-audit',
+                                     description='将 audit_logs 的 ip/ua 字符串分批转换为 ip_bin/ua_id（可重复执行）')
+    parser.add_argument('--batch-size', type=int, default=5000, help='每批转换的行数（默认 5000）')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+
+    with app.app_context():
+        def _progress(total, last_id):
+            print(f"已转换 {total} 行（id <= {last_id}）")
+
+        total = backfill_audit_log_encoding(batch_size=args.batch_size, progress=_progress)
+        print(f"完成，共转换 {total} 行")
+
+
+def rebuild_login_stats_command(argv):
+    """由审计日志重建登录统计：python init_db.py login-stats [--batch-size N]"""
+    parser = argparse.ArgumentParser(prog='init_db.py login-stats',
+                                     description='从 audit_logs 流式重新计算 user_login_stats')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每段处理的用户数（默认 1000）')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+
+    with app.app_context():
+        def _progress(users, events, last_id):
+            print(f"已处理 {users} 个用户、{events} 条登录日志（用户ID <= {last_id}）")
+
+        users, events = rebuild_login_stats(
+            batch_size=args.batch_size,
+            window=app.config.get('LOGIN_STATS_WINDOW', 3600),
+            progress=_progress,
+        )
+        print(f"完成，共处理 {users} 个用户、{events} 条登录日志")
+
+
+def reshard_command(argv):
+    """迁移用户到应在的分片：python init_db.py reshard [--batch-size N] [--dry-run]"""
+    parser = argparse.ArgumentParser(prog='init_db.py reshard',
+                                     description='追加分片后按账号重新分布用户（流式分批，可中断后重复执行）')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批扫描的用户数（默认 500）')
+    parser.add_argument('--dry-run', action='store_true', help='只统计需要迁移的用户数')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+
+    with app.app_context():
+        if get_shard_router() is None:
+            print("未配置 SHARD_URIS，无需迁移")
+            return
+        if not args.dry_run and not app.config.get('SHARD_LOOKUP_FALLBACK'):
+            print("提示：迁移完成前，服务进程须设置 SHARD_LOOKUP_FALLBACK=1，否则未迁移的账号查不到")
+
+        def _progress(shard, stats):
+            print(f"[{shard}] 已扫描 {stats['scanned']} 个用户，迁移 {stats['moved']} 个，复制日志 {stats['logs']} 条")
+
+        stats = reshard(batch_size=args.batch_size, dry_run=args.dry_run, progress=_progress)
+        if args.dry_run:
+            print(f"共扫描 {stats['scanned']} 个用户，需要迁移 {stats['moved']} 个")
+        else:
+            print(f"完成，共迁移 {stats['moved']} 个用户、{stats['logs']} 条审计日志")
+
+
+def archive_command(argv):
+    """归档过期审计日志：python init_db.py archive --older-than-days N --dir 目录"""
+    parser = argparse.ArgumentParser(prog='init_db.py archive', description='导出并删除过期的审计日志分区')
+    parser.add_argument('--older-than-days', type=int, required=True, help='归档早于多少天的整月日志')
+    parser.add_argument('--dir', required=True, help='归档目录')
+    parser.add_argument('--batch-size', type=int, default=5000, help='流式导出/删除的批量大小')
+    parser.add_argument('--dry-run', action='store_true', help='只列出将被归档的分区')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+
+    with app.app_context():
+        archived = archive_old_logs(args.older_than_days, args.dir, batch_size=args.batch_size, dry_run=args.dry_run)
+        if not archived:
+            print("没有需要归档的分区")
+        for name, path, count in archived:
+            if args.dry_run:
+                print(f"将归档分区 {name}")
+            else:
+                print(f"已归档分区 {name}: {count} 条 -> {path}")
+
+
+def archive_query_command(argv):
+    """查询已归档的审计日志：python init_db.py archive-query --dir 目录 [过滤条件]"""
+    parser = argparse.ArgumentParser(prog='init_db.py archive-query', description='查询归档的审计日志，输出 JSONL')
+    parser.add_argument('--dir', required=True, help='归档目录')
+    parser.add_argument('--actor-id', type=int, help='按用户数值ID过滤')
+    parser.add_argument('--action', help='按动作过滤')
+    parser.add_argument('--ip', help='按 IP 过滤')
+    parser.add_argument('--since', type=_parse_datetime, help='时间下限（含）')
+    parser.add_argument('--until', type=_parse_datetime, help='时间上限（不含）')
+    parser.add_argument('--limit', type=int, default=None, help='最多输出条数')
+    args = parser.parse_args(argv)
+
+    logs = iter_archived_logs(
+        args.dir,
+        actor_user_id=args.actor_id,
+        action=args.action,
+        ip=args.ip,
+        since=args.since,
+        until=args.until,
+    )
+    for i, log in enumerate(logs):
+        if args.limit is not None and i >= args.limit:
+            break
+        print(json.dumps(log, ensure_ascii=False))
+
 
 if __name__ == '__main__':
-    import sys
-    
     if len(sys.argv) > 1:
         command = sys.argv[1]
-        
+
         if command == 'init':
             init_database()
-        elif command == 'users':
-            show_users()
+        elif command in ('users', 'export'):
+            export_users_command(sys.argv[2:])
         elif command == 'logs':
-            show_audit_logs()
+            show_audit_logs(sys.argv[2:])
+        elif command == 'search':
+            search_users_command(sys.argv[2:])
+        elif command == 'partitions':
+            partitions_command(sys.argv[2:])
+        elif command == 'backfill-audit':
+            backfill_audit_command(sys.argv[2:])
+        elif command == 'login-stats':
+            rebuild_login_stats_command(sys.argv[2:])
+        elif command == 'reshard':
+            reshard_command(sys.argv[2:])
+        elif command == 'archive':
+            archive_command(sys.argv[2:])
+        elif command == 'archive-query':
+            archive_query_command(sys.argv[2:])
+        elif command == 'import':
+            import_users_command(sys.argv[2:])
         else:
             print("使用方法:")
             print("  python init_db.py init    - 初始化数据库")
-            print("  python init_db.py users   - 显示所有用户")
-            print("  python init_db.py logs    - 显示审计日志")
+            print("  python init_db.py export [--format csv|jsonl|text] [--output 文件] [过滤条件] - 流式导出用户")
+            print("  python init_db.py logs [--user 账号] [--action 动作] [--ip IP] [--cursor 游标] - 分页查看审计日志")
+            print("  python init_db.py search [关键词] [--field email|phone|name] [--user-type 类型] [--status 状态] - 检索用户")
+            print("  python init_db.py import <文件> [选项] - 从 CSV/JSONL 批量导入用户")
+            print("  python init_db.py partitions [--ahead N] - 预建审计日志分区")
+            print("  python init_db.py backfill-audit [--batch-size N] - 转换旧版审计日志的 IP/UA 列")
+            print("  python init_db.py login-stats [--batch-size N] - 由审计日志重建登录统计")
+            print("  python init_db.py reshard [--batch-size N] [--dry-run] - 追加分片后迁移用户到应在的分片")
+            print("  python init_db.py archive --older-than-days N --dir 目录 - 归档并删除过期审计日志")
+            print("  python init_db.py archive-query --dir 目录 [过滤条件] - 查询归档的审计日志")
     else:
-        init_database()
\ No newline at end of file
+        init_database()
@@ -0,0 +1,10 @@
+-- 审计日志查询索引
+-- 支持“某用户最近事件”“某动作最近事件”以及按 (created_at, id) 的键集分页
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本
+
+ALTER TABLE audit_logs
+    ADD INDEX ix_audit_logs_created (created_at, id),
+    ADD INDEX ix_audit_logs_actor_created (actor_user_id, created_at, id),
+    ADD INDEX ix_audit_logs_action_created (action, created_at, id),
+    ADD INDEX ix_audit_logs_ip_created (ip, created_at, id),
+    ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,16 @@
+-- audit_logs 按月 RANGE 分区
+-- 分区表不支持外键，且主键必须包含分区列：删除外键，主键改为 (id, created_at)
+-- 请按实际数据调整起始分区；之后由 `python init_db.py partitions` 定期预建未来分区，
+-- 由 `python init_db.py archive --older-than-days N --dir <目录>` 归档并删除过期分区
+
+ALTER TABLE audit_logs DROP FOREIGN KEY audit_logs_ibfk_1;
+
+ALTER TABLE audit_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at);
+
+-- 示例：从 2024-01 开始按月分区
+ALTER TABLE audit_logs PARTITION BY RANGE (TO_DAYS(created_at)) (
+    PARTITION p202401 VALUES LESS THAN (TO_DAYS('2024-02-01')),
+    PARTITION p202402 VALUES LESS THAN (TO_DAYS('2024-03-01')),
+    PARTITION p202403 VALUES LESS THAN (TO_DAYS('2024-04-01')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
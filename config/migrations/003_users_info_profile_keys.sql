@@ -0,0 +1,12 @@
+-- 扩展资料常用键的生成列与索引
+-- license_number / vehicle_type 由 extra_profile 自动生成（虚拟列，不占用行存储），
+-- 按驾照号查找司机时走索引而不是扫描全表解析 JSON
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本
+
+ALTER TABLE users_info
+    ADD COLUMN license_number VARCHAR(64) AS (JSON_VALUE(extra_profile, '$."license_number"')) VIRTUAL,
+    ADD COLUMN vehicle_type VARCHAR(32) AS (JSON_VALUE(extra_profile, '$."vehicle_type"')) VIRTUAL;
+
+ALTER TABLE users_info
+    ADD INDEX ix_users_info_license_number (license_number),
+    ADD INDEX ix_users_info_vehicle_type (vehicle_type);
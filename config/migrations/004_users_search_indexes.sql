@@ -0,0 +1,16 @@
+-- 客服/管理员用户检索所需的生成列与索引
+-- email_norm / phone_norm 为规范化后的邮箱、手机号（虚拟列），前缀查询按 (规范化值, id) 索引顺序扫描；
+-- full_name / display_name 建 FULLTEXT 索引供姓名检索；users 按 (user_type, status, id) 过滤并分页
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本
+
+ALTER TABLE users_info
+    ADD COLUMN email_norm VARCHAR(255) AS (lower(trim(email))) VIRTUAL,
+    ADD COLUMN phone_norm VARCHAR(32) AS (REGEXP_REPLACE(phone, '[^0-9]', '')) VIRTUAL;
+
+ALTER TABLE users_info
+    ADD INDEX ix_users_info_email_norm (email_norm, id),
+    ADD INDEX ix_users_info_phone_norm (phone_norm, id),
+    ADD FULLTEXT INDEX ix_users_info_names_fulltext (full_name, display_name);
+
+ALTER TABLE users
+    ADD INDEX ix_users_type_status_id (user_type, status, id);
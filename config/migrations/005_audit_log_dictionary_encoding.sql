@@ -0,0 +1,24 @@
+-- 审计日志 IP / User-Agent 字典编码（第一步）
+-- IP 以二进制存入 ip_bin（IPv4 4 字节 / IPv6 16 字节），User-Agent 去重后存入 user_agents，日志只保存 ua_id
+-- 执行本脚本后部署新版本，再运行 `python init_db.py backfill-audit` 分批转换存量数据，
+-- 最后执行 006_audit_log_drop_raw_columns.sql 删除旧列
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本
+
+CREATE TABLE IF NOT EXISTS user_agents (
+    id INT NOT NULL AUTO_INCREMENT,
+    ua_hash BINARY(16) NOT NULL,
+    ua TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE KEY ux_user_agents_ua_hash (ua_hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 旧列在回填完成前保留，改为可空（新版本不再写入）
+ALTER TABLE audit_logs
+    ADD COLUMN ip_bin VARBINARY(16) NULL AFTER ip,
+    ADD COLUMN ua_id INT NULL AFTER ua,
+    MODIFY COLUMN ip VARCHAR(64) NULL,
+    MODIFY COLUMN ua TEXT NULL;
+
+ALTER TABLE audit_logs
+    ADD INDEX ix_audit_logs_ip_bin_created (ip_bin, created_at, id);
@@ -0,0 +1,9 @@
+-- 审计日志 IP / User-Agent 字典编码（第二步）
+-- 在 `python init_db.py backfill-audit` 完成后执行：删除旧的字符串列与索引
+-- 可先确认没有遗漏：SELECT COUNT(*) FROM audit_logs WHERE (ip IS NOT NULL AND ip_bin IS NULL) OR (ua IS NOT NULL AND ua_id IS NULL);
+-- （无法解析的 IP 会保留 ip_bin 为 NULL）
+
+ALTER TABLE audit_logs
+    DROP INDEX ix_audit_logs_ip_created,
+    DROP COLUMN ip,
+    DROP COLUMN ua;
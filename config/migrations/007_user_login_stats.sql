@@ -0,0 +1,18 @@
+-- 用户登录统计表（每个用户一行，登录时与审计日志在同一事务中增量更新）
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本，
+-- 然后运行 `python init_db.py login-stats` 由 audit_logs 计算存量统计
+
+CREATE TABLE IF NOT EXISTS user_login_stats (
+    id BIGINT NOT NULL,
+    login_count INT NOT NULL DEFAULT 0,
+    failure_count INT NOT NULL DEFAULT 0,
+    consecutive_failures INT NOT NULL DEFAULT 0,
+    last_success_at DATETIME NULL,
+    last_success_ip VARBINARY(16) NULL,
+    last_failure_at DATETIME NULL,
+    failure_window_start BIGINT NOT NULL DEFAULT 0,
+    failures_previous INT NOT NULL DEFAULT 0,
+    failures_current INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id),
+    CONSTRAINT user_login_stats_ibfk_1 FOREIGN KEY (id) REFERENCES users (id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,4 @@
+-- audit_logs.actor_user_id 允许为 NULL：按 IP 汇总的登录限流记录（login_throttled, scope=ip）不属于某个账号
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本
+
+ALTER TABLE audit_logs MODIFY actor_user_id BIGINT NULL;
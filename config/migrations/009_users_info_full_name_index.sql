@@ -0,0 +1,5 @@
+-- 姓名前缀检索：含中日韩文字或短于 innodb_ft_min_token_size 的关键词不走 FULLTEXT，
+-- 改为 full_name LIKE '前缀%'，由本索引支持
+-- 新建的数据库由 init_db.py 直接创建，已有数据库请执行本脚本
+
+ALTER TABLE users_info ADD INDEX ix_users_info_full_name (full_name);
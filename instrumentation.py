@@ -0,0 +1,124 @@
+"""
+每请求数据库查询统计
+挂接 SQLAlchemy 引擎事件与 Flask 请求生命周期，按采样率记录每个请求的 SQL 条数、
+数据库总耗时与最慢的语句，以响应头和结构化日志输出；
+同一请求内相同语句重复执行达到阈值时标记为疑似 N+1。
+"""
+
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from auth import db
+
+logger = logging.getLogger('db.queries')
+
+# 日志中语句的最大长度
+MAX_SQL_LENGTH = 300
+
+
+class RequestQueryStats:
+    """单个请求的查询统计"""
+
+    __slots__ = ('count', 'total_time', 'slowest', 'statements', 'max_slowest')
+
+    def __init__(self, max_slowest=3):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = []  # [(耗时, 语句)]，按耗时降序
+        self.statements = Counter()
+        self.max_slowest = max_slowest
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        self.statements[statement] += 1
+        if len(self.slowest) < self.max_slowest or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.max_slowest:]
+
+    def repeated(self, threshold):
+        """返回重复次数达到阈值的语句 [(次数, 语句)]"""
+        return [(n, sql) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('_query_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 开始时间记在本次执行的上下文上：语句出错时随上下文丢弃，不会残留在连接上
+    if context is not None and _current_stats() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    started = getattr(context, '_query_started', None)
+    if stats is None or started is None:
+        return
+    stats.record(statement, time.perf_counter() - started)
+
+
+def _short(sql):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= MAX_SQL_LENGTH else sql[:MAX_SQL_LENGTH] + '...'
+
+
+def init_query_instrumentation(app):
+    """根据配置启用每请求的查询统计"""
+    if not app.config.get('DB_INSTRUMENTATION_ENABLED', False):
+        return
+
+    sample_rate = float(app.config.get('DB_INSTRUMENTATION_SAMPLE_RATE', 1.0))
+    add_headers = app.config.get('DB_INSTRUMENTATION_HEADERS', True)
+    max_slowest = int(app.config.get('DB_INSTRUMENTATION_SLOWEST', 3))
+    threshold = int(app.config.get('DB_NPLUS1_THRESHOLD', 3))
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_query_stats():
+        if sample_rate >= 1.0 or random.random() < sample_rate:
+            g._query_stats = RequestQueryStats(max_slowest)
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.pop('_query_stats', None)
+        if stats is None:
+            return response
+
+        repeated = stats.repeated(threshold)
+        if add_headers:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = f'{stats.total_time * 1000:.2f}'
+            if repeated:
+                response.headers['X-DB-Repeated-Queries'] = str(len(repeated))
+
+        record = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'query_count': stats.count,
+            'db_time_ms': round(stats.total_time * 1000, 2),
+            'slowest': [{'ms': round(t * 1000, 2), 'sql': _short(sql)} for t, sql in stats.slowest],
+        }
+        if repeated:
+            record['nplus1'] = [{'count': n, 'sql': _short(sql)} for n, sql in repeated]
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
@@ -1,5 +1,5 @@
-from flask import Blueprint, render_template, session, redirect, url_for, flash
-from auth import UserService
+from flask import Blueprint, current_app, render_template, session, redirect, url_for, flash
+from auth import UserProfile, UserService, cached_user_snapshot
 
 main_bp = Blueprint('main', __name__)
 
@@ -17,6 +17,10 @@ def detail():
         flash('请先登录再查看详情', 'info')
         return redirect(url_for('auth.page_login'))
 
-    user = UserService.find_by_user_id(user_id)
-    user_info = user.user_info if user else None
-    return render_template('detail.html', user=user, user_info=user_info)
+    # 服务端会话中缓存了详情快照时不查询数据库
+    window = current_app.config.get('LOGIN_STATS_WINDOW', 3600)
+    snapshot = cached_user_snapshot(lambda: UserService.get_detail_snapshot(user_id, window))
+    if snapshot is None:
+        return render_template('detail.html', profile=None, login_stats=None)
+    return render_template('detail.html', profile=UserProfile(**snapshot['profile']),
+                           login_stats=snapshot['login_stats'])
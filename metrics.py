@@ -0,0 +1,391 @@
+"""
+Prometheus 文本格式的监控指标
+- 接口耗时直方图、密码哈希耗时直方图、登录结果计数、连接池仪表与取连接等待直方图；
+- 多进程部署时每个进程定期把自己的指标快照写入 METRICS_MULTIPROC_DIR，
+  /metrics 汇总所有进程的文件：计数与直方图求和（已退出进程的计数合并进归档文件后保留），
+  仪表只汇总仍存活的进程；连接池指标按引擎（默认库/副本/分片）分别导出。
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+
+from flask import Response, request
+
+from auth import db
+from pool import add_checkout_observer
+
+# 已退出进程的计数合并后写入的归档文件（不匹配各进程的 metrics_*.json）
+ARCHIVE_FILENAME = 'archived_metrics.json'
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 默认统计耗时的接口
+DEFAULT_ENDPOINTS = ('auth.api_login', 'auth.page_register', 'auth.api_logout', 'main.detail')
+
+# 登录接口
+LOGIN_ENDPOINTS = ('auth.api_login',)
+
+# 登录接口响应码与结果的对应关系
+LOGIN_RESULTS = {200: 'success', 401: 'failure', 429: 'throttled', 503: 'busy'}
+
+
+class MetricsRegistry:
+    """进程内指标注册表（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # 名称 -> (类型, 说明, 分桶)
+        self._counters = {}    # (名称, 标签) -> 值
+        self._histograms = {}  # (名称, 标签) -> [各桶计数..., 总和, 总数]
+        self._gauges = {}      # 名称 -> 采集回调，返回 [(标签, 值)]
+        self._collected = {}   # 名称 -> 采集回调（由外部累计的计数），返回 [(标签, 值)]
+
+    def counter(self, name, help, collect=None):
+        """注册计数；外部组件自行累计时传入 collect()，采集时返回 [(标签字典, 累计值)]"""
+        self._meta[name] = ('counter', help, None)
+        if collect is not None:
+            self._collected[name] = collect
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ('histogram', help, tuple(buckets))
+
+    def gauge(self, name, help, collect):
+        """注册仪表，collect() 在采集时调用，返回 [(标签字典, 值)]"""
+        self._meta[name] = ('gauge', help, None)
+        self._gauges[name] = collect
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        buckets = self._meta[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            data = self._histograms.get(key)
+            if data is None:
+                data = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def reset(self):
+        """清空计数（fork 出的子进程调用，避免重复计算父进程的数据）"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def after_fork(self):
+        """fork 出的子进程中调用：重建锁并清空计数"""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def snapshot(self):
+        """返回可 JSON 序列化的快照"""
+        gauges = _collect(self._gauges)
+        collected = _collect(self._collected)
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'meta': {name: [kind, help, buckets] for name, (kind, help, buckets) in self._meta.items()},
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+                            + [[name, list(labels), value] for name, labels, value in collected],
+                'histograms': [[name, list(labels), list(data)] for (name, labels), data in self._histograms.items()],
+                'gauges': [[name, list(labels), value] for name, labels, value in gauges],
+            }
+
+
+def _collect(callbacks):
+    values = []
+    for name, collect in callbacks.items():
+        try:
+            for labels, value in collect():
+                values.append([name, _label_key(labels), value])
+        except Exception:
+            continue
+    return values
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class MultiprocessStore:
+    """多进程指标快照目录"""
+
+    def __init__(self, directory, registry, interval=5.0):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._path = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """开始定期写入本进程的快照（fork 后在子进程中重新调用）"""
+        # 文件名带启动时间，避免 PID 复用覆盖已退出进程的计数
+        self._path = os.path.join(self.directory, f'metrics_{os.getpid()}_{int(time.time() * 1000)}.json')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def after_fork(self):
+        """fork 出的子进程中调用：写入本进程自己的快照文件"""
+        self._stop = threading.Event()
+        self.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        if not self._path:
+            return
+        tmp = f'{self._path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp, self._path)
+
+    def close(self):
+        self._stop.set()
+        self.write()
+
+    def collect(self):
+        """读取所有进程的快照（先把已退出进程的文件合并进归档文件）"""
+        self.write()
+        self.compact()
+        archive = self._load(ARCHIVE_FILENAME)
+        merged = set(archive['merged']) if archive else set()
+        snapshots = [archive] if archive else []
+        for filename in self._process_files():
+            if filename in merged:
+                continue
+            snap = self._load(filename)
+            if snap is not None:
+                snapshots.append(snap)
+        return snapshots
+
+    def compact(self):
+        """把已退出进程的快照合并进归档文件并删除，避免 worker 重启后目录无限增长"""
+        with open(os.path.join(self.directory, '.compact.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = self._load(ARCHIVE_FILENAME)
+            # 上次合并后未删成功的文件（计数已在归档中）
+            for filename in archive['merged'] if archive else ():
+                self._remove(filename)
+
+            dead, names = [], []
+            for filename in self._process_files():
+                snap = self._load(filename)
+                if snap is not None and not _pid_alive(snap['pid']):
+                    dead.append(snap)
+                    names.append(filename)
+            if not dead:
+                if archive and archive['merged']:
+                    archive['merged'] = []
+                    self._dump(ARCHIVE_FILENAME, archive)
+                return
+
+            meta, counters, histograms, _ = merge_snapshots(([archive] if archive else []) + dead)
+            self._dump(ARCHIVE_FILENAME, {
+                'pid': None,
+                'meta': meta,
+                'counters': [[name, [list(pair) for pair in labels], value]
+                             for (name, labels), value in counters.items()],
+                'histograms': [[name, [list(pair) for pair in labels], data]
+                               for (name, labels), data in histograms.items()],
+                'gauges': [],
+                'merged': names,
+            })
+            for filename in names:
+                self._remove(filename)
+
+    def _process_files(self):
+        return [filename for filename in os.listdir(self.directory)
+                if filename.startswith('metrics_') and filename.endswith('.json')]
+
+    def _load(self, filename):
+        try:
+            with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _dump(self, filename, data):
+        path = os.path.join(self.directory, filename)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _remove(self, filename):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+
+
+def merge_snapshots(snapshots):
+    """汇总多个进程的快照"""
+    meta, counters, histograms, gauges = {}, {}, {}, {}
+    for snap in snapshots:
+        meta.update(snap['meta'])
+        alive = _pid_alive(snap['pid'])
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, data in snap['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.get(key)
+            histograms[key] = list(data) if merged is None else [a + b for a, b in zip(merged, data)]
+        if alive:
+            for name, labels, value in snap['gauges']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                gauges[key] = gauges.get(key, 0) + value
+    return meta, counters, histograms, gauges
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    body = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return '{' + body + '}'
+
+
+def render_text(meta, counters, histograms, gauges):
+    """生成 Prometheus 文本格式"""
+    lines = []
+    for name in sorted(meta):
+        kind, help, buckets = meta[name]
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        elif kind == 'gauge':
+            for (metric, labels), value in sorted(gauges.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        else:
+            for (metric, labels), data in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, data):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {data[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {data[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {data[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _pool_gauges(engines):
+    """engines: {引擎名: 引擎}"""
+    def collect():
+        values = []
+        for name, engine in engines.items():
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout'):
+                continue
+            values += [({'engine': name, 'stat': 'checked_out'}, pool.checkedout()),
+                       ({'engine': name, 'stat': 'overflow'}, max(pool.overflow(), 0)),
+                       ({'engine': name, 'stat': 'size'}, pool.size())]
+        return values
+    return collect
+
+
+def _checkout_observer(registry, name):
+    return lambda seconds: registry.observe('db_pool_checkout_wait_seconds', seconds, {'engine': name})
+
+
+def init_metrics(app):
+    """为应用注册指标采集与 /metrics 接口"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+
+    registry = MetricsRegistry()
+    registry.histogram('http_request_duration_seconds', '接口耗时（秒）')
+    registry.histogram('password_hash_duration_seconds', '密码哈希/校验耗时（秒）')
+    registry.histogram('db_pool_checkout_wait_seconds', '从连接池取连接的等待时间（秒）')
+    registry.counter('auth_login_total', '登录请求结果计数')
+
+    endpoints = set(app.config.get('METRICS_ENDPOINTS') or DEFAULT_ENDPOINTS)
+
+    @app.before_request
+    def _start_timer():
+        request.environ['metrics.started'] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = request.environ.get('metrics.started')
+        if started is not None and request.endpoint in endpoints:
+            registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                             {'endpoint': request.endpoint})
+        if request.endpoint in LOGIN_ENDPOINTS:
+            result = LOGIN_RESULTS.get(response.status_code, 'error')
+            registry.inc('auth_login_total', {'result': result})
+        return response
+
+    hasher = app.extensions.get('password_hasher')
+    if hasher is not None:
+        hasher.observers.append(
+            lambda op, seconds: registry.observe('password_hash_duration_seconds', seconds, {'op': op})
+        )
+
+    with app.app_context():
+        engines = {key or 'default': engine for key, engine in db.engines.items()}
+    for name, engine in engines.items():
+        add_checkout_observer(engine, _checkout_observer(registry, name))
+    registry.gauge('db_pool_connections', '各引擎连接池状态（已借出/溢出/池大小）', _pool_gauges(engines))
+
+    sink = app.extensions.get('audit_sink')
+    if sink is not None:
+        # 入队/写入/丢弃等为累计值，按计数导出，worker 重启后的归零由 rate() 处理
+        registry.counter('audit_sink_entries_total', '异步审计日志累计计数',
+                         lambda: [({'stat': key}, value) for key, value in sink.stats().items() if key != 'pending'])
+        registry.gauge('audit_sink_pending', '异步审计日志队列中待写入的条数',
+                       lambda: [({}, sink.stats()['pending'])])
+
+    store = None
+    directory = app.config.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        store = MultiprocessStore(directory, registry, interval=app.config.get('METRICS_FLUSH_INTERVAL', 5.0))
+        store.start()
+        atexit.register(store.close)
+
+    def metrics_view():
+        if store is not None:
+            merged = merge_snapshots(store.collect())
+        else:
+            merged = merge_snapshots([registry.snapshot()])
+        return Response(render_text(*merged), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.extensions['metrics'] = (registry, store)
+    return registry
@@ -0,0 +1,150 @@
+"""
+匿名页面响应缓存
+首页、登录页与注册页（GET）对未登录用户的内容只取决于模板与语言，却占了大部分请求量：
+- 首次渲染后按 (端点, 语言) 缓存响应体，同时在内存中保存 gzip 与 brotli（安装了 brotli 包时）压缩版本，
+  按 Accept-Encoding 直接返回，不再渲染模板、也不在请求中压缩；
+- 每种编码有各自的强 ETag（内容摘要），If-None-Match 命中时返回 304；
+- Cache-Control 为 private：页面随登录状态变化，不能被共享缓存复用；PAGE_CACHE_MAX_AGE 为 0 时浏览器每次都用 ETag 校验；
+- 已登录、有待显示的闪现消息或带查询参数的请求不走缓存，照常渲染。
+开启模板自动重载（调试模式）时不缓存；生产环境更新模板后重启（或 SIGHUP 平滑重载）即可。
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import namedtuple
+from functools import wraps
+
+from flask import Response, current_app, request, session
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：未安装时只提供 gzip
+    brotli = None
+
+DEFAULT_ENDPOINTS = ('main.index', 'auth.page_login', 'auth.page_register')
+
+# body: 编码 -> 响应体；etags: 编码 -> ETag（不含引号）
+CachedPage = namedtuple('CachedPage', ['content_type', 'body', 'etags'])
+
+
+def _encode(body, compress_level):
+    variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=compress_level, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, mode=brotli.MODE_TEXT)
+    # 压缩后反而更大的版本不保存
+    return {encoding: data for encoding, data in variants.items()
+            if encoding == 'identity' or len(data) < len(body)}
+
+
+class PageCache:
+    """按 (端点, 语言) 缓存渲染结果及其压缩版本（线程安全）"""
+
+    def __init__(self, locales=('zh-CN',), max_age=0, compress_level=9):
+        self.locales = list(locales) or ['zh-CN']
+        self.max_age = int(max_age)
+        self.compress_level = compress_level
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'not_modified': 0, 'misses': 0, 'bypassed': 0}
+
+    def _incr(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def cacheable(self):
+        """本次请求能否使用缓存：匿名、无闪现消息、无查询参数的 GET"""
+        if request.method != 'GET' or request.query_string:
+            return False
+        return not session.get('user_id') and '_flashes' not in session
+
+    def locale(self):
+        return request.accept_languages.best_match(self.locales, default=self.locales[0])
+
+    def store(self, key, response):
+        """缓存渲染结果；只缓存不设置 Cookie 的 200 HTML 响应"""
+        if (response.status_code != 200 or response.mimetype != 'text/html'
+                or response.direct_passthrough or 'Set-Cookie' in response.headers):
+            return None
+        body = response.get_data()
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        variants = _encode(body, self.compress_level)
+        page = CachedPage(
+            content_type=response.content_type,
+            body=variants,
+            etags={encoding: digest if encoding == 'identity' else f'{digest}-{encoding}' for encoding in variants},
+        )
+        with self._lock:
+            self._pages[key] = page
+        return page
+
+    def get(self, key):
+        with self._lock:
+            return self._pages.get(key)
+
+    def respond(self, page):
+        """按 Accept-Encoding 选择版本，If-None-Match 命中时返回 304"""
+        accepted = request.accept_encodings
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in page.body and accepted[candidate]:
+                encoding = candidate
+                break
+        etag = page.etags[encoding]
+        vary = 'Accept-Encoding, Cookie' + (', Accept-Language' if len(self.locales) > 1 else '')
+        cache_control = f'private, max-age={self.max_age}' if self.max_age > 0 else 'private, no-cache'
+
+        if request.if_none_match.contains(etag):
+            self._incr('not_modified')
+            response = Response(status=304)
+        else:
+            self._incr('hits')
+            response = Response(page.body[encoding], content_type=page.content_type)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = vary
+        return response
+
+    def wrap(self, endpoint, view):
+        """包装视图：可缓存的请求直接返回缓存，未命中时渲染并写入缓存"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if args or kwargs or not self.cacheable():
+                self._incr('bypassed')
+                return view(*args, **kwargs)
+            key = (endpoint, self.locale())
+            page = self.get(key)
+            if page is None:
+                self._incr('misses')
+                response = current_app.make_response(view())
+                page = self.store(key, response)
+                if page is None:
+                    return response
+            return self.respond(page)
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['pages'] = len(self._pages)
+        return data
+
+
+def init_page_cache(app):
+    """为 PAGE_CACHE_ENDPOINTS 中的页面启用响应缓存（需在注册蓝图之后调用）"""
+    if not app.config.get('PAGE_CACHE_ENABLED', True) or app.jinja_env.auto_reload:
+        return None
+    locales = app.config.get('PAGE_CACHE_LOCALES') or ['zh-CN']
+    cache = PageCache(locales=locales, max_age=app.config.get('PAGE_CACHE_MAX_AGE', 0))
+    for endpoint in app.config.get('PAGE_CACHE_ENDPOINTS') or DEFAULT_ENDPOINTS:
+        view = app.view_functions.get(endpoint)
+        if view is not None:
+            app.view_functions[endpoint] = cache.wrap(endpoint, view)
+    app.extensions['page_cache'] = cache
+    return cache
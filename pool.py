@@ -0,0 +1,169 @@
+"""
+数据库连接池
+- 在 QueuePool 基础上记录每次取连接的等待时间，供监控与慢取连接诊断使用；
+- 取连接前检测策略（always/idle/never），idle 仅对空闲较久的连接执行 SELECT 1；
+- 启动时预热连接池，避免首批请求承担建连开销。
+"""
+
+import logging
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import QueuePool
+
+from auth import db
+
+logger = logging.getLogger(__name__)
+
+
+class TimedQueuePool(QueuePool):
+    """记录取连接等待时间的 QueuePool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 取连接完成后的回调：callback(等待秒数)；只属于本连接池所在的引擎
+        self.checkout_observers = []
+
+    def recreate(self):
+        # engine.dispose() 会重建连接池，回调随之转移
+        pool = super().recreate()
+        pool.checkout_observers = self.checkout_observers
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            for observer in self.checkout_observers:
+                observer(waited)
+
+
+def add_checkout_observer(engine, callback):
+    """为引擎的连接池注册取连接回调 callback(等待秒数)；连接池不是 TimedQueuePool（如 SQLite 内存库）时忽略"""
+    observers = getattr(engine.pool, 'checkout_observers', None)
+    if observers is not None:
+        observers.append(callback)
+
+
+def _is_sqlite_memory(uri):
+    uri = str(uri or '')
+    return uri.startswith('sqlite') and (uri.endswith(':memory:') or uri.rstrip('/') == 'sqlite:')
+
+
+def configure_engine_options(app):
+    """在创建引擎前补充连接池参数（SQLite 内存库由 Flask-SQLAlchemy 使用 StaticPool）
+
+    Flask-SQLAlchemy 只把 SQLALCHEMY_ENGINE_OPTIONS 用于默认库，副本/分片等 bind
+    在这里展开为带同样连接池参数的字典配置。
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('poolclass', TimedQueuePool)
+    if not _is_sqlite_memory(app.config.get('SQLALCHEMY_DATABASE_URI')):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = {}
+    for key, value in (app.config.get('SQLALCHEMY_BINDS') or {}).items():
+        if isinstance(value, dict) or _is_sqlite_memory(value):
+            binds[key] = value
+        else:
+            binds[key] = {**options, 'url': value}
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def install_idle_pre_ping(engine, idle_seconds):
+    """仅当连接空闲超过 idle_seconds 时，在取出前执行 SELECT 1 检测"""
+
+    @event.listens_for(engine, 'checkin')
+    def _mark_idle(dbapi_connection, connection_record):
+        if connection_record is not None:
+            connection_record.info['checked_in_at'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get('checked_in_at')
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        except Exception:
+            # 连接池会丢弃该连接并重新获取
+            raise DisconnectionError('空闲连接已失效')
+
+
+def warm_up_pool(engine, size):
+    """并发建立 size 个连接后归还连接池，返回耗时秒数"""
+    if hasattr(engine.pool, 'size'):
+        # 超出池大小的连接归还时会被关闭，预热没有意义
+        size = min(size, engine.pool.size())
+    if size <= 0:
+        return 0.0
+    started = time.perf_counter()
+    connections = []
+    lock = threading.Lock()
+
+    def _connect():
+        try:
+            conn = engine.connect()
+        except Exception as e:
+            logger.warning('连接池预热失败: %s', e)
+            return
+        with lock:
+            connections.append(conn)
+
+    threads = [threading.Thread(target=_connect) for _ in range(size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for conn in connections:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    logger.info('连接池预热完成：%d 个连接，耗时 %.1fms', len(connections), elapsed * 1000)
+    return elapsed
+
+
+def warm_up_engines(app):
+    """按 DB_POOL_WARMUP 预热应用的全部引擎（默认库、读副本与分片）"""
+    with app.app_context():
+        engines = list(db.engines.values())
+    size = int(app.config.get('DB_POOL_WARMUP', 0))
+    for engine in engines:
+        warm_up_pool(engine, size)
+
+
+def init_pool(app):
+    """为全部引擎按配置安装取连接前检测、慢取连接日志并预热连接池"""
+    with app.app_context():
+        engines = dict(db.engines)
+
+    if app.config.get('DB_POOL_PRE_PING', 'always') == 'idle':
+        for bound in engines.values():
+            install_idle_pre_ping(bound, app.config.get('DB_POOL_PRE_PING_IDLE', 30))
+
+    slow_seconds = app.config.get('DB_POOL_SLOW_CHECKOUT_MS', 100) / 1000.0
+
+    def _slow_checkout_logger(name, bound):
+        def _log_slow_checkout(waited):
+            if waited < slow_seconds:
+                return
+            endpoint = request.endpoint if has_request_context() else None
+            pool = bound.pool
+            logger.warning(
+                '慢取连接：引擎 %s，等待 %.1fms，路由 %s，已借出 %s，溢出 %s',
+                name, waited * 1000, endpoint or '-',
+                pool.checkedout() if hasattr(pool, 'checkedout') else '-',
+                pool.overflow() if hasattr(pool, 'overflow') else '-',
+            )
+        return _log_slow_checkout
+
+    for key, bound in engines.items():
+        add_checkout_observer(bound, _slow_checkout_logger(key or 'default', bound))
+
+    warm_up_engines(app)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+生产环境启动入口（预加载 + 多进程 + 每进程固定线程数）
+- 主进程调用一次 create_app 并监听端口，然后 fork 出 SERVER_WORKERS 个 worker；
+- 子进程在 fork 后立即丢弃继承的数据库连接（engine.dispose(close=False)），
+  并重启审计写入、账号过滤器、指标写入等后台线程，重建密码哈希工作池（主机的哈希并发上限由各 worker 平分）；
+- 每个 worker 用 SERVER_THREADS 个线程处理请求，处理 SERVER_MAX_REQUESTS 个请求后自动退出并由主进程补齐；
+- SIGHUP：平滑重载。主进程带着监听套接字重新执行自身（加载新代码与配置），
+  新 worker 就绪后旧 worker 处理完进行中的请求再退出；
+- SIGTERM/SIGINT：通知所有 worker 处理完进行中的请求后退出。
+
+用法：
+    FLASK_ENV=production python server.py
+    python server.py --workers 4 --threads 8 --bind 0.0.0.0:8000 --measure
+"""
+
+import argparse
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+from app import create_app
+from auth import db
+from pool import warm_up_engines
+
+logger = logging.getLogger('server')
+
+# 平滑重载时通过环境变量传给新主进程
+LISTEN_FD_ENV = 'SERVER_LISTEN_FD'
+RETIRE_PIDS_ENV = 'SERVER_RETIRE_PIDS'
+
+
+class WorkerServer(BaseWSGIServer):
+    """固定线程数的 WSGI 服务：accept 在主线程，请求交给线程池处理"""
+
+    request_queue_size = 1024
+
+    def __init__(self, host, port, app, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self._executor = None
+        self._slots = None
+
+    def start_threads(self, threads):
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        # 线程都在忙时不再 accept，新连接留在内核队列中，由其他 worker 接走
+        self._slots = threading.BoundedSemaphore(threads)
+        # 多个 worker 共享监听套接字，非阻塞 accept 避免没抢到连接的进程卡住
+        self.socket.setblocking(False)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        """等待进行中的请求处理完"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+def post_fork(app, worker_id):
+    """子进程初始化：丢弃继承的连接，重启后台线程与工作池"""
+    with app.app_context():
+        engines = list(db.engines.values())
+    router = app.extensions.get('replica_router')
+    if router is not None:
+        engines.extend(router.engines)
+    for engine in engines:
+        # 不关闭父进程的连接（仍由其他进程持有的套接字），只丢弃引用
+        engine.dispose(close=False)
+
+    for name in ('password_hasher', 'shard_router', 'user_agent_cache', 'audit_sink', 'user_filter',
+                 'session_sweeper'):
+        extension = app.extensions.get(name)
+        if extension is not None:
+            extension.after_fork()
+
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        registry, store = metrics
+        registry.after_fork()
+        if store is not None:
+            store.after_fork()
+
+    warm_up_engines(app)
+
+
+def run_worker(app, server, worker_id, threads, max_requests):
+    """worker 主循环，返回退出码"""
+    started = time.perf_counter()
+    post_fork(app, worker_id)
+    server.start_threads(threads)
+    logger.info('worker #%d（pid %d）就绪，fork 后初始化耗时 %.1fms，最多处理 %s 个请求',
+                worker_id, os.getpid(), (time.perf_counter() - started) * 1000, max_requests or '不限')
+
+    handled = [0]
+    lock = threading.Lock()
+    wsgi_app = app.wsgi_app
+
+    def counting_app(environ, start_response):
+        with lock:
+            handled[0] += 1
+            recycle = max_requests and handled[0] == max_requests
+        if recycle:
+            logger.info('worker %d 已处理 %d 个请求，处理完后退出', os.getpid(), handled[0])
+            threading.Thread(target=server.shutdown, daemon=True).start()
+        return wsgi_app(environ, start_response)
+
+    app.wsgi_app = counting_app
+
+    def _graceful_exit(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _graceful_exit)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    server.serve_forever()
+    server.drain()
+    return 0
+
+
+def memory_usage(pid):
+    """返回进程的 RSS 与 PSS（KB，PSS 按共享页均摊，更能反映 fork 后的实际占用）"""
+    usage = {}
+    for filename, keys in (('status', ('VmRSS',)), ('smaps_rollup', ('Pss',))):
+        try:
+            with open(f'/proc/{pid}/{filename}', 'r') as f:
+                for line in f:
+                    name, _, value = line.partition(':')
+                    if name in keys:
+                        usage[name] = int(value.split()[0])
+        except OSError:
+            continue
+    return usage
+
+
+class Arbiter:
+    """主进程：维护 worker 数量并处理信号"""
+
+    def __init__(self, app, server, workers, threads, max_requests, jitter, graceful_timeout):
+        self.app = app
+        self.server = server
+        self.num_workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}  # pid -> worker 序号
+        self._stopping = False
+        self._reload = False
+
+    def spawn(self, worker_id):
+        # 错开各 worker 的回收时间，避免同时重启
+        max_requests = self.max_requests + random.randint(0, self.jitter) if self.max_requests else 0
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = worker_id
+            return pid
+        code = 1
+        try:
+            code = run_worker(self.app, self.server, worker_id, self.threads, max_requests)
+        except Exception:
+            logger.exception('worker %d 异常退出', os.getpid())
+        finally:
+            # 子进程不能回到主进程的循环中
+            sys.exit(code)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        for worker_id in range(self.num_workers):
+            self.spawn(worker_id)
+        self.retire_previous()
+
+        while not self._stopping:
+            if self._reload:
+                self.reexec()
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.workers:
+                worker_id = self.workers.pop(pid)
+                if not self._stopping:
+                    logger.info('worker %d 退出（状态 %d），重新启动', pid, status)
+                    self.spawn(worker_id)
+                continue
+            time.sleep(0.2)
+
+        self.stop_workers()
+
+    def retire_previous(self):
+        """平滑重载后，让上一代 worker 处理完进行中的请求后退出"""
+        pids = [int(pid) for pid in os.environ.pop(RETIRE_PIDS_ENV, '').split(',') if pid]
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reexec(self):
+        """带着监听套接字重新执行主进程，当前 worker 在新 worker 就绪后退出"""
+        logger.info('收到 SIGHUP，重新加载')
+        fd = self.server.fileno()
+        os.set_inheritable(fd, True)
+        os.environ[LISTEN_FD_ENV] = str(fd)
+        os.environ[RETIRE_PIDS_ENV] = ','.join(str(pid) for pid in self.workers)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def stop_workers(self):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.workers:
+            # 超时仍未退出的 worker 强制结束
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+
+    started = time.perf_counter()
+    app = create_app()
+    preload_seconds = time.perf_counter() - started
+
+    parser = argparse.ArgumentParser(description='生产环境多进程启动入口')
+    parser.add_argument('--bind', default=f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', '5000')}",
+                        help='监听地址 host:port')
+    parser.add_argument('--workers', type=int, default=app.config.get('SERVER_WORKERS'), help='worker 进程数')
+    parser.add_argument('--threads', type=int, default=app.config.get('SERVER_THREADS'), help='每个 worker 的线程数')
+    parser.add_argument('--max-requests', type=int, default=app.config.get('SERVER_MAX_REQUESTS'),
+                        help='worker 处理多少个请求后重启（0 表示不重启）')
+    parser.add_argument('--measure', action='store_true', help='输出预加载耗时与各进程内存占用')
+    args = parser.parse_args()
+
+    host, _, port = args.bind.rpartition(':')
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    server = WorkerServer(host or '127.0.0.1', int(port), app, fd=int(fd) if fd else None)
+
+    # 密码哈希的并发上限按整台主机计算，由各 worker 平分
+    hasher = app.extensions.get('password_hasher')
+    if hasher is not None:
+        hasher.share_among(args.workers)
+    
+    # 主进程不处理请求，关闭预加载时建立的连接，避免被子进程继承
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+    arbiter = Arbiter(
+        app, server,
+        workers=args.workers,
+        threads=args.threads,
+        max_requests=args.max_requests,
+        jitter=app.config.get('SERVER_MAX_REQUESTS_JITTER', 0),
+        graceful_timeout=app.config.get('SERVER_GRACEFUL_TIMEOUT', 30),
+    )
+    logger.info('监听 %s，%d 个 worker × %d 线程，预加载耗时 %.2fs',
+                args.bind, args.workers, args.threads, preload_seconds)
+
+    if args.measure:
+        def _report():
+            time.sleep(2)
+            logger.info('主进程 %d 内存: %s', os.getpid(), memory_usage(os.getpid()))
+            for pid in list(arbiter.workers):
+                logger.info('worker %d 内存: %s', pid, memory_usage(pid))
+        threading.Thread(target=_report, daemon=True).start()
+
+    arbiter.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from auth import db
+from config import TestingConfig, config
+
+
+@pytest.fixture
+def make_app(monkeypatch):
+    """以覆盖了部分配置项的测试配置创建应用（在应用上下文中建表）"""
+    def make(**overrides):
+        monkeypatch.setitem(config, 'testing', type('OverriddenConfig', (TestingConfig,), overrides))
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all(bind_key=None)
+        return app
+    return make
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        # db.metadatas 是全局的，其他测试应用配置的分片/副本 bind 不在本应用中，只建默认库的表
+        db.create_all(bind_key=None)
+        yield app
+        db.session.remove()
+        db.drop_all(bind_key=None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
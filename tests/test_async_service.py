@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+
+from auth import AsyncUserService, UserAlreadyExistsError, UserInfo, UserService, db
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    engine = create_engine(url)
+    db.metadatas[None].create_all(engine)
+    engine.dispose()
+    return url
+
+
+def run(service, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await service.dispose()
+    return asyncio.run(main())
+
+
+def test_create_find_and_authenticate(database_url):
+    service = AsyncUserService.from_url(database_url)
+
+    async def scenario():
+        user = await service.create_user('a@example.com', 'secret', info={'full_name': 'Alice'})
+        found = await service.find_by_user_id('a@example.com')
+        missing = await service.find_by_user_id('missing@example.com')
+        ok = await service.authenticate('a@example.com', 'secret', ip='127.0.0.1')
+        wrong = await service.authenticate('a@example.com', 'wrong')
+        return user, found, missing, ok, wrong
+
+    user, found, missing, ok, wrong = run(service, scenario())
+    assert found.id == user.id and found.user_info.full_name == 'Alice'
+    assert missing is None
+    assert ok.user_id == 'a@example.com'
+    assert wrong is None
+
+
+def test_duplicate_account_raises_already_exists(database_url):
+    service = AsyncUserService.from_url(database_url)
+
+    async def scenario():
+        await service.create_user('a@example.com', 'secret')
+        await service.create_user('a@example.com', 'other')
+
+    with pytest.raises(UserAlreadyExistsError):
+        run(service, scenario())
+
+
+def test_update_user_info_skips_generated_columns_and_clears_snapshots(make_app, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'async.db'}"
+    app = make_app(SESSION_BACKEND='memory', SQLALCHEMY_DATABASE_URI=uri)
+    store = app.extensions['session_store']
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret', full_name='Old')
+        store.save('sid', 'a@example.com', b'{}', b'{}', 2 ** 40)
+        service = AsyncUserService.from_url(uri)
+
+        user = run(service, service.update_user_info('a@example.com', full_name='New', email_norm='forged'))
+        info = db.session.get(UserInfo, user.id)
+        assert info.full_name == 'New'
+        assert info.email_norm != 'forged'
+        assert store.load('sid', 0)[1] is None
+        db.session.remove()
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from auth import AuditLog, AuditSink, UserAgent, UserService, db
+from auth.audit import decode_cursor, query_audit_logs
+
+
+def _entry(action, **values):
+    return dict({'actor_user_id': 1, 'action': action, 'target': None, 'ip': None, 'ua': None,
+                 'context': None}, **values)
+
+
+def _actions(sink):
+    return [row['action'] for row in sink._drain(100)]
+
+
+def test_overflow_policies():
+    sink = AuditSink(None, None, queue_size=1, overflow_policy='sync')
+    assert sink.submit(_entry('first'))
+    assert not sink.submit(_entry('second'))  # 交由调用方同步写入
+    assert sink.stats()['rejected'] == 1
+
+    sink = AuditSink(None, None, queue_size=1, overflow_policy='drop_new')
+    sink.submit(_entry('first'))
+    assert sink.submit(_entry('second'))
+    assert _actions(sink) == ['first'] and sink.stats()['dropped'] == 1
+
+    sink = AuditSink(None, None, queue_size=1, overflow_policy='drop_oldest')
+    sink.submit(_entry('first'))
+    assert sink.submit(_entry('second'))
+    assert _actions(sink) == ['second'] and sink.stats()['dropped'] == 1
+
+
+def test_flush_writes_multi_row_batches(make_app, tmp_path):
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/users.db')
+    with app.app_context():
+        id = UserService.register_user('a@example.com', 'secret').id
+        sink = AuditSink(db.engine, AuditLog.__table__, batch_size=2, ua_table=UserAgent.__table__)
+        for i in range(5):
+            sink.submit(_entry('batched', actor_user_id=id, ip='10.0.0.1', ua='pytest', context={'i': i}))
+        sink.flush()
+        stats = sink.stats()
+        assert (stats['written'], stats['batches'], stats['pending']) == (5, 3, 0)
+        logs = AuditLog.query.filter_by(action='batched').order_by(AuditLog.id).all()
+        assert [log.context['i'] for log in logs] == list(range(5))
+        assert {(log.ip, log.ua) for log in logs} == {('10.0.0.1', 'pytest')}
+
+
+def test_async_mode_writes_login_logs_in_background(make_app, tmp_path):
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/users.db', AUDIT_SINK_MODE='async',
+                   AUDIT_FLUSH_INTERVAL=0.05)
+    sink = app.extensions['audit_sink']
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+    response = app.test_client().post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'secret'},
+                                      headers={'User-Agent': 'pytest'})
+    assert response.get_json()['ok']
+    sink.close()
+    assert sink.stats()['written'] == 1
+    with app.app_context():
+        log = AuditLog.query.filter_by(action='login_success').one()
+        assert (log.ip, log.ua) == ('127.0.0.1', 'pytest')
+
+
+@pytest.fixture
+def logs(app):
+    """两个用户各 5 条日志，其中 3 条时间戳相同（验证 (created_at, id) 的并列排序）"""
+    ids = [UserService.register_user(f'{name}@example.com', 'secret').id for name in ('a', 'b')]
+    base = datetime(2024, 1, 1)
+    for i in range(5):
+        for id in ids:
+            db.session.add(AuditLog(actor_user_id=id, action='login_success' if i % 2 else 'login_failed',
+                                    ip_bin=bytes([10, 0, 0, i]), created_at=base + timedelta(minutes=max(i, 2))))
+    db.session.commit()
+    return ids
+
+
+def _collect(**filters):
+    seen, cursor = [], None
+    while True:
+        page, cursor = query_audit_logs(cursor=cursor, limit=3, **filters)
+        seen.extend(page)
+        if cursor is None:
+            return seen
+
+
+def test_keyset_pages_are_ordered_without_gaps(logs):
+    everything = _collect()
+    keys = [(log.created_at, log.id) for log in everything]
+    assert keys == sorted(keys, reverse=True)
+    assert len(set(keys)) == len(keys) == AuditLog.query.count()
+
+
+def test_filters(logs):
+    a, b = logs
+    assert {log.actor_user_id for log in _collect(actor_user_id=a)} == {a}
+    assert len(_collect(actor_user_id=b, action='login_success')) == 2
+    assert [log.ip for log in _collect(ip='10.0.0.4')] == ['10.0.0.4', '10.0.0.4']
+    since = datetime(2024, 1, 1, 0, 3)
+    assert all(log.created_at >= since for log in _collect(since=since))
+    assert len(_collect(since=since, until=datetime(2024, 1, 1, 0, 4))) == 2
+
+
+def test_invalid_query_arguments(logs):
+    with pytest.raises(ValueError):
+        query_audit_logs(ip='not-an-ip')
+    with pytest.raises(ValueError):
+        decode_cursor('garbage')
+
+
+def test_audit_log_api_pages_with_cursor(logs, client):
+    UserService.register_user('admin@example.com', 'secret', user_type='admin')
+    client.post('/auth/api/v1/login', json={'username': 'admin@example.com', 'password': 'secret'})
+    body = client.get('/auth/api/v1/admin/audit_logs?user=a@example.com&limit=4').get_json()
+    assert len(body['items']) == 4 and body['next_cursor']
+    rest = client.get(f"/auth/api/v1/admin/audit_logs?user=a@example.com&cursor={body['next_cursor']}").get_json()
+    ids = [item['id'] for item in body['items'] + rest['items']]
+    assert len(ids) == len(set(ids)) == len(_collect(actor_user_id=logs[0]))
+    assert client.get('/auth/api/v1/admin/audit_logs?cursor=bad').status_code == 400
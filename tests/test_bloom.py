@@ -0,0 +1,59 @@
+import logging
+
+from auth import BloomFilter, UserService
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter.for_capacity(1000, error_rate=0.01)
+    keys = [f'user{i}@example.com' for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    misses = sum(f'other{i}@example.com' in bloom for i in range(1000))
+    assert misses < 50
+    assert bloom.estimated_error_rate() < 0.02
+
+
+def test_filter_builds_lazily_after_schema(make_app, caplog):
+    with caplog.at_level(logging.WARNING, logger='auth.bloom'):
+        app = make_app()
+    assert not caplog.records
+    user_filter = app.extensions['user_filter']
+    assert not user_filter.ready
+    with app.app_context():
+        UserService.create_user('a@example.com', 'secret')
+        assert UserService.find_by_user_id('a@example.com') is not None
+        assert user_filter.ready
+        assert UserService.find_by_user_id('missing@example.com') is None
+
+
+def test_account_created_by_another_worker_is_not_rejected(make_app, tmp_path):
+    uri = f'sqlite:///{tmp_path}/users.db'
+    worker = make_app(SQLALCHEMY_DATABASE_URI=uri)
+    other = make_app(SQLALCHEMY_DATABASE_URI=uri)
+    with worker.app_context():
+        assert UserService.find_by_user_id('new@example.com') is None
+        assert worker.extensions['user_filter'].ready
+    with other.app_context():
+        UserService.create_user('new@example.com', 'secret')
+    with worker.app_context():
+        # 过滤器中没有该账号，回数据库读取表尾后找到
+        assert UserService.find_by_user_id('new@example.com') is not None
+
+
+def test_negatives_within_tail_interval_skip_database(make_app, tmp_path):
+    uri = f'sqlite:///{tmp_path}/users.db'
+    worker = make_app(SQLALCHEMY_DATABASE_URI=uri, USER_FILTER_TAIL_INTERVAL=60)
+    other = make_app(SQLALCHEMY_DATABASE_URI=uri)
+    user_filter = worker.extensions['user_filter']
+    with worker.app_context():
+        UserService.find_by_user_id('a@example.com')
+        assert not user_filter.might_exist('missing@example.com')
+    with other.app_context():
+        UserService.create_user('new@example.com', 'secret')
+    with worker.app_context():
+        # 间隔内采信否定结果，不读取数据库
+        assert not user_filter.might_exist('new@example.com')
+        assert not user_filter.tail_due
+        user_filter.refresh_tail(force=True)
+        assert user_filter.might_exist('new@example.com')
@@ -0,0 +1,59 @@
+import json
+
+from werkzeug.security import generate_password_hash
+
+from auth import UserService, db
+from auth.bulk_import import import_users
+
+HASH = generate_password_hash('secret')
+
+
+def _write_jsonl(path, lines):
+    path.write_text('\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines),
+                    encoding='utf-8')
+    return str(path)
+
+
+def test_invalid_rows_are_skipped_and_reported(app, tmp_path):
+    path = _write_jsonl(tmp_path / 'users.jsonl', [
+        {'user_id': 'a@example.com', 'password_hash': HASH, 'age': '30',
+         'extra_profile': '{"vehicle_type": "sedan"}'},
+        {'user_id': 'bad-age@example.com', 'password_hash': HASH, 'age': 'thirty'},
+        '{"user_id": "broken@example.com", ',
+        {'user_id': 'bad-profile@example.com', 'password_hash': HASH, 'extra_profile': '{not json'},
+        {'user_id': 'list-profile@example.com', 'password_hash': HASH, 'extra_profile': [1, 2]},
+        {'user_id': 'no-password@example.com'},
+        {'user_id': '13800138000', 'password': 'secret', 'full_name': '张伟'},
+    ])
+    errors_path = tmp_path / 'errors.jsonl'
+    stats = import_users(path, batch_size=2, workers=1, errors_path=str(errors_path))
+
+    assert (stats['processed'], stats['inserted'], stats['invalid']) == (7, 2, 5)
+    assert [(entry['record'], entry['user_id']) for entry in stats['errors']] == [
+        (2, 'bad-age@example.com'), (3, None), (4, 'bad-profile@example.com'),
+        (5, 'list-profile@example.com'), (6, 'no-password@example.com'),
+    ]
+    assert 'age' in stats['errors'][0]['error']
+    rejected = [json.loads(line) for line in errors_path.read_text(encoding='utf-8').splitlines()]
+    assert [entry['record'] for entry in rejected] == [2, 3, 4, 5, 6]
+    assert rejected[1]['data'] == '{"user_id": "broken@example.com",'
+
+    profile = UserService.get_profile('a@example.com')
+    assert profile.age == 30
+    assert UserService.find_by_profile_key('vehicle_type', 'sedan')[0].user_id == 'a@example.com'
+    assert UserService.authenticate('13800138000', 'secret') is not None
+    assert UserService.find_by_user_id('bad-age@example.com') is None
+
+
+def test_rerun_skips_existing_accounts(app, tmp_path):
+    path = tmp_path / 'users.csv'
+    path.write_text('user_id,password_hash,age\n'
+                    f'a@example.com,{HASH},\n'
+                    f'a@example.com,{HASH},\n'
+                    f'b@example.com,{HASH},x\n', encoding='utf-8')
+    stats = import_users(str(path), batch_size=1, workers=1)
+    assert (stats['inserted'], stats['existing'], stats['invalid']) == (1, 1, 1)
+    db.session.remove()
+
+    stats = import_users(str(path), batch_size=10, workers=1)
+    assert (stats['inserted'], stats['existing'], stats['invalid']) == (0, 1, 1)
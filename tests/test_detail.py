@@ -0,0 +1,53 @@
+from auth import UserInfo, UserProfile, UserService, db
+
+
+def test_detail_snapshot_single_query_with_consistent_times(app, client):
+    UserService.register_user('a@example.com', 'secret', full_name='Alice')
+    client.post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'wrong'})
+    client.post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'secret'})
+
+    response = client.get('/detail')
+    assert response.status_code == 200
+    assert response.headers['X-DB-Query-Count'] == '1'
+
+    snapshot = UserService.get_detail_snapshot('a@example.com')
+    assert snapshot['profile']['full_name'] == 'Alice'
+    stats = snapshot['login_stats']
+    assert stats['login_count'] == 1 and stats['failure_count'] == 1
+    for value in (snapshot['profile']['created_at'], stats['last_success_at'], stats['last_failure_at']):
+        assert value[10] == ' '
+
+
+def test_detail_snapshot_without_login_stats(app):
+    UserService.register_user('a@example.com', 'secret')
+    assert UserService.get_detail_snapshot('a@example.com')['login_stats'] is None
+    assert UserService.get_detail_snapshot('missing@example.com') is None
+
+
+def test_profile_projection_is_a_plain_row(app):
+    UserService.register_user('a@example.com', 'secret', full_name='Alice', age=30)
+    UserService.update_extra_profile('a@example.com', vehicle_type='sedan')
+    profile = UserService.get_profile('a@example.com')
+    assert isinstance(profile, UserProfile)
+    assert (profile.user_id, profile.full_name, profile.age) == ('a@example.com', 'Alice', 30)
+    assert profile.extra_profile == {'vehicle_type': 'sedan'}
+    assert UserService.get_profile('missing@example.com') is None
+
+
+def test_detail_page_renders_profile_and_stats(app, client):
+    UserService.register_user('a@example.com', 'secret', full_name='Alice', address='Main St')
+    UserService.update_extra_profile('a@example.com', license_number='DL1')
+    client.post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'secret'})
+    body = client.get('/detail').get_data(as_text=True)
+    for text in ('Alice', 'Main St', 'DL1', '127.0.0.1'):
+        assert text in body
+
+
+def test_detail_page_for_user_without_info_row(app, client):
+    id = UserService.create_user('bare@example.com', 'secret').id
+    UserInfo.query.filter_by(id=id).delete()
+    db.session.commit()
+    client.post('/auth/api/v1/login', json={'username': 'bare@example.com', 'password': 'secret'})
+    response = client.get('/detail')
+    assert response.status_code == 200
+    assert 'bare@example.com' in response.get_data(as_text=True)
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+
+from auth.hashing import HashingBusyError, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(mode='thread', max_workers=1, max_pending=0, timeout=0.05)
+    yield hasher
+    hasher.shutdown(wait=True)
+
+
+def _blocking(hasher, release):
+    """向工作池提交一个等待 release 的任务，返回其 future"""
+    return hasher._submit(release.wait, 5)
+
+
+def test_full_pool_rejects(hasher):
+    release = threading.Event()
+    _blocking(hasher, release)
+    with pytest.raises(HashingBusyError):
+        hasher.generate('secret')
+    assert hasher.rejected == 1
+    release.set()
+
+
+def test_timeout_maps_to_busy_and_keeps_slot_until_done(hasher):
+    release = threading.Event()
+    with pytest.raises(HashingBusyError):
+        hasher._execute(release.wait, 5)
+    # 超时后任务仍在执行，名额不能提前释放
+    with pytest.raises(HashingBusyError):
+        hasher.generate('secret')
+    release.set()
+    # 单线程工作池：排在其后的任务完成时，前一个任务的完成回调已执行
+    hasher.executor.submit(int).result()
+    hasher.timeout = None
+    assert hasher.verify(hasher.generate('secret'), 'secret')
+
+
+def test_async_timeout_maps_to_busy(hasher):
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(HashingBusyError):
+            await hasher._run_async('verify', release.wait, 5)
+
+    asyncio.run(run())
+    assert not hasher._slots.acquire(blocking=False)
+    release.set()
+
+
+def test_slot_released_after_completion(hasher):
+    hasher.timeout = None
+    for _ in range(3):
+        assert hasher.verify(hasher.generate('secret'), 'secret')
+
+
+def test_share_among_workers_splits_host_limits():
+    hasher = PasswordHasher(mode='thread', max_workers=8, max_pending=32)
+    hasher.share_among(8)
+    hasher.after_fork()
+    assert (hasher.max_workers, hasher.max_pending) == (1, 4)
+    assert hasher.executor._max_workers == 1
+    hasher.shutdown()
+
+    hasher = PasswordHasher(mode='thread', max_workers=2, max_pending=0)
+    hasher.share_among(4)
+    assert (hasher.max_workers, hasher.max_pending) == (1, 0)
+    hasher.shutdown()
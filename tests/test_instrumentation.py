@@ -0,0 +1,28 @@
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from auth import db
+from instrumentation import RequestQueryStats
+
+
+def test_slowest_and_repeated():
+    stats = RequestQueryStats(max_slowest=2)
+    for duration, sql in ((0.1, 'a'), (0.3, 'b'), (0.2, 'a'), (0.05, 'a')):
+        stats.record(sql, duration)
+    assert stats.count == 4
+    assert [sql for _, sql in stats.slowest] == ['b', 'a']
+    assert stats.repeated(3) == [(3, 'a')]
+
+
+def test_failed_statement_does_not_leak_start_time(app):
+    with app.test_request_context():
+        app.preprocess_request()
+        with pytest.raises(OperationalError):
+            db.session.execute(text('SELECT * FROM missing_table'))
+        db.session.rollback()
+        connection = db.session.connection()
+        assert '_query_started' not in connection.info
+        db.session.execute(text('SELECT 1'))
+        assert g._query_stats.count == 1
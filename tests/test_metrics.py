@@ -0,0 +1,53 @@
+import json
+import os
+
+from metrics import ARCHIVE_FILENAME, MetricsRegistry, MultiprocessStore, merge_snapshots
+
+DEAD_PID = 99999999
+
+
+def test_pool_gauges_for_every_engine(make_app, tmp_path):
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/main.db',
+                   SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{tmp_path}/replica.db'})
+    body = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'db_pool_connections{engine="default",stat="size"}' in body
+    assert 'db_pool_connections{engine="replica_0",stat="size"}' in body
+
+
+def _dead_snapshot(value):
+    return {'pid': DEAD_PID, 'meta': {'hits': ['counter', 'hits', None]},
+            'counters': [['hits', [], value]], 'histograms': [],
+            'gauges': [['workers', [], 1]]}
+
+
+def test_dead_worker_files_are_compacted(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter('hits', 'hits')
+    registry.inc('hits', value=5)
+    for i, value in enumerate((2, 3)):
+        with open(tmp_path / f'metrics_{DEAD_PID}_{i}.json', 'w', encoding='utf-8') as f:
+            json.dump(_dead_snapshot(value), f)
+
+    store = MultiprocessStore(str(tmp_path), registry)
+    store._path = os.path.join(str(tmp_path), f'metrics_{os.getpid()}_0.json')
+    _, counters, _, gauges = merge_snapshots(store.collect())
+    assert counters[('hits', ())] == 10
+    assert ('workers', ()) not in gauges
+    files = sorted(name for name in os.listdir(tmp_path) if name.endswith('.json'))
+    assert files == sorted([ARCHIVE_FILENAME, f'metrics_{os.getpid()}_0.json'])
+
+    # 再次采集不会重复计算归档中的计数
+    with open(tmp_path / f'metrics_{DEAD_PID}_2.json', 'w', encoding='utf-8') as f:
+        json.dump(_dead_snapshot(1), f)
+    _, counters, _, _ = merge_snapshots(store.collect())
+    assert counters[('hits', ())] == 11
+
+
+def test_audit_sink_totals_are_counters(make_app):
+    app = make_app(AUDIT_SINK_MODE='async')
+    body = app.test_client().get('/metrics').get_data(as_text=True)
+    assert '# TYPE audit_sink_entries_total counter' in body
+    assert 'audit_sink_entries_total{stat="queued"} 0' in body
+    assert 'audit_sink_entries_total{stat="pending"}' not in body
+    assert '# TYPE audit_sink_pending gauge' in body
+    app.extensions['audit_sink'].close()
@@ -0,0 +1,37 @@
+import gzip
+
+
+def test_index_sets_etag_and_returns_304(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    cached = client.get('/', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.data == b''
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    plain = client.get('/')
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+    # 未压缩版本的 ETag 不能命中压缩版本
+    stale = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']})
+    assert stale.status_code == 200
+
+
+def test_query_string_and_logged_in_bypass_cache(app, client):
+    client.get('/')
+    client.get('/?lang=en')
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'someone@example.com'
+    response = client.get('/')
+    assert 'ETag' not in response.headers
+    stats = app.extensions['page_cache'].stats()
+    assert stats['bypassed'] == 2
+    assert stats['misses'] == 1
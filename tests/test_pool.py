@@ -0,0 +1,60 @@
+import logging
+
+from sqlalchemy import text
+
+from auth import db
+
+
+def _file_app(make_app, tmp_path, **overrides):
+    return make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/main.db',
+                    SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{tmp_path}/replica.db'},
+                    **overrides)
+
+
+def _checkout(app, bind_key=None):
+    with app.app_context():
+        with db.engines[bind_key].connect() as conn:
+            conn.execute(text('SELECT 1'))
+
+
+def test_checkout_observers_are_per_engine(make_app, tmp_path):
+    apps = []
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        apps.append(_file_app(make_app, tmp_path / name))
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                # 慢取连接日志 + 取连接等待直方图，重复创建应用不会累积
+                assert len(engine.pool.checkout_observers) == 2
+
+
+def test_slow_checkout_log_names_engine(make_app, tmp_path, caplog):
+    app = _file_app(make_app, tmp_path, DB_POOL_SLOW_CHECKOUT_MS=0)
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='pool'):
+        _checkout(app, 'replica_0')
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages and all('引擎 replica_0' in message for message in messages)
+
+
+def test_observers_survive_dispose(make_app, tmp_path):
+    app = _file_app(make_app, tmp_path)
+    with app.app_context():
+        db.engine.dispose(close=False)
+    _checkout(app)
+    registry, _ = app.extensions['metrics']
+    counts = {dict(labels)['engine']: data[-1] for name, labels, data in registry.snapshot()['histograms']
+              if name == 'db_pool_checkout_wait_seconds'}
+    assert counts.get('default', 0) >= 1
+
+
+def test_pre_ping_and_warm_up_cover_every_engine(make_app, tmp_path):
+    app = _file_app(make_app, tmp_path, DB_POOL_PRE_PING='idle', DB_POOL_PRE_PING_IDLE=0, DB_POOL_WARMUP=2)
+    with app.app_context():
+        replica = db.engines['replica_0']
+        assert replica.pool.checkedin() == 2
+        with replica.connect() as conn:
+            record = conn.connection._connection_record
+        # 空闲检测在归还时记录时间
+        assert 'checked_in_at' in record.info
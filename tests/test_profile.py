@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import select
+
+from auth import UserInfo, UserService, db
+from auth.jsonfields import json_path
+
+
+@pytest.fixture
+def user(app):
+    return UserService.register_user('a@example.com', 'secret', email='  Alice@Example.COM ',
+                                     phone='+86 (138) 0013-8000', extra_profile={'keep': 1})
+
+
+def _row(id):
+    db.session.expire_all()
+    return db.session.get(UserInfo, id)
+
+
+def test_json_set_updates_only_given_keys(user):
+    UserService.update_extra_profile('a@example.com', license_number='DL1', vehicle_type='sedan',
+                                     tags=['night', 'airport'], verified=True, **{'a.b': 'x'})
+    info = _row(user.id)
+    assert info.extra_profile == {'keep': 1, 'license_number': 'DL1', 'vehicle_type': 'sedan',
+                                  'tags': ['night', 'airport'], 'verified': True, 'a.b': 'x'}
+    # 生成列随文档更新
+    assert (info.license_number, info.vehicle_type) == ('DL1', 'sedan')
+
+    UserService.update_extra_profile('a@example.com', vehicle_type='suv')
+    info = _row(user.id)
+    assert info.extra_profile['license_number'] == 'DL1' and info.vehicle_type == 'suv'
+
+
+def test_update_extra_profile_on_loaded_instance(user):
+    info = _row(user.id)
+    info.update_extra_profile(license_number='DL2')
+    assert info.extra_profile == {'keep': 1, 'license_number': 'DL2'}
+    db.session.commit()
+    assert _row(user.id).license_number == 'DL2'
+
+
+def test_update_extra_profile_without_info_row(app):
+    id = UserService.create_user('bare@example.com', 'secret').id
+    UserInfo.query.filter_by(id=id).delete()
+    db.session.commit()
+    UserService.update_extra_profile('bare@example.com', vehicle_type='van')
+    assert _row(id).extra_profile == {'vehicle_type': 'van'}
+    assert UserService.update_extra_profile('missing@example.com', vehicle_type='van') is None
+
+
+def test_find_by_indexed_profile_key(user):
+    UserService.update_extra_profile('a@example.com', license_number='DL1')
+    assert [profile.user_id for profile in UserService.find_by_profile_key('license_number', 'DL1')] == [
+        'a@example.com']
+    assert UserService.find_by_profile_key('license_number', 'DL9') == []
+    with pytest.raises(ValueError):
+        UserService.find_by_profile_key('keep', 1)
+
+
+def test_generated_email_and_phone_columns(user):
+    row = db.session.execute(
+        select(UserInfo.email_norm, UserInfo.phone_norm).where(UserInfo.id == user.id)).one()
+    assert tuple(row) == ('alice@example.com', '8613800138000')
+
+    UserService.update_user_info('a@example.com', email='B@Example.com', phone='139-0000', email_norm='ignored')
+    row = db.session.execute(
+        select(UserInfo.email_norm, UserInfo.phone_norm).where(UserInfo.id == user.id)).one()
+    assert tuple(row) == ('b@example.com', '1390000')
+
+
+def test_keys_with_quotes_are_rejected(user):
+    assert json_path('a.b') == '$."a.b"'
+    # SQLite 无法定位含双引号的键，JSON_SET 会静默忽略
+    with pytest.raises(ValueError):
+        UserService.update_extra_profile('a@example.com', **{'say "hi"': 1})
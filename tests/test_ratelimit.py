@@ -0,0 +1,108 @@
+import pytest
+
+from auth import AuditLog, UserService, db
+from auth.ratelimit import LoginRateLimiter, MemoryBackend, SQLiteBackend, sliding_window_estimate
+
+
+def test_sliding_window_weights_previous_window():
+    # 上一窗口 10 次，当前窗口过去四分之一：10 × 0.75 + 2
+    assert sliding_window_estimate(60, 10, 2, 135, 60) == (120, 2, 0, 1.5)
+    assert sliding_window_estimate(120, 10, 2, 135, 60)[3] == 9.5
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBackend(str(tmp_path / 'limits.db'))
+    return MemoryBackend()
+
+
+def test_account_limit_and_reset(backend):
+    limiter = LoginRateLimiter(backend, window=60, account_limit=3, ip_limit=0)
+    assert all(limiter.check('a', now=1000).allowed for _ in range(3))
+    decision = limiter.check('a', now=1001)
+    assert not decision.allowed and decision.scope == 'account'
+    assert decision.retry_after == 19  # 到当前窗口结束
+    limiter.reset_account('a')
+    assert limiter.check('a', now=1002).allowed
+
+
+def test_ip_rejection_does_not_consume_account_quota(backend):
+    limiter = LoginRateLimiter(backend, window=60, account_limit=2, ip_limit=1)
+    assert limiter.check('a', '10.0.0.1', now=1000).allowed
+    assert limiter.check('a', '10.0.0.1', now=1000).scope == 'ip'
+    assert limiter.check('a', '10.0.0.2', now=1000).allowed
+
+
+def test_memory_backend_prunes_expired_keys_incrementally():
+    backend = MemoryBackend()
+    for i in range(100):
+        backend.hit(f'k{i}', 10, 60, 1000)
+    backend.hit('fresh', 10, 60, 1200)
+    assert list(backend._counters) == ['fresh']
+
+
+def test_sqlite_backend_pruned_once_per_window(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'limits.db'))
+    limiter = LoginRateLimiter(backend, window=60, account_limit=10, ip_limit=0)
+    limiter.check('old', now=1000)
+    limiter.check('new', now=1200)
+    keys = [row[0] for row in backend._connect().execute('SELECT key FROM login_rate_limits')]
+    assert keys == ['account:new']
+
+
+def test_record_throttled_once_per_window():
+    limiter = LoginRateLimiter(MemoryBackend(), window=60)
+    assert limiter.record_throttled('account', 'a', now=1000) == 1
+    assert limiter.record_throttled('account', 'a', now=1010) is None
+    assert limiter.record_throttled('ip', 'a', now=1015) == 1  # 不同维度分别汇总
+    assert limiter.record_throttled('account', 'a', now=1020) is None
+    assert limiter.record_throttled('account', 'a', now=1061) == 3
+    # 一个窗口后不再被拒绝的键被清理
+    limiter.record_throttled('account', 'b', now=1300)
+    assert list(limiter._throttled) == ['account:b']
+
+
+def test_login_ignores_forwarded_for(client):
+    limiter = client.application.extensions['login_rate_limiter']
+    limiter.ip_limit = 1
+    payload = {'username': 'nobody@example.com', 'password': 'x'}
+    client.post('/auth/api/v1/login', json=payload, headers={'X-Forwarded-For': '1.1.1.1'})
+    response = client.post('/auth/api/v1/login', json=payload, headers={'X-Forwarded-For': '2.2.2.2'})
+    assert response.status_code == 429
+
+
+def _throttled_logs():
+    return [(log.actor_user_id, log.ip, log.context) for log in
+            AuditLog.query.filter_by(action='login_throttled').order_by(AuditLog.id)]
+
+
+def test_ip_throttling_aggregates_by_ip_without_account_lookup(client, monkeypatch):
+    limiter = client.application.extensions['login_rate_limiter']
+    limiter.ip_limit = 1
+    accounts = [f'user{i}@example.com' for i in range(4)]
+    for account in accounts:
+        UserService.register_user(account, 'secret')
+    client.post('/auth/api/v1/login', json={'username': accounts[0], 'password': 'x'})
+
+    def lookup(user_id):
+        raise AssertionError('按 IP 限流时不应查询账号')
+    monkeypatch.setattr(UserService, 'lookup_by_user_id', lookup)
+    # 同一 IP 轮换账号：整个窗口只记一条，不按账号拆分
+    for account in accounts:
+        response = client.post('/auth/api/v1/login', json={'username': account, 'password': 'x'})
+        assert response.status_code == 429
+    db.session.remove()
+    assert _throttled_logs() == [(None, '127.0.0.1', {'scope': 'ip', 'count': 1})]
+
+
+def test_account_throttling_is_recorded_for_the_account(client):
+    limiter = client.application.extensions['login_rate_limiter']
+    limiter.account_limit = 1
+    id = UserService.register_user('a@example.com', 'secret').id
+    payload = {'username': 'a@example.com', 'password': 'x'}
+    client.post('/auth/api/v1/login', json=payload)
+    for _ in range(3):
+        assert client.post('/auth/api/v1/login', json=payload).status_code == 429
+    db.session.remove()
+    assert _throttled_logs() == [(id, '127.0.0.1', {'scope': 'account', 'count': 1})]
@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from auth import AuditLog, User, UserAlreadyExistsError, UserInfo, UserService, db
+
+
+def test_register_commits_once_with_info_and_audit_log(app):
+    commits = []
+    event.listen(db.session(), 'after_commit', commits.append)
+    user = UserService.register_user('a@example.com', 'secret', full_name='Alice', not_a_field='x')
+    assert len(commits) == 1
+    assert user.login_type == 'email'
+    assert db.session.get(UserInfo, user.id).full_name == 'Alice'
+    assert [log.action for log in AuditLog.query.filter_by(actor_user_id=user.id)] == ['user_created']
+
+
+def test_duplicate_account_raises_already_exists(app):
+    UserService.register_user('13800000000', 'secret')
+    with pytest.raises(UserAlreadyExistsError):
+        UserService.register_user('13800000000', 'other')
+    assert User.query.count() == 1
+
+
+def test_other_constraint_violations_are_not_reported_as_duplicates(app, monkeypatch):
+    def create_user(**kwargs):
+        raise IntegrityError('INSERT', {}, Exception('FOREIGN KEY constraint failed'))
+
+    monkeypatch.setattr(UserService, 'create_user', create_user)
+    with pytest.raises(IntegrityError):
+        UserService.register_user('a@example.com', 'secret')
@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import OperationalError
+
+from auth import ReplicaRouter, User, UserService, db
+from auth.replicas import run_read
+
+
+def _engines(tmp_path, count=2):
+    return [create_engine(f'sqlite:///{tmp_path}/replica{i}.db') for i in range(count)]
+
+
+def test_round_robin_cycles_through_replicas(tmp_path):
+    engines = _engines(tmp_path)
+    router = ReplicaRouter(engines)
+    assert [router.choose() for _ in range(4)] == engines * 2
+
+
+def test_least_loaded_prefers_idle_replica(tmp_path):
+    engines = _engines(tmp_path)
+    router = ReplicaRouter(engines, strategy='least_loaded')
+    with engines[0].connect():
+        assert router.choose() is engines[1]
+        with engines[1].connect(), engines[1].connect():
+            assert router.choose() is engines[0]
+
+
+def test_unknown_strategy_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ReplicaRouter(_engines(tmp_path), strategy='random')
+
+
+@pytest.fixture
+def replica_app(make_app, tmp_path):
+    """主库与一个副本（两个 SQLite 文件，副本有表但不同步数据）"""
+    def make(**overrides):
+        app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/main.db',
+                       SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{tmp_path}/replica.db'},
+                       USER_CACHE_ENABLED=False, **overrides)
+        with app.app_context():
+            db.metadatas[None].create_all(db.engines['replica_0'])
+        return app
+    return make
+
+
+def test_reads_stay_on_primary_after_write(replica_app):
+    app = replica_app(DB_READ_YOUR_WRITES_SECONDS=60)
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+        # 副本上没有该账号：写入后粘滞窗口内读主库
+        assert UserService.get_profile('a@example.com') is not None
+        app.extensions['replica_router']._pinned.clear()
+        assert UserService.get_profile('a@example.com') is None
+
+
+def test_pinning_expires(replica_app):
+    app = replica_app(DB_READ_YOUR_WRITES_SECONDS=0)
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+        assert UserService.get_profile('a@example.com') is None
+
+
+def test_replica_failure_falls_back_to_primary(replica_app):
+    app = replica_app(DB_READ_YOUR_WRITES_SECONDS=0)
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(text('DROP TABLE users_info'))
+        assert UserService.get_profile('a@example.com') is not None
+
+
+def test_primary_failure_is_not_retried(replica_app):
+    app = replica_app(DB_READ_YOUR_WRITES_SECONDS=60)
+    calls = []
+
+    def query(session):
+        calls.append(session)
+        return session.execute(select(text('missing_column')).select_from(User)).first()
+
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+        with pytest.raises(OperationalError):
+            run_read(query, 'a@example.com')
+    assert len(calls) == 1
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from auth import AuditLog, UserService, db
+from auth.retention import archive_old_logs, export_month, iter_archived_logs, list_partitions
+
+
+def _log(user, created_at, action='login_success'):
+    db.session.add(AuditLog(actor_user_id=user.id, action=action, created_at=created_at))
+
+
+def test_export_month_include_older(app, tmp_path):
+    user = UserService.create_user('a@example.com', 'secret')
+    _log(user, datetime(2020, 1, 15))
+    _log(user, datetime(2020, 3, 2))
+    db.session.commit()
+    assert export_month(datetime(2020, 3, 1), str(tmp_path))[1] == 1
+    assert export_month(datetime(2020, 3, 1), str(tmp_path), include_older=True)[1] == 2
+
+
+def test_archive_old_logs_exports_then_deletes(app, tmp_path):
+    user = UserService.create_user('a@example.com', 'secret')
+    for day in (1, 20):
+        _log(user, datetime(2020, 1, day))
+    _log(user, datetime(2020, 2, 3), action='logout')
+    db.session.commit()
+
+    archived = archive_old_logs(30, str(tmp_path))
+    assert [(name, count) for name, _, count in archived][:2] == [('p202001', 2), ('p202002', 1)]
+    assert not AuditLog.query.filter(AuditLog.created_at < datetime(2020, 3, 1)).count()
+    assert list_partitions()[0][0] != 'p202001'
+
+    logs = list(iter_archived_logs(str(tmp_path), until=datetime(2020, 1, 10)))
+    assert [log['created_at'] for log in logs] == ['2020-01-01T00:00:00']
+    assert [log['action'] for log in iter_archived_logs(str(tmp_path), action='logout')] == ['logout']
@@ -0,0 +1,78 @@
+import pytest
+
+from auth import UserService, search_users
+from auth.search import guess_field, use_name_prefix
+
+
+@pytest.fixture
+def users(app):
+    UserService.register_user('alice@example.com', 'secret', full_name='Alice Smith', display_name='ally',
+                              email='Alice@Example.com', phone='138-0013-8000')
+    UserService.register_user('bob@example.com', 'secret', full_name='Bob Stone', email='bob@example.com',
+                              phone='13900139000', user_type='driver')
+    UserService.register_user('13700137000', 'secret', full_name='张伟', display_name='阿伟')
+    UserService.register_user('13700137001', 'secret', full_name='张小明')
+    UserService.register_user('13700137002', 'secret', full_name='欧阳娜娜')
+
+
+def _accounts(results):
+    return [item['user_id'] for item in results]
+
+
+def test_guess_field():
+    assert guess_field('alice@') == 'email'
+    assert guess_field('138-0013') == 'phone'
+    assert guess_field('张伟') == 'name'
+
+
+def test_name_prefix_for_cjk_and_short_terms():
+    assert use_name_prefix('张伟')
+    assert use_name_prefix('li wei')
+    assert not use_name_prefix('alice smith')
+    assert not use_name_prefix('li', min_token_size=2)
+
+
+def test_email_and_phone_prefix(users):
+    assert _accounts(search_users('ALICE@example')[0]) == ['alice@example.com']
+    # 手机号忽略分隔符
+    assert _accounts(search_users('138 0013')[0]) == ['alice@example.com']
+    assert _accounts(search_users('139', field='phone')[0]) == ['bob@example.com']
+
+
+def test_fulltext_name_search(users):
+    assert _accounts(search_users('smi', field='name')[0]) == ['alice@example.com']
+    assert _accounts(search_users('ally')[0]) == ['alice@example.com']
+    assert _accounts(search_users('stone bob')[0]) == ['bob@example.com']
+
+
+def test_cjk_and_short_names_use_prefix(users):
+    assert _accounts(search_users('张')[0]) == ['13700137000', '13700137001']
+    assert _accounts(search_users('张伟')[0]) == ['13700137000']
+    assert _accounts(search_users('欧阳')[0]) == ['13700137002']
+    assert _accounts(search_users('Bo', field='name')[0]) == ['bob@example.com']
+    # 前缀匹配只匹配姓名开头
+    assert search_users('娜娜')[0] == []
+
+
+def test_filters_and_keyset_pages(users):
+    assert _accounts(search_users(user_type='driver')[0]) == ['bob@example.com']
+    seen, cursor = [], None
+    while True:
+        page, cursor = search_users(cursor=cursor, limit=2)
+        seen.extend(_accounts(page))
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+    # 前缀匹配按 (规范化值, id) 翻页
+    page, cursor = search_users('13', field='phone', limit=1)
+    assert _accounts(page) == ['alice@example.com']
+    page, cursor = search_users('13', field='phone', cursor=cursor, limit=1)
+    assert _accounts(page) == ['bob@example.com'] and cursor is None
+
+
+def test_invalid_arguments(app):
+    with pytest.raises(ValueError):
+        search_users('x', field='address')
+    with pytest.raises(ValueError):
+        search_users(cursor='not-a-cursor')
@@ -0,0 +1,68 @@
+import pytest
+from flask import session
+
+from auth import UserService
+from auth.sessions import MemorySessionStore, SessionStore, SQLiteSessionStore, revoke_user_sessions
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+
+
+def test_update_only_existing_sessions(store):
+    store.save('sid', 'a@example.com', '{}', None, 2 ** 40)
+    assert store.update('sid', 'a@example.com', '{"x":1}', None, 2 ** 40)
+    assert store.load('sid', 0)[0] == '{"x":1}'
+
+    store.revoke_user('a@example.com')
+    assert not store.update('sid', 'a@example.com', '{"x":2}', None, 2 ** 40)
+    assert store.load('sid', 0) is None
+    assert store.revoke_user('a@example.com') == 0
+
+
+def test_session_revoked_during_request_is_not_saved_again(make_app):
+    app = make_app(SESSION_BACKEND='memory')
+
+    @app.route('/test/revoke-during-request')
+    def revoke_during_request():
+        session['seen'] = True
+        revoke_user_sessions(session['user_id'])
+        return 'ok'
+
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+    client = app.test_client()
+    response = client.post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'secret'})
+    assert response.get_json()['ok']
+
+    response = client.get('/test/revoke-during-request')
+    assert 'session=;' in response.headers['Set-Cookie']
+    store = app.extensions['session_store']
+    assert store.revoke_user('a@example.com') == 0
+
+
+def test_store_must_implement_interface():
+    class PartialStore(SessionStore):
+        def load(self, sid, now):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_login_clears_cached_login_stats(make_app):
+    app = make_app(SESSION_BACKEND='memory')
+    with app.app_context():
+        UserService.register_user('a@example.com', 'secret')
+    first, second = app.test_client(), app.test_client()
+    login = {'username': 'a@example.com', 'password': 'secret'}
+    assert first.post('/auth/api/v1/login', json=login).get_json()['ok']
+    first.get('/detail')
+    assert first.get('/detail').headers['X-DB-Query-Count'] == '0'
+
+    # 另一个客户端登录（失败同样更新统计）后，第一个会话的快照被清空，重新查询
+    second.post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'wrong'})
+    assert first.get('/detail').headers['X-DB-Query-Count'] == '1'
@@ -0,0 +1,142 @@
+import pytest
+from sqlalchemy import func, select
+
+from auth import AuditLog, User, UserInfo, UserLoginStats, UserService, db, resharding
+from auth.resharding import reshard
+from auth.sharding import SHARD_ID_SPAN, ShardRouter, create_shard_tables, is_home_id
+
+
+def router(count):
+    return ShardRouter([(f'shard_{i}', None) for i in range(count)])
+
+
+def test_rendezvous_moves_only_keys_to_new_shard():
+    keys = [f'user{i}@example.com' for i in range(3000)]
+    before = {key: router(3).home(key) for key in keys}
+    after = {key: router(4).home(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == 'shard_3' for key in moved)
+    # 约 1/4 的账号迁移到新分片
+    assert 0.2 < len(moved) / len(keys) < 0.3
+
+
+def test_id_ranges():
+    r = router(2)
+    assert r.shard_of_id(1) == 'shard_0'
+    assert r.shard_of_id(SHARD_ID_SPAN) == 'shard_0'
+    assert r.shard_of_id(SHARD_ID_SPAN + 1) == 'shard_1'
+    with pytest.raises(ValueError):
+        r.shard_of_id(2 * SHARD_ID_SPAN + 1)
+
+
+@pytest.fixture
+def shard_app(make_app, tmp_path):
+    uris = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(2)]
+
+    def make(count, **overrides):
+        binds = {f'shard_{i}': uri for i, uri in enumerate(uris[:count])}
+        app = make_app(SQLALCHEMY_DATABASE_URI=uris[0], SQLALCHEMY_BINDS=binds, SESSION_BACKEND='sqlite',
+                       SESSION_PATH=str(tmp_path / 'sessions.db'), **overrides)
+        with app.app_context():
+            create_shard_tables()
+        return app
+    return make
+
+
+def test_reshard_revokes_sessions_of_moved_users(shard_app):
+    accounts = [f'user{i}@example.com' for i in range(8)]
+    moved = {account for account in accounts if router(2).home(account) == 'shard_1'}
+    mover = sorted(moved)[0]
+    stayer = sorted(set(accounts) - moved)[0]
+
+    app = shard_app(1)
+    with app.app_context():
+        for account in accounts:
+            UserService.register_user(account, 'secret')
+    for account in (mover, stayer):
+        app.test_client().post('/auth/api/v1/login', json={'username': account, 'password': 'secret'})
+
+    app = shard_app(2)
+    with app.app_context():
+        stats = reshard(batch_size=3)
+        assert stats['moved'] == len(moved)
+        for account in accounts:
+            user = UserService.lookup_by_user_id(account)
+            assert is_home_id(account, user.id)
+            assert (user.id > SHARD_ID_SPAN) == (account in moved)
+        store = app.extensions['session_store']
+        assert store.revoke_user(mover) == 0
+        assert store.revoke_user(stayer) == 1
+        db.session.remove()
+
+
+def _rows(engine, table, column, ids):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table).where(column.in_(ids))).scalar()
+
+
+def test_interrupted_reshard_resumes_and_remaps_ids(shard_app, monkeypatch):
+    accounts = [f'user{i}@example.com' for i in range(8)]
+    moved = sorted(account for account in accounts if router(2).home(account) == 'shard_1')
+
+    app = shard_app(1)
+    with app.app_context():
+        for account in accounts:
+            UserService.register_user(account, 'secret', full_name=account, phone='+8613800000000')
+            UserService.authenticate(account, 'secret', ip='10.0.0.1', ua='pytest')
+        old_ids = {account: UserService.find_by_user_id(account).id for account in moved}
+        db.session.remove()
+
+    # 追加分片后未开启回退：尚未迁移的账号在应在的分片上查不到
+    with shard_app(2).app_context():
+        assert UserService.find_by_user_id(moved[0]) is None
+        db.session.remove()
+
+    app = shard_app(2, SHARD_LOOKUP_FALLBACK=True)
+    with app.app_context():
+        assert UserService.find_by_user_id(moved[0]).id == old_ids[moved[0]]
+
+        # 目标分片提交后、源分片删除前中断
+        def interrupted(source, ids):
+            raise RuntimeError('interrupted')
+        monkeypatch.setattr(resharding, '_delete_users', interrupted)
+        with pytest.raises(RuntimeError):
+            reshard(batch_size=3)
+        monkeypatch.undo()
+
+        stats = reshard(batch_size=3)
+        engines = app.extensions['shard_router'].engines
+        source, target = engines['shard_0'], engines['shard_1']
+        for account in accounts:
+            user = UserService.find_by_user_id(account)
+            assert is_home_id(account, user.id)
+        new_ids = {account: UserService.find_by_user_id(account).id for account in moved}
+        db.session.remove()
+
+    assert stats['moved'] < len(moved)  # 中断前已复制的账号不再复制
+    assert all(new_ids[account] > SHARD_ID_SPAN for account in moved)
+    old, new = list(old_ids.values()), list(new_ids.values())
+    # 源分片不留残留，资料、统计与审计日志随新 id 迁移且不重复
+    for table, column in ((User, User.id), (UserInfo, UserInfo.id), (UserLoginStats, UserLoginStats.id),
+                          (AuditLog, AuditLog.actor_user_id)):
+        assert _rows(source, table.__table__, column, old) == 0
+    assert _rows(target, User.__table__, User.id, new) == len(moved)
+    assert _rows(target, UserInfo.__table__, UserInfo.id, new) == len(moved)
+    assert _rows(target, UserLoginStats.__table__, UserLoginStats.id, new) == len(moved)
+    with target.connect() as conn:
+        logs = conn.execute(
+            select(AuditLog.actor_user_id, AuditLog.action).where(AuditLog.actor_user_id.in_(new))
+        ).all()
+    assert sorted(action for _, action in logs) == sorted(['user_created', 'login_success'] * len(moved))
+    with app.app_context():
+        profile = UserService.get_detail_snapshot(moved[0])
+        assert profile['profile']['full_name'] == moved[0]
+        assert profile['login_stats']['login_count'] == 1
+        assert profile['login_stats']['last_success_ip'] == '10.0.0.1'
+        db.session.remove()
+
+
+def test_shards_with_replicas_rejected(make_app, tmp_path):
+    with pytest.raises(ValueError):
+        make_app(SQLALCHEMY_BINDS={'shard_0': f"sqlite:///{tmp_path / 'shard0.db'}",
+                                   'replica_0': f"sqlite:///{tmp_path / 'replica.db'}"})
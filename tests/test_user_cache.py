@@ -0,0 +1,73 @@
+import time
+
+from sqlalchemy import update
+from werkzeug.security import generate_password_hash
+
+from auth import User, UserCache, UserService, db
+from auth.cache import UserSnapshot
+
+
+def snapshot(id=1, user_id='a@example.com', status='active'):
+    return UserSnapshot(id, user_id, 'email', 'hash', 'passenger', status, None, None, None)
+
+
+def test_put_and_get_by_both_keys():
+    cache = UserCache()
+    cache.put(snapshot(), cache.generation)
+    assert cache.get_by_user_id('a@example.com') == (True, snapshot())
+    assert cache.get_by_id(1) == (True, snapshot())
+
+
+def test_invalidate_removes_both_keys_and_rejects_stale_put():
+    cache = UserCache()
+    generation = cache.generation
+    cache.put(snapshot(), generation)
+    cache.invalidate(user_id='a@example.com')
+    assert cache.get_by_id(1) == (False, None)
+    # 失效前开始的读库结果不能写回
+    cache.put(snapshot(status='disabled'), generation)
+    assert cache.get_by_user_id('a@example.com') == (False, None)
+
+
+def test_ttl_and_lru_eviction():
+    cache = UserCache(maxsize=2, ttl=0.01, negative_ttl=60)
+    cache.put_missing(cache.generation, user_id='missing')
+    cache.put(snapshot(), cache.generation)
+    assert cache.stats()['evictions'] == 1
+    time.sleep(0.02)
+    assert cache.get_by_user_id('a@example.com') == (False, None)
+    assert cache.stats()['expirations'] == 1
+
+
+def test_commit_invalidates_cached_snapshot(app):
+    UserService.create_user('a@example.com', 'secret')
+    assert UserService.lookup_by_user_id('a@example.com').status == 'active'
+    UserService.set_status('a@example.com', 'disabled')
+    assert UserService.lookup_by_user_id('a@example.com').status == 'disabled'
+
+
+def _change_elsewhere(user_id, **values):
+    """模拟其他 worker 或 init_db.py 的修改：不经过本进程的缓存失效"""
+    db.session.execute(update(User).where(User.user_id == user_id).values(**values))
+    db.session.commit()
+
+
+def test_authenticate_ignores_stale_cache(app):
+    UserService.create_user('a@example.com', 'old-password')
+    assert UserService.lookup_by_user_id('a@example.com') is not None
+
+    _change_elsewhere('a@example.com', password_hash=generate_password_hash('new-password'))
+    assert UserService.authenticate('a@example.com', 'old-password') is None
+    assert UserService.authenticate('a@example.com', 'new-password') is not None
+
+    _change_elsewhere('a@example.com', status='disabled')
+    assert UserService.authenticate('a@example.com', 'new-password') is None
+    # 认证读到的最新状态同时刷新了本进程缓存
+    assert UserService.lookup_by_user_id('a@example.com').status == 'disabled'
+
+
+def test_authenticate_ignores_negative_cache(app):
+    assert UserService.lookup_by_user_id('new@example.com') is None
+    db.session.add(User(user_id='new@example.com', password_hash=generate_password_hash('secret')))
+    db.session.commit()
+    assert UserService.authenticate('new@example.com', 'secret') is not None
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from auth import AuditLog, UserAgent, UserService, db
+from auth.audit import backfill_audit_log_encoding
+from auth.useragents import ip_from_bytes, ip_to_bytes
+
+
+def test_ip_encoding():
+    assert ip_to_bytes('10.0.0.1') == bytes([10, 0, 0, 1])
+    assert len(ip_to_bytes('2001:db8::1')) == 16
+    assert ip_to_bytes('203.0.113.7, 10.0.0.1') == bytes([203, 0, 113, 7])  # 取第一个地址
+    assert ip_to_bytes('not-an-ip') is None and ip_to_bytes(None) is None
+    for ip in ('10.0.0.1', '2001:db8::1'):
+        assert ip_from_bytes(ip_to_bytes(ip)) == ip
+
+
+def test_user_agents_are_deduplicated_and_cached(app):
+    id = UserService.register_user('a@example.com', 'secret').id
+    cache = app.extensions['user_agent_cache']
+    for _ in range(3):
+        AuditLog.log_action(id, 'login_success', ip='::1', ua='Mozilla/5.0')
+        db.session.commit()
+    assert UserAgent.query.count() == 1
+    assert cache.stats()['hits'] == 2
+    logs = AuditLog.query.filter_by(action='login_success').all()
+    assert {(log.ip, log.ua) for log in logs} == {('::1', 'Mozilla/5.0')}
+
+
+def test_rolled_back_user_agent_is_not_cached(app):
+    id = UserService.register_user('a@example.com', 'secret').id
+    AuditLog.log_action(id, 'login_success', ua='curl/8.0')
+    db.session.rollback()
+    assert app.extensions['user_agent_cache'].stats()['size'] == 0
+    AuditLog.log_action(id, 'login_success', ua='curl/8.0')
+    db.session.commit()
+    assert AuditLog.query.filter_by(action='login_success').one().ua == 'curl/8.0'
+
+
+@pytest.fixture
+def legacy_app(make_app, tmp_path):
+    """带旧版 ip/ua 字符串列的 audit_logs"""
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/users.db')
+    with app.app_context():
+        id = UserService.register_user('a@example.com', 'secret').id
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE audit_logs ADD COLUMN ip VARCHAR(45)'))
+            conn.execute(text('ALTER TABLE audit_logs ADD COLUMN ua TEXT'))
+            conn.execute(
+                text('INSERT INTO audit_logs (actor_user_id, action, ip, ua, created_at) '
+                     'VALUES (:id, :action, :ip, :ua, :created_at)'),
+                [{'id': id, 'action': f'legacy{i}', 'ip': ip, 'ua': ua, 'created_at': datetime(2024, 1, 1)}
+                 for i, (ip, ua) in enumerate([('10.0.0.1', 'UA-1'), ('2001:db8::1', 'UA-2'),
+                                               ('10.0.0.2', 'UA-1'), (None, 'UA-3'), ('10.0.0.3', None)])])
+    return app
+
+
+def test_backfill_converts_legacy_columns_in_batches(legacy_app):
+    progress = []
+    with legacy_app.app_context():
+        assert backfill_audit_log_encoding(batch_size=2, progress=lambda total, _: progress.append(total)) == 5
+        assert progress == [2, 4, 5]
+        logs = AuditLog.query.filter(AuditLog.action.like('legacy%')).order_by(AuditLog.id).all()
+        assert [(log.ip, log.ua) for log in logs] == [
+            ('10.0.0.1', 'UA-1'), ('2001:db8::1', 'UA-2'), ('10.0.0.2', 'UA-1'), (None, 'UA-3'), ('10.0.0.3', None)]
+        assert UserAgent.query.count() == 3
+        # 可重复执行：已转换的行不再处理
+        assert backfill_audit_log_encoding(batch_size=2) == 0
+
+
+def test_backfill_without_legacy_columns_is_noop(app):
+    assert backfill_audit_log_encoding() == 0
@@ -0,0 +1,10 @@
+from auth import UserService
+
+
+def test_login_and_logout_redirect_to_index(app, client):
+    UserService.register_user('a@example.com', 'secret')
+    response = client.post('/auth/api/v1/login', json={'username': 'a@example.com', 'password': 'secret'})
+    assert response.get_json() == {'ok': True, 'redirect': '/'}
+    response = client.post('/auth/api/v1/logout')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/'